@@ -1,5 +1,6 @@
 import streamlit as st
 import database_gsheets as database
+import profiler
 import pandas as pd
 from datetime import datetime
 import time
@@ -7,6 +8,14 @@ import time
 # Page Config
 st.set_page_config(page_title="WLog", page_icon="🏋️", layout="wide")
 
+# Multi-tenant mode: each signed-in user works in a spreadsheet of their own
+if database.TENANTS:
+    if not st.user.is_logged_in:
+        st.title("WLog 🏋️")
+        st.button("Log in", on_click=st.login)
+        st.stop()
+    database.set_tenant(st.user.email)
+
 # Initialize DB
 database.init_db()
 
@@ -18,10 +27,28 @@ if 'current_session_name' not in st.session_state:
 if 'session_start_time' not in st.session_state:
     st.session_state.session_start_time = None
 
+# Tables each page reads, fetched together before the page renders
+PAGE_TABLES = {
+    "Dashboard": ["workouts", "log_entries", "exercises"],
+    "Log Workout": ["sessions", "session_items", "exercises", "log_entries", "workouts"],
+    "Routines": ["sessions", "session_items", "exercises"],
+    "Exercise Library": ["exercises"],
+    "History": ["workouts", "log_entries", "exercises"],
+}
+
 def main():
     st.sidebar.title("WLog 🏋️")
     menu = ["Dashboard", "Log Workout", "Routines", "Exercise Library", "History"]
-    choice = st.sidebar.radio("Navigate", menu)
+    choice = st.sidebar.radio("Navigate", menu, key="nav")
+    if database.TENANTS:
+        st.sidebar.caption(st.user.email)
+        st.sidebar.button("Log out", on_click=st.logout)
+
+    sync = database.sync_status()
+    if sync and (sync['pending_rows'] or sync['pending_tables']):
+        st.sidebar.caption(f"🔄 {sync['pending_rows'] + len(sync['pending_tables'])} change(s) waiting to sync")
+
+    database.prefetch(PAGE_TABLES[choice])
 
     if choice == "Dashboard":
         show_dashboard()
@@ -47,6 +74,19 @@ def show_dashboard():
         with col2:
             st.metric(label="Last Workout Volume", value=f"{last_wo['volume']:,.0f} kg")
             st.caption(f"Date: {last_wo['date']}")
+    
+    st.subheader("Training Volume")
+    bucket = st.radio("Group by", ["day", "week", "month"], index=1, horizontal=True, format_func=str.title)
+    volume = database.volume_chart(bucket)
+    if volume.empty:
+        st.info("Log a workout to see your volume over time.")
+        return
+    st.line_chart(volume, x="date", y="volume")
+    
+    trend = database.muscle_chart(bucket)
+    if not trend.empty:
+        st.subheader("Volume by Muscle")
+        st.line_chart(trend, x="date", y="volume", color="muscle")
 
 def show_routines():
     st.title("Custom Routines")
@@ -73,7 +113,7 @@ def show_routines():
         # Fetch current routine data to prepopulate
         s_id = st.session_state.edit_routine_id
         sessions = database.get_all_sessions()
-        target_session = next((s for s in sessions if s['id'] == s_id), None)
+        target_session = next((s for s in sessions if s.id == s_id), None)
         
         if not target_session:
             st.error("Routine not found.")
@@ -83,14 +123,14 @@ def show_routines():
             return
 
         # Edit Form
-        new_name = st.text_input("Routine Name", value=target_session['name'])
+        new_name = st.text_input("Routine Name", value=target_session.name)
         
         # Pre-select existing exercises
         current_details = database.get_session_details(s_id)
-        current_ex_ids = [d['id'] for d in current_details]
+        current_ex_ids = [d.id for d in current_details]
         
         all_ex = database.get_all_exercises()
-        options = {f"{e['muscle']} - {e['name']}": e['id'] for e in all_ex}
+        options = {f"{e.muscle} - {e.name}": e.id for e in all_ex}
         sorted_opts = sorted(options.keys())
         
         # Map IDs back to Option Strings for default value
@@ -123,7 +163,7 @@ def show_routines():
             r_name = st.text_input("Routine Name (e.g., Upper Body)")
             
             all_ex = database.get_all_exercises()
-            options = {f"{e['muscle']} - {e['name']}": e['id'] for e in all_ex}
+            options = {f"{e.muscle} - {e.name}": e.id for e in all_ex}
             sorted_opts = sorted(options.keys())
             
             selected_ex = st.multiselect("Select Exercises", sorted_opts)
@@ -147,45 +187,81 @@ def show_routines():
         for s in sessions:
             c1, c2, c3 = st.columns([6, 1, 1])
             with c1:
-                with st.expander(s['name']):
-                    details = database.get_session_details(s['id'])
+                with st.expander(s.name):
+                    details = database.get_session_details(s.id)
                     for d in details:
-                        st.text(f"• {d['name']} ({d['muscle']})")
+                        st.text(f"• {d.name} ({d.muscle})")
             
             # Edit Button
             with c2:
-                if st.button("✏️", key=f"edit_sess_{s['id']}", help="Edit Routine"):
-                    st.session_state.edit_routine_id = s['id']
+                if st.button("✏️", key=f"edit_sess_{s.id}", help="Edit Routine"):
+                    st.session_state.edit_routine_id = s.id
                     st.rerun()
             
             # Delete Button
             with c3:
-                confirm_key = f"confirm_del_sess_{s['id']}"
+                confirm_key = f"confirm_del_sess_{s.id}"
                 if st.session_state.get(confirm_key):
                     st.warning("Delete?")
                     col_yes, col_no = st.columns(2)
-                    if col_yes.button("✅", key=f"yes_sess_{s['id']}", help="Confirm"):
-                        database.delete_session(s['id'])
+                    if col_yes.button("✅", key=f"yes_sess_{s.id}", help="Confirm"):
+                        database.delete_session(s.id)
                         st.success(f"Deleted")
                         del st.session_state[confirm_key]
                         time.sleep(0.5)
                         st.rerun()
-                    if col_no.button("❌", key=f"no_sess_{s['id']}", help="Cancel"):
+                    if col_no.button("❌", key=f"no_sess_{s.id}", help="Cancel"):
                         del st.session_state[confirm_key]
                         st.rerun()
                 else:
-                    if st.button("🗑️", key=f"del_sess_{s['id']}", help=f"Delete {s['name']}"):
+                    if st.button("🗑️", key=f"del_sess_{s.id}", help=f"Delete {s.name}"):
                         st.session_state[confirm_key] = True
                         st.rerun()
 
+def _memoized(key, tables, compute):
+    # Reuse compute() across reruns until one of the tables it reads is
+    # written (the data layer bumps the table version then)
+    deps = database.table_versions(tables)
+    hit = st.session_state.get(key)
+    if hit is not None and hit[0] == deps:
+        return hit[1]
+    value = compute()
+    st.session_state[key] = (deps, value)
+    return value
+
+def _log_context(current_session):
+    # Exercise map and selectbox options for the logger
+    exercises = database.get_all_exercises()
+    all_ex_map = {f"{e.muscle} - {e.name}": e for e in exercises}
+    
+    options = []
+    session_ex_ids = []
+    if current_session:
+        s_id = database.get_session_by_name(current_session)
+        if s_id:
+            session_details = database.get_session_details(s_id)
+            session_ex_ids = [d.id for d in session_details]
+            session_options = [k for k, v in all_ex_map.items() if v.id in session_ex_ids]
+            session_options.sort()
+            options = session_options + ["---", "➕ Add from Database", "✨ Create New Exercise"]
+    else:
+        options = sorted(list(all_ex_map.keys())) + ["---", "✨ Create New Exercise"]
+    return all_ex_map, options, session_ex_ids
+
 def show_log_workout():
     st.title("Log Workout")
     
+    # Message from a save that triggered the full rerun
+    saved_msg = st.session_state.pop("log_saved_msg", None)
+    if saved_msg:
+        st.balloons()
+        st.success(saved_msg)
+    
     # Routine Selector / Start Logic
     if not st.session_state.workout_log and not st.session_state.session_start_time:
         st.subheader("Start Session")
         sessions = database.get_all_sessions()
-        session_opts = ["New Workout"] + [s['name'] for s in sessions]
+        session_opts = ["New Workout"] + [s.name for s in sessions]
         
         selected_session = st.selectbox("Choose Routine or start a New Workout", session_opts)
         
@@ -195,14 +271,14 @@ def show_log_workout():
             
             if selected_session != "New Workout":
                 # Pre-fill
-                s_id = next(s['id'] for s in sessions if s['name'] == selected_session)
+                s_id = next(s.id for s in sessions if s.name == selected_session)
                 details = database.get_session_details(s_id)
                 for d in details:
-                    last = database.get_last_performance(d['id'])
+                    last = database.get_last_performance(d.id)
                     st.session_state.workout_log.append({
-                        "id": d['id'],
-                        "name": d['name'],
-                        "muscle": d['muscle'],
+                        "id": d.id,
+                        "name": d.name,
+                        "muscle": d.muscle,
                         "weight": last['weight'] if last else 0.0,
                         "reps": last['reps'] if last else 0,
                         "last_perf": f"{last['weight']}kg x {last['reps']} ({last['date']})" if last else "New",
@@ -212,159 +288,168 @@ def show_log_workout():
 
     # If session is active (either logs exist OR start time is set)
     if st.session_state.session_start_time:
-        import streamlit.components.v1 as components
-        
         # Header with Timer (JS based for live updates)
         c1, c2 = st.columns([3, 1])
         c1.subheader(f"Current Session: {st.session_state.current_session_name or 'Freestyle'}")
         
         # Pass start time as timestamp for JS
         start_ts = st.session_state.session_start_time.timestamp() * 1000
+        with c2:
+            _session_timer(start_ts)
         
-        timer_html = f"""
-        <div style="text-align: center;">
-            <div style="font-size: 14px; color: #555; margin-bottom: 4px;">Time Elapsed</div>
-            <div id="timer" style="font-size: 24px; font-weight: bold; font-family: monospace; color: #111;">00:00:00</div>
-        </div>
-        <script>
-        function updateTimer() {{
-            const start = {start_ts};
-            const now = new Date().getTime();
-            const diff = Math.floor((now - start) / 1000);
-            
-            if (diff < 0) return; // Prevent negative on weird sync
-            
-            const h = Math.floor(diff / 3600);
-            const m = Math.floor((diff % 3600) / 60);
-            const s = diff % 60;
-            
-            document.getElementById("timer").innerHTML = 
-                (h < 10 ? "0" + h : h) + ":" + 
-                (m < 10 ? "0" + m : m) + ":" + 
-                (s < 10 ? "0" + s : s);
-        }}
-        setInterval(updateTimer, 1000);
-        updateTimer();
-        </script>
-        """
+        st.divider()
+        _set_entry(st.session_state.current_session_name)
+
+# Fragments: interacting inside one reruns only that function, not the
+# whole script (no init_db, no page dispatch, timer stays mounted).
+
+@st.fragment
+def _session_timer(start_ts):
+    import streamlit.components.v1 as components
+    
+    timer_html = f"""
+    <div style="text-align: center;">
+        <div style="font-size: 14px; color: #555; margin-bottom: 4px;">Time Elapsed</div>
+        <div id="timer" style="font-size: 24px; font-weight: bold; font-family: monospace; color: #111;">00:00:00</div>
+    </div>
+    <script>
+    function updateTimer() {{
+        const start = {start_ts};
+        const now = new Date().getTime();
+        const diff = Math.floor((now - start) / 1000);
         
-        with c2:
-            components.html(timer_html, height=80)
+        if (diff < 0) return; // Prevent negative on weird sync
         
-        # Main Logger Interface
-        current_session = st.session_state.current_session_name
-        exercises = database.get_all_exercises()
-        all_ex_map = {f"{e['muscle']} - {e['name']}": e for e in exercises}
+        const h = Math.floor(diff / 3600);
+        const m = Math.floor((diff % 3600) / 60);
+        const s = diff % 60;
         
-        options = []
-        session_ex_ids = []
-        if current_session:
-            s_id = database.get_session_by_name(current_session)
-            if s_id:
-                session_details = database.get_session_details(s_id)
-                session_ex_ids = [d['id'] for d in session_details]
-                session_options = [k for k, v in all_ex_map.items() if v['id'] in session_ex_ids]
-                session_options.sort()
-                options = session_options + ["---", "➕ Add from Database", "✨ Create New Exercise"]
-        else:
-            options = sorted(list(all_ex_map.keys())) + ["---", "✨ Create New Exercise"]
+        document.getElementById("timer").innerHTML = 
+            (h < 10 ? "0" + h : h) + ":" + 
+            (m < 10 ? "0" + m : m) + ":" + 
+            (s < 10 ? "0" + s : s);
+    }}
+    setInterval(updateTimer, 1000);
+    updateTimer();
+    </script>
+    """
+    components.html(timer_html, height=80)
+
+@st.fragment
+def _set_entry(current_session):
+    # Main Logger Interface
+    all_ex_map, options, session_ex_ids = _memoized(
+        f"log_memo_context_{current_session}", ["exercises", "sessions", "session_items"],
+        lambda: _log_context(current_session))
+    
+    with st.container():
+        st.write("### Add Set")
+        selected_option = st.selectbox("Select Exercise", options)
+        target_exercise = None
         
-        st.divider()
-        with st.container():
-            st.write("### Add Set")
-            selected_option = st.selectbox("Select Exercise", options)
-            target_exercise = None
-            
-            if selected_option == "---":
-                st.info("Select an option above.")
-            elif selected_option == "➕ Add from Database":
-                all_opts = sorted(list(all_ex_map.keys()))
-                full_select = st.selectbox("Search All Exercises", all_opts)
-                target_exercise = all_ex_map[full_select]
-            elif selected_option == "✨ Create New Exercise":
-                with st.expander("New Exercise Details", expanded=True):
-                    c_name = st.text_input("Name")
-                    c_muscle = st.selectbox("Muscle", ["Chest", "Back", "Legs", "Shoulders", "Arms", "Core", "Cardio", "Other"])
-                    c_cat = st.selectbox("Category", ["Strength", "Hypertrophy", "Endurance", "Mobility", "Cardio", "Custom"])
-                    if st.button("Create & Use"):
-                        if c_name:
-                            try:
-                                database.add_custom_exercise(c_name, c_muscle, category=c_cat)
-                                st.success(f"Created {c_name}!")
-                                st.rerun()
-                            except ValueError as e:
-                                st.error(str(e))
-            else:
-                target_exercise = all_ex_map[selected_option]
+        if selected_option == "---":
+            st.info("Select an option above.")
+        elif selected_option == "➕ Add from Database":
+            all_opts = sorted(list(all_ex_map.keys()))
+            full_select = st.selectbox("Search All Exercises", all_opts)
+            target_exercise = all_ex_map[full_select]
+        elif selected_option == "✨ Create New Exercise":
+            with st.expander("New Exercise Details", expanded=True):
+                c_name = st.text_input("Name")
+                c_muscle = st.selectbox("Muscle", ["Chest", "Back", "Legs", "Shoulders", "Arms", "Core", "Cardio", "Other"])
+                c_cat = st.selectbox("Category", ["Strength", "Hypertrophy", "Endurance", "Mobility", "Cardio", "Custom"])
+                if st.button("Create & Use"):
+                    if c_name:
+                        try:
+                            database.add_custom_exercise(c_name, c_muscle, category=c_cat)
+                            st.success(f"Created {c_name}!")
+                            st.rerun(scope="fragment")
+                        except ValueError as e:
+                            st.error(str(e))
+        else:
+            target_exercise = all_ex_map[selected_option]
 
-            if target_exercise:
-                # Show Info Box for Instructions
-                if target_exercise.get('instructions'):
-                    st.info(f"ℹ️ **{target_exercise['name']}**: {target_exercise['instructions']}")
-                
-                last = database.get_last_performance(target_exercise['id'])
-                if last:
-                    st.caption(f"Last Log: {last['weight']}kg x {last['reps']} ({last['date']})")
-                col_w, col_r, col_btn = st.columns([1, 1, 1])
-                with col_w:
-                    weight = st.number_input("Kg", min_value=0.0, step=1.25, key="w_input")
-                with col_r:
-                    reps = st.number_input("Reps", min_value=0, step=1, value=0, key="r_input")
-                with col_btn:
-                    st.write("")
-                    st.write("")
-                    if st.button("Add Set", type="primary"):
-                        if reps > 0:
-                            st.session_state.workout_log.append({
-                                "id": target_exercise['id'],
-                                "name": target_exercise['name'],
-                                "muscle": target_exercise['muscle'],
-                                "weight": weight,
-                                "reps": reps,
-                                "last_perf": f"{last['weight']}kg x {last['reps']}" if last else "New"
-                            })
-                            st.success(f"Added {target_exercise['name']}")
-                            st.rerun()
+        if target_exercise:
+            # Show Info Box for Instructions
+            if target_exercise.instructions:
+                st.info(f"ℹ️ **{target_exercise.name}**: {target_exercise.instructions}")
+            
+            last = database.get_last_performance(target_exercise.id)
+            if last:
+                st.caption(f"Last Log: {last['weight']}kg x {last['reps']} ({last['date']})")
+            col_w, col_r, col_btn = st.columns([1, 1, 1])
+            with col_w:
+                weight = st.number_input("Kg", min_value=0.0, step=1.25, key="w_input")
+            with col_r:
+                reps = st.number_input("Reps", min_value=0, step=1, value=0, key="r_input")
+            with col_btn:
+                st.write("")
+                st.write("")
+                if st.button("Add Set", type="primary"):
+                    if reps > 0:
+                        sets = [(l['weight'], l['reps']) for l in st.session_state.workout_log if l['id'] == target_exercise.id]
+                        records = database.new_records(target_exercise.id, sets + [(weight, reps)])
+                        st.session_state.workout_log.append({
+                            "id": target_exercise.id,
+                            "name": target_exercise.name,
+                            "muscle": target_exercise.muscle,
+                            "weight": weight,
+                            "reps": reps,
+                            "last_perf": f"{last['weight']}kg x {last['reps']}" if last else "New",
+                            "pr": bool(records)
+                        })
+                        if records:
+                            st.success(f"🏆 New PR on {target_exercise.name}: {', '.join(records)}")
                         else:
-                            st.error("Reps > 0 required")
+                            st.success(f"Added {target_exercise.name}")
+                    else:
+                        st.error("Reps > 0 required")
 
-        # View/Edit Log
-        if st.session_state.workout_log:
-            display_data = []
-            unique_logged_ids = set()
-            for l in st.session_state.workout_log:
-                unique_logged_ids.add(l['id'])
-                display_data.append({
-                    "Exercise": l['name'],
-                    "Weight": l['weight'],
-                    "Reps": l['reps'],
-                    "Last": l.get('last_perf', '-')
-                })
-            
-            st.dataframe(display_data, width='stretch')
-            
-            # Check for Routine Update
-            update_routine = False
-            if current_session and session_ex_ids:
-                new_ids = [ids for ids in unique_logged_ids if ids not in session_ex_ids]
-                if new_ids:
-                    st.info(f"You added {len(new_ids)} new exercise(s) to this session.")
-                    update_routine = st.checkbox(f"Update '{current_session}' to include these new exercises?", value=True)
+    # Rendered after the form, so a set added above already shows up here
+    _current_log(current_session, session_ex_ids)
+
+@st.fragment
+def _current_log(current_session, session_ex_ids):
+    # View/Edit Log
+    if st.session_state.workout_log:
+        display_data = []
+        unique_logged_ids = set()
+        for l in st.session_state.workout_log:
+            unique_logged_ids.add(l['id'])
+            display_data.append({
+                "Exercise": l['name'],
+                "Weight": l['weight'],
+                "Reps": l['reps'],
+                "Last": l.get('last_perf', '-'),
+                "PR": "🏆" if l.get('pr') else ""
+            })
+        
+        st.dataframe(display_data, width='stretch')
+        
+        # Check for Routine Update
+        update_routine = False
+        if current_session and session_ex_ids:
+            new_ids = [ids for ids in unique_logged_ids if ids not in session_ex_ids]
+            if new_ids:
+                st.info(f"You added {len(new_ids)} new exercise(s) to this session.")
+                update_routine = st.checkbox(f"Update '{current_session}' to include these new exercises?", value=True)
+        
+        cols = st.columns(3)
+        if cols[1].button("Finish & Save", type="primary", width='stretch'):
+            save_routine(update_session_bool=update_routine)
+            # Back to the start screen for the whole page
+            st.rerun()
             
-            cols = st.columns(3)
-            if cols[1].button("Finish & Save", type="primary", width='stretch'):
-                save_routine(update_session_bool=update_routine)
-                
-            if cols[2].button("Cancel & Clear"):
-                st.session_state.workout_log = []
-                st.session_state.current_session_name = None
-                st.session_state.session_start_time = None
-                st.rerun()
-        else:
-            if st.button("Cancel Session"):
-                st.session_state.session_start_time = None
-                st.session_state.current_session_name = None
-                st.rerun()
+        if cols[2].button("Cancel & Clear"):
+            st.session_state.workout_log = []
+            st.session_state.current_session_name = None
+            st.session_state.session_start_time = None
+            st.rerun()
+    else:
+        if st.button("Cancel Session"):
+            st.session_state.session_start_time = None
+            st.session_state.current_session_name = None
+            st.rerun()
 
 def save_routine(update_session_bool=False):
     logs = st.session_state.workout_log
@@ -381,25 +466,34 @@ def save_routine(update_session_bool=False):
     
     total_vol = sum(l['weight'] * l['reps'] for l in logs)
     
-    w_id = database.create_workout(total_vol, session_name=s_name, duration_minutes=duration)
-    
-    logged_ex_ids = []
-    seen = set()
-    for idx, item in enumerate(logs):
-        database.log_set(w_id, item['id'], item['weight'], item['reps'], idx)
-        if item['id'] not in seen:
-            logged_ex_ids.append(item['id'])
-            seen.add(item['id'])
+    # The workout and all its sets reach the sheet in one request
+    with database.transaction():
+        w_id = database.create_workout(total_vol, session_name=s_name, duration_minutes=duration)
+        
+        logged_ex_ids = []
+        seen = set()
+        for idx, item in enumerate(logs):
+            database.log_set(w_id, item['id'], item['weight'], item['reps'], idx)
+            if item['id'] not in seen:
+                logged_ex_ids.append(item['id'])
+                seen.add(item['id'])
             
     if update_session_bool and s_name:
-        database.update_session(s_name, logged_ex_ids)
-        st.toast(f"Updated routine '{s_name}'!")
+        # Keep the routine's exercises, the new ones go after them
+        s_id = database.get_session_by_name(s_name)
+        current = [int(d.id) for d in database.get_session_details(s_id)] if s_id else []
+        merged = current + [int(i) for i in logged_ex_ids if int(i) not in current]
+        try:
+            database.update_session(s_name, merged)
+            st.toast(f"Updated routine '{s_name}'!")
+        except ValueError as e:
+            st.toast(f"Workout saved, but the routine was not updated: {e}", icon="⚠️")
         
     st.session_state.workout_log = []
     st.session_state.current_session_name = None
     st.session_state.session_start_time = None
-    st.balloons()
-    st.success(f"Workout Saved! Duration: {duration} mins")
+    # Shown by show_log_workout after the rerun
+    st.session_state.log_saved_msg = f"Workout Saved! Duration: {duration} mins"
 
 def show_library():
     st.title("Exercise Library")
@@ -444,7 +538,7 @@ def show_library():
         st.subheader("Delete Exercises")
         st.warning("⚠️ Deleting an exercise will remove it from all History and Routines.")
         exercises = database.get_all_exercises()
-        ex_map = {f"{e['muscle']} - {e['name']}": e['id'] for e in exercises}
+        ex_map = {f"{e.muscle} - {e.name}": e.id for e in exercises}
         
         to_del = st.selectbox("Select Exercise to Delete", sorted(ex_map.keys()))
         if st.button("Delete Permanently", type="primary"):
@@ -481,35 +575,49 @@ def show_history():
     if not history:
         st.info("No workouts found.")
         return
+    
+    c_fmt, c_dl = st.columns([1, 3])
+    fmt = c_fmt.selectbox("Export format", list(database.EXPORT_FORMATS), label_visibility="collapsed")
+    export = database.history_export(fmt)
+    # Deferred: the export only runs when the button is clicked, a fresh
+    # stream on each call
+    c_dl.download_button(
+        "⬇️ Export all sets",
+        data=lambda: b"".join(export()),
+        file_name=f"wlog_history_{datetime.now():%Y%m%d}.{fmt}",
+        mime=database.EXPORT_FORMATS[fmt][0],
+    )
         
     for w in history:
-        dur = w.get('duration', 0)
-        title = f"{w['date']} - {w['session'] or 'Freestyle'} | ⏱️ {dur}m | Vol: {w['volume']:,.0f}kg"
+        dur = w.duration
+        title = f"{w.date} - {w.session or 'Freestyle'} | ⏱️ {dur}m | Vol: {w.volume:,.0f}kg"
         
         c1, c2 = st.columns([6, 1])
         with c1:
             with st.expander(title):
-                df = pd.DataFrame(w['sets'])
+                df = w.sets.to_frame()
                 if not df.empty:
                     st.dataframe(df[['muscle', 'exercise', 'weight', 'reps']], width='stretch')
         with c2:
-            confirm_key = f"confirm_del_wo_{w['id']}"
+            confirm_key = f"confirm_del_wo_{w.id}"
             if st.session_state.get(confirm_key):
                 st.warning("Delete?")
                 col_yes, col_no = st.columns(2)
-                if col_yes.button("✅", key=f"yes_wo_{w['id']}", help="Confirm Delete"):
-                    database.delete_workout(w['id'])
+                if col_yes.button("✅", key=f"yes_wo_{w.id}", help="Confirm Delete"):
+                    database.delete_workout(w.id)
                     st.success("Workout Deleted")
                     del st.session_state[confirm_key]
                     time.sleep(0.7)
                     st.rerun()
-                if col_no.button("❌", key=f"no_wo_{w['id']}", help="Cancel"):
+                if col_no.button("❌", key=f"no_wo_{w.id}", help="Cancel"):
                     del st.session_state[confirm_key]
                     st.rerun()
             else:
-                if st.button("🗑️", key=f"del_wo_{w['id']}", help="Delete Workout"):
+                if st.button("🗑️", key=f"del_wo_{w.id}", help="Delete Workout"):
                     st.session_state[confirm_key] = True
                     st.rerun()
 
 if __name__ == "__main__":
-    main()
+    # Opt-in (?profile=1 or WLOG_PROFILE=1), see profiler.py
+    with profiler.rerun(lambda: st.session_state.get("nav"), st.query_params):
+        main()
@@ -0,0 +1,286 @@
+import argparse
+import gc
+import inspect
+import json
+import math
+import os
+import statistics
+import sys
+import time
+
+# Micro-benchmarks for every public function in database_gsheets.
+#
+# Each dataset size is generated by synthetic.py and loaded into the
+# in-memory backend, then every function is timed three ways:
+#
+#   cold  empty session: includes reading the tables from the backend
+#   hot   tables cached, memoized/derived state dropped (as after a write)
+#   warm  everything cached, what an unchanged rerun pays
+#
+#   python bench.py --sizes s,m,l --save bench_baseline.json
+#   python bench.py --baseline bench_baseline.json --threshold 2
+#
+# With --baseline, exits 1 if any hot or warm time (medians) is more than
+# threshold times its baseline and at least --min-ms slower. Cold times are
+# single samples and only reported. Baselines are machine specific: save
+# one on the machine that compares against it.
+
+os.environ["WLOG_BACKEND"] = "local"
+
+import streamlit as st
+from streamlit import config
+from streamlit import logger as st_logger
+
+import database_gsheets as database
+import local_backend
+import migrations
+import synthetic
+
+# Running outside `streamlit run`, session state still works but warns
+config.set_option("logger.level", "error")
+st_logger.set_log_level("error")
+
+# compact is a case of its own; a background pass woken by the deletes
+# would land in whatever case runs next
+database._start_compactor = lambda: None
+
+SIZES = {
+    "s": dict(years=0.5, workouts=100, log_entries=2_000, exercises=60, sessions=6),
+    "m": dict(years=2, workouts=600, log_entries=20_000, exercises=200, sessions=10),
+    "l": dict(years=5, workouts=1500, log_entries=100_000, exercises=500, sessions=12),
+}
+
+# Session state keys holding derived data, dropped for the hot timing
+_DERIVED = ("gs_memo", "gs_agg", "gs_prs", "gs_idx_")
+
+class Context:
+    # Picks arguments from the current data, so cases survive earlier writes
+    def __init__(self, sh, rep_seed=0):
+        self.sh = sh
+        self.n = rep_seed
+
+    def _ids(self, table):
+        ids = database._get_df(table)['id']
+        return ids.iloc[(self.n * 7919) % len(ids)]
+
+    def exercise_id(self):
+        return self._ids("exercises")
+
+    def workout_id(self):
+        return self._ids("workouts")
+
+    def session_id(self):
+        return self._ids("sessions")
+
+    def session_name(self):
+        sess = database._get_df("sessions")
+        return sess['name'].iloc[(self.n * 7919) % len(sess)]
+
+    def exercise_ids(self, k=6):
+        ids = database._get_df("exercises")['id']
+        return [int(ids.iloc[(self.n * 31 + i * 17) % len(ids)]) for i in range(k)]
+
+def _empty_routines(ctx):
+    # create_default_schedule only runs on a spreadsheet without routines
+    for name in ("sessions", "session_items"):
+        ws = ctx.sh.worksheet(name)
+        ws.clear()
+        ws.append_rows([migrations.SCHEMA[name]])
+    st.session_state.clear()
+    return ()
+
+def _tombstone_some(ctx):
+    # Something for compact(force=True) to drop
+    for i in range(5):
+        ctx.n += 1
+        database.delete_workout(ctx.workout_id())
+    return (True,)
+
+# name -> prepare(ctx) returning the call's arguments (untimed). Reads first,
+# then writes, destructive ones last.
+CASES = [
+    ("init_db", lambda ctx: ()),
+    ("seed_exercises", lambda ctx: ()),
+    ("prefetch", lambda ctx: (["workouts", "log_entries", "exercises", "sessions", "session_items"],)),
+    ("table_versions", lambda ctx: (["workouts", "log_entries"],)),
+    ("sync_status", lambda ctx: ()),
+    ("get_all_exercises", lambda ctx: ()),
+    ("get_all_sessions", lambda ctx: ()),
+    ("get_session_by_name", lambda ctx: (ctx.session_name(),)),
+    ("get_session_details", lambda ctx: (ctx.session_id(),)),
+    ("get_last_performance", lambda ctx: (ctx.exercise_id(),)),
+    ("get_last_workout_summary", lambda ctx: ()),
+    ("get_streak", lambda ctx: ()),
+    ("get_history", lambda ctx: ()),
+    ("volume_chart", lambda ctx: ("week",)),
+    ("muscle_chart", lambda ctx: ("week",)),
+    ("new_records", lambda ctx: (ctx.exercise_id(), [(100.0, 5)])),
+    ("query", lambda ctx: ("log_entries",)),
+    ("export_history", lambda ctx: ("csv",)),
+    ("history_export", lambda ctx: ("csv",)),
+    ("export_to_file", lambda ctx: (os.devnull, "csv")),
+    ("set_tenant", lambda ctx: (f"bench{ctx.n}@example.com",)),
+    ("create_workout", lambda ctx: (1000.0, "Bench", 45)),
+    ("log_set", lambda ctx: (ctx.workout_id(), ctx.exercise_id(), 50.0, 8, 0)),
+    ("add_custom_exercise", lambda ctx: (f"Bench Exercise {time.perf_counter_ns()}", "Other")),
+    ("create_session", lambda ctx: (f"Bench Routine {time.perf_counter_ns()}", ctx.exercise_ids())),
+    ("update_session_by_id", lambda ctx: (ctx.session_id(), f"Bench Routine {time.perf_counter_ns()}", ctx.exercise_ids())),
+    ("update_session", lambda ctx: (ctx.session_name(), ctx.exercise_ids())),
+    ("transaction", lambda ctx: (ctx.exercise_ids(),)),
+    ("delete_session", lambda ctx: (ctx.session_id(),)),
+    ("delete_workout", lambda ctx: (ctx.workout_id(),)),
+    ("delete_exercise", lambda ctx: (ctx.exercise_id(),)),
+    ("compact", _tombstone_some),
+    ("create_default_schedule", _empty_routines),
+]
+
+def _call(name, args):
+    fn = getattr(database, name)
+    if name == "query":
+        # The constructor is free, time a real indexed lookup
+        return fn(*args).where("exercise_id", database._get_df("exercises")['id'].iloc[0]).frame()
+    if name == "transaction":
+        # A workout and its sets, as the app saves them
+        with fn():
+            w_id = database.create_workout(1000.0, "Bench", 45)
+            for order, eid in enumerate(args[0]):
+                database.log_set(w_id, eid, 50.0, 8, order)
+        return w_id
+    if name == "export_history":
+        # Returns a generator, the work happens as it is drained
+        return sum(len(chunk) for chunk in fn(*args))
+    if name == "history_export":
+        # What the download button does with it
+        return len(b"".join(fn(*args)()))
+    return fn(*args)
+
+def _drop_derived():
+    for key in list(st.session_state.keys()):
+        if key.startswith(_DERIVED):
+            del st.session_state[key]
+
+def _timed(name, args):
+    # Like timeit: no cyclic GC pass landing inside the measurement
+    gc.collect()
+    gc.disable()
+    try:
+        t0 = time.perf_counter()
+        _call(name, args)
+        return time.perf_counter() - t0
+    finally:
+        gc.enable()
+
+def _load(size, seed):
+    client = local_backend.reset_client()
+    database._reset_connections()
+    st.session_state.clear()
+    sh = client.open("WLog_DB")
+    migrations.migrate(sh)
+    synthetic.load(sh, synthetic.generate(seed=seed, **SIZES[size]))
+    return sh
+
+def bench_size(size, reps, seed=0):
+    sh = _load(size, seed)
+    results = {}
+    for name, prepare in CASES:
+        ctx = Context(sh)
+        st.session_state.clear()
+        cold = _timed(name, prepare(ctx))
+        hot, warm = [], []
+        for r in range(reps):
+            ctx.n = r + 1
+            args = prepare(ctx)
+            _drop_derived()
+            hot.append(_timed(name, args))
+            args = prepare(ctx)
+            warm.append(_timed(name, args))
+        results[name] = {
+            "cold_ms": round(cold * 1000, 3),
+            "hot_ms": round(statistics.median(hot) * 1000, 3),
+            "warm_ms": round(statistics.median(warm) * 1000, 3),
+        }
+    return results
+
+def unbenchmarked():
+    # Public functions without a case, so new ones don't slip by
+    covered = {name for name, _ in CASES}
+    return sorted(n for n, f in vars(database).items()
+                  if not n.startswith("_") and inspect.isfunction(f)
+                  and f.__module__ == database.__name__ and n not in covered)
+
+def _scaling(report, sizes):
+    # Growth exponent of hot time vs log_entries between smallest and largest size
+    if len(sizes) < 2:
+        return {}
+    lo, hi = sizes[0], sizes[-1]
+    rows = math.log(SIZES[hi]["log_entries"] / SIZES[lo]["log_entries"])
+    out = {}
+    for name in report[hi]:
+        a, b = report[lo][name]["hot_ms"], report[hi][name]["hot_ms"]
+        if a > 0.05 and b > 0.05:
+            out[name] = round(math.log(b / a) / rows, 2)
+    return out
+
+def compare(report, baseline, threshold, min_ms):
+    failures = []
+    for size, funcs in report["sizes"].items():
+        for name, cur in funcs.items():
+            base = baseline.get("sizes", {}).get(size, {}).get(name)
+            if not base:
+                continue
+            for kind in ("hot_ms", "warm_ms"):
+                if cur[kind] > base[kind] * threshold and cur[kind] - base[kind] > min_ms:
+                    failures.append(f"{size}/{name} {kind}: {cur[kind]:.2f} vs baseline {base[kind]:.2f}")
+    return failures
+
+def _print_report(report):
+    sizes = list(report["sizes"])
+    head = "".join(f"{s + ' cold':>11}{s + ' hot':>10}{s + ' warm':>10}" for s in sizes)
+    print(f"{'function':<26}{head}{'growth':>8}")
+    for name, _ in CASES:
+        cells = "".join(
+            f"{report['sizes'][s][name]['cold_ms']:>11.2f}{report['sizes'][s][name]['hot_ms']:>10.2f}{report['sizes'][s][name]['warm_ms']:>10.2f}"
+            for s in sizes)
+        growth = report["scaling"].get(name)
+        flag = f"{growth:>8.2f}" if growth is not None else f"{'-':>8}"
+        print(f"{name:<26}{cells}{flag}{'  superlinear' if growth and growth > 1.2 else ''}")
+    if report["unbenchmarked"]:
+        print(f"not benchmarked: {', '.join(report['unbenchmarked'])}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for database_gsheets")
+    parser.add_argument("--sizes", default="s,m,l", help=f"comma separated, from {','.join(SIZES)}")
+    parser.add_argument("--reps", type=int, default=5, help="timed repetitions per function (median)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="write the report as a baseline to this file")
+    parser.add_argument("--baseline", help="compare against this baseline")
+    parser.add_argument("--threshold", type=float, default=2.0, help="allowed slowdown factor vs baseline")
+    parser.add_argument("--min-ms", type=float, default=2.0, help="ignore slowdowns smaller than this")
+    args = parser.parse_args(argv)
+
+    sizes = [s for s in args.sizes.split(",") if s]
+    report = {
+        "python": sys.version.split()[0],
+        "reps": args.reps,
+        "seed": args.seed,
+        "datasets": {s: SIZES[s] for s in sizes},
+        "sizes": {s: bench_size(s, args.reps, args.seed) for s in sizes},
+        "unbenchmarked": unbenchmarked(),
+    }
+    report["scaling"] = _scaling(report["sizes"], sizes)
+    _print_report(report)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures = compare(report, json.load(f), args.threshold, args.min_ms)
+        for line in failures:
+            print(f"REGRESSION {line}")
+        if failures:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,20 +1,159 @@
 import pandas as pd
+import numpy as np
 import datetime
 import streamlit as st
 import json
 import os
+import threading
+import time
+import functools
+import contextlib
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import gspread
+import migrations
 from oauth2client.service_account import ServiceAccountCredentials
 
-# Global client cache
-_gc = None
-_sh = None
+# One authorized client per process; open spreadsheets (one per tenant,
+# None = WLog_DB) are kept in a bounded LRU pool, see _connection
+_client = None
+_pool = OrderedDict()
+_pool_lock = threading.RLock()
 DB_NAME = "Google Sheets (WLog_DB)"
 
+# Worksheet reads run on a small shared pool so several cache misses
+# cost one round-trip of latency instead of one each.
+_FETCH_WORKERS = 4
+_fetch_pool = ThreadPoolExecutor(max_workers=_FETCH_WORKERS, thread_name_prefix="wlog-fetch")
+# (spreadsheet id, worksheet) -> Future, shared by every session while the read is in flight
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+# Worksheets are loaded in row ranges of this size, each converted to
+# columns before the next is fetched; a failed range is retried on its own
+_LOAD_CHUNK = int(os.environ.get("WLOG_LOAD_CHUNK", "10000"))
+_READ_RETRIES = 3
+
+# (spreadsheet id, worksheet) -> header row, to address single columns
+_headers = {}
+
+# spreadsheet id -> {worksheet title: sheetId}, for batch_update requests
+_ws_ids = {}
+# spreadsheet id -> {worksheet title: handle}, so reads skip the metadata call
+_ws_handles = {}
+
+# Soft deletes: a row in 'tombstones' hides a workout/session (and its
+# children) at cache-load time; compaction drops the rows for real later.
+# table -> (table whose tombstones apply, column holding that table's id)
+_TOMBSTONE_FILTERS = {
+    "workouts": ("workouts", "id"),
+    "log_entries": ("workouts", "workout_id"),
+    "sessions": ("sessions", "id"),
+    "session_items": ("sessions", "session_id"),
+}
+# Compact once hidden rows reach this share of those tables
+_COMPACT_RATIO = float(os.environ.get("WLOG_COMPACT_RATIO", "0.1"))
+_COMPACT_INTERVAL = float(os.environ.get("WLOG_COMPACT_INTERVAL", "300"))
+# Compaction and transaction commits delete and update rows by position.
+# Processes sharing a WLOG_SHARED_CACHE store take turns through its lock;
+# with several processes on one spreadsheet and no shared store, set
+# WLOG_COMPACTOR=0 in all but one of them (compact() still works on demand)
+_COMPACTOR = os.environ.get("WLOG_COMPACTOR", "1") != "0"
+_compactor = None
+_compactor_lock = threading.Lock()
+_compact_wake = threading.Event()
+# Offline, the one mirror; online, a lock per spreadsheet (see _rows_lock)
+_compact_lock = threading.Lock()
+_row_locks = {}
+# Tenants with deletes since their last compaction pass
+_compact_pending = set()
+# Compaction reads its tables in parallel on its own threads, so it never
+# queues page loads behind it on the fetch pool
+_compact_pool = ThreadPoolExecutor(max_workers=len(_TOMBSTONE_FILTERS), thread_name_prefix="wlog-compact")
+
+# Offline-first mode: reads and writes go to a local SQLite mirror that a
+# background engine syncs with the spreadsheet (see local_mirror.py)
+OFFLINE = os.environ.get("WLOG_OFFLINE") == "1"
+_mirror = None
+_sync = None
+_mirror_lock = threading.Lock()
+
+# Second-level cache shared with the other server processes on this host
+# (see shared_cache.py); off unless WLOG_SHARED_CACHE is set
+_shared = None
+_shared_lock = threading.Lock()
+# Generations are polled at most this often (seconds) per process
+_SHARED_POLL = float(os.environ.get("WLOG_SHARED_POLL", "1"))
+_shared_gens = {}
+_shared_polled = 0.0
+
+# Multi-tenant mode (WLOG_TENANTS=1): every user works in a spreadsheet of
+# their own, so load, quota and table sizes are split between them.
+# WLog_DB keeps the directory ('tenants': tenant -> spreadsheet key). A
+# tenant's spreadsheet is created on first login, as a copy of the
+# WLOG_TENANT_TEMPLATE spreadsheet (a key) if set, empty otherwise, and
+# brought up to SCHEMA. Offline mode has a single mirror and ignores it.
+TENANTS = os.environ.get("WLOG_TENANTS") == "1" and not OFFLINE
+_TENANT_TEMPLATE = os.environ.get("WLOG_TENANT_TEMPLATE")
+_TENANT_POOL = int(os.environ.get("WLOG_TENANT_POOL", "32"))
+_DIRECTORY = "tenants"
+_DIRECTORY_HEADER = ["tenant", "spreadsheet_id", "created_at"]
+_tenant_keys = {}
+_tenant_lock = threading.Lock()
+# tenant -> lock held while looking it up in the directory or creating it
+_tenant_locks = {}
+
+# Memoized query results kept per session
+_MEMO_SIZE = int(os.environ.get("WLOG_MEMO_SIZE", "128"))
+
 def _get_connection():
-    global _gc, _sh
-    if _gc and _sh:
-        return _gc, _sh
+    # (client, spreadsheet) of this session's tenant
+    return _connection(_current_tenant())
+
+def _connection(tenant):
+    with _pool_lock:
+        conn = _pool.get(tenant)
+        if conn is not None:
+            _pool.move_to_end(tenant)
+            return conn
+    gc = _authorized_client()
+    conn = (gc, _tenant_spreadsheet(gc, tenant) if tenant is not None else _main_spreadsheet(gc))
+    with _pool_lock:
+        _pool[tenant] = conn
+        while len(_pool) > _TENANT_POOL:
+            _, (_, old) = _pool.popitem(last=False)
+            _forget_spreadsheet(old)
+    return conn
+
+def _forget_spreadsheet(sh):
+    # Evicted from the pool: what was kept for it goes too
+    _ws_handles.pop(sh.id, None)
+    _ws_ids.pop(sh.id, None)
+    for key in [k for k in list(_headers) if k[0] == sh.id]:
+        _headers.pop(key, None)
+
+def _reset_connections():
+    # Forget the client and every pooled spreadsheet (tests swap the backend)
+    global _client
+    with _pool_lock:
+        for _, sh in _pool.values():
+            _forget_spreadsheet(sh)
+        _pool.clear()
+        _client = None
+    with _tenant_lock:
+        _tenant_keys.clear()
+        _tenant_locks.clear()
+
+def _authorized_client():
+    global _client
+    if _client is not None:
+        return _client
+
+    # In-memory stand-in (load tests / offline dev), no credentials needed
+    if os.environ.get("WLOG_BACKEND") == "local":
+        import local_backend
+        _client = local_backend.get_client(float(os.environ.get("WLOG_LOCAL_LATENCY", "0")))
+        return _client
 
     scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
     
@@ -52,93 +191,632 @@ def _get_connection():
         st.stop()
         
     # print("Authenticating with Google...")
-    _gc = gspread.service_account_from_dict(creds_dict)
+    _client = gspread.service_account_from_dict(creds_dict)
+    return _client
+
+def _main_spreadsheet(gc):
+    if os.environ.get("WLOG_BACKEND") == "local":
+        return gc.open("WLog_DB")
     try:
         # print("Opening Spreadsheet 'WLog_DB'...")
-        _sh = _gc.open("WLog_DB")
-        # print(f"Successfully opened: {_sh.title}")
-        st.toast(f"✅ Connected to: {_sh.title}")
+        sh = gc.open("WLog_DB")
+        # print(f"Successfully opened: {sh.title}")
+        st.toast(f"✅ Connected to: {sh.title}")
     except gspread.SpreadsheetNotFound:
         st.error("Spreadsheet 'WLog_DB' not found. Please create it and share with the service account email.")
         st.stop()
-        
-    return _gc, _sh
+    return sh
 
-def _get_df(worksheet_name):
-    # Cache key
+# --- Tenants ---
+
+def _current_tenant():
+    if not TENANTS:
+        return None
+    tenant = st.session_state.get("gs_tenant")
+    if tenant is None:
+        raise RuntimeError("Multi-tenant mode: call set_tenant() before using the database")
+    return tenant
+
+def set_tenant(tenant):
+    # Multi-tenant mode: the user this session works for (a stable id such
+    # as the login email). Switching drops the session's cached tables.
+    tenant = str(tenant).strip().lower()
+    if not tenant:
+        raise ValueError("Tenant id is empty.")
+    if st.session_state.get("gs_tenant") != tenant:
+        for key in [k for k in st.session_state.keys() if k.startswith("gs_")]:
+            del st.session_state[key]
+        st.session_state["gs_tenant"] = tenant
+
+def _directory():
+    _, sh = _connection(None)
+    try:
+        return _worksheet(sh, _DIRECTORY)
+    except gspread.WorksheetNotFound:
+        ws = sh.add_worksheet(title=_DIRECTORY, rows=100, cols=len(_DIRECTORY_HEADER))
+        ws.append_row(_DIRECTORY_HEADER)
+        return ws
+
+def _tenant_spreadsheet(gc, tenant):
+    # Looked up in the directory (re-read on a miss, another process may
+    # have added the tenant), created and listed on first use. Misses take
+    # the tenant's own lock, so provisioning one never holds up the others
+    with _tenant_lock:
+        key = _tenant_keys.get(tenant)
+        lock = _tenant_locks.setdefault(tenant, threading.Lock()) if key is None else None
+    if key is not None:
+        return gc.open_by_key(key)
+    with lock:
+        with _tenant_lock:
+            key = _tenant_keys.get(tenant)
+        if key is None:
+            directory = _directory()
+            listed = {row[0]: row[1] for row in directory.get_all_values()[1:]
+                      if len(row) >= 2 and row[0] and row[1]}
+            with _tenant_lock:
+                for t, k in listed.items():
+                    _tenant_keys.setdefault(t, k)
+                key = _tenant_keys.get(tenant)
+        if key is not None:
+            return gc.open_by_key(key)
+        title = f"WLog_DB - {tenant}"
+        if _TENANT_TEMPLATE:
+            sh = gc.copy(_TENANT_TEMPLATE, title=title, copy_permissions=False)
+        else:
+            sh = gc.create(title)
+        # The template may predate the current schema
+        migrations.migrate(sh)
+        created_at = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        directory.append_row([tenant, sh.id, created_at])
+        with _tenant_lock:
+            _tenant_keys[tenant] = sh.id
+        return sh
+
+def _worksheet(sh, worksheet_name):
+    # Handles are kept per spreadsheet; gspread fetches metadata for each lookup
+    handles = _ws_handles.setdefault(sh.id, {})
+    ws = handles.get(worksheet_name)
+    if ws is None:
+        ws = handles[worksheet_name] = sh.worksheet(worksheet_name)
+    return ws
+
+def _refreshed_worksheet(sh, worksheet_name):
+    # A new handle, for the grid size as it is now
+    ws = _ws_handles.setdefault(sh.id, {})[worksheet_name] = sh.worksheet(worksheet_name)
+    return ws
+
+def _get_mirror():
+    global _mirror, _sync
+    with _mirror_lock:
+        if _mirror is None:
+            import local_mirror
+            _mirror = local_mirror.LocalMirror(os.environ.get("WLOG_MIRROR_PATH", "wlog_mirror.sqlite3"))
+            _sync = local_mirror.SyncEngine(
+                _mirror,
+                _migrated_sheet,
+                interval=float(os.environ.get("WLOG_SYNC_INTERVAL", "5")),
+            )
+            _sync.start()
+    return _mirror
+
+def _migrated_sheet():
+    # The sync engine's connection; the sheet is brought up to SCHEMA first
+    _, sh = _get_connection()
+    migrations.migrate(sh)
+    return sh
+
+def _local_version(worksheet_name):
+    # Mirror versions the cached frame depends on (tombstones too, if filtered)
+    mirror = _get_mirror()
+    if worksheet_name in _TOMBSTONE_FILTERS:
+        return (mirror.version(worksheet_name), mirror.version("tombstones"))
+    return (mirror.version(worksheet_name),)
+
+def _get_local_df(worksheet_name):
+    # Offline mode read: session cache is valid while the mirror versions match
     cache_key = f"gs_cache_{worksheet_name}"
-    
-    # Return from cache if available
-    if cache_key in st.session_state:
-        # print(f"DEBUG: Reading '{worksheet_name}' from CACHE")
+    version = _local_version(worksheet_name)
+    if cache_key in st.session_state and st.session_state.get(f"gs_ver_{worksheet_name}") == version:
         return st.session_state[cache_key]
+    df, _ = _get_mirror().read_df(worksheet_name)
+    st.session_state[cache_key] = _apply_tombstones(worksheet_name, df)
+    st.session_state[f"gs_ver_{worksheet_name}"] = version
+    return st.session_state[cache_key]
 
-    # print(f"Reading sheet: {worksheet_name} from API")
-    _, sh = _get_connection()
+def _retrying(read, *args):
+    # Rate limits, server errors and dropped connections are retried with
+    # backoff; anything else (a bad range, permissions) is raised at once
+    for attempt in range(_READ_RETRIES + 1):
+        try:
+            return read(*args)
+        except (gspread.exceptions.APIError, OSError) as e:
+            code = getattr(e, "code", None)
+            transient = code is None or code == 429 or code >= 500
+            if not transient or attempt == _READ_RETRIES:
+                raise
+            time.sleep(0.5 * 2 ** attempt)
+
+def _range_chunks(sh, ws, rows=None):
+    # (header, chunks): row 1 comes in the same read as the first chunk of
+    # data rows, so most tables load in one call; the other chunks are read
+    # as the generator is consumed, padded to the header's width.
+    # Sheets trims trailing blank rows off each response, so a short chunk
+    # only ends the table at the end of the grid; before that an empty
+    # response does. Blank rows trimmed off a chunk are put back in front
+    # of the next one, row positions must stay exact. Cached handles keep
+    # the grid size they were fetched with, so a read that goes past its
+    # first chunk refreshes the handle once.
+    rows = rows or _LOAD_CHUNK
+    values = _retrying(ws.get, f"1:{rows + 1}")
+    header = [h.strip() for h in values[0]] if values else []
+    
+    def chunks(ws, values):
+        width = len(header)
+        last = _col_letter(width)
+        end, blank, fresh = rows + 1, 0, False
+        while values:
+            yield [[""] * width for _ in range(blank)] + [(r + [""] * (width - len(r)))[:width] for r in values]
+            # A short chunk at the grid end ends the table; a full one may
+            # be followed by rows added since the handle was fetched
+            if end >= ws.row_count and (fresh or len(values) < rows):
+                return
+            if not fresh:
+                ws, fresh = _refreshed_worksheet(sh, ws.title), True
+                if end >= ws.row_count:
+                    return
+            start, blank = end + 1, rows - len(values)
+            end = start + rows - 1
+            values = _retrying(ws.get, f"A{start}:{last}{end}")
+    
+    return header, chunks(ws, values[1:] if header else [])
+
+def _read_worksheet(sh, worksheet_name):
+    # Runs on the fetch pool: no st.* calls in here, only the API reads
     try:
-        ws = sh.worksheet(worksheet_name)
+        ws = _worksheet(sh, worksheet_name)
     except gspread.WorksheetNotFound:
         # Auto-create if missing (failsafe)
         ws = sh.add_worksheet(title=worksheet_name, rows=100, cols=20)
-        
     
-    # robust read using pandas from values, assuming row 1 is header
-    data = ws.get_all_values()
-    if not data:
-        # print(f"WARNING: Sheet '{worksheet_name}' is completely empty.")
-        df = pd.DataFrame()
-        # Cache the empty result too
-        st.session_state[cache_key] = df
+    # Row 1 is the header; the rest comes in chunks, each turned into a
+    # frame (column arrays) while only that chunk's lists are alive
+    headers, values = _range_chunks(sh, ws)
+    _headers[(sh.id, worksheet_name)] = headers
+    if not headers:
+        return pd.DataFrame()
+    
+    chunks = [pd.DataFrame(v, columns=headers) for v in values]
+    if not chunks:
+        return pd.DataFrame(columns=headers)
+    if len(chunks) == 1:
+        return chunks[0]
+    return pd.concat(chunks, ignore_index=True)
+
+def _sheet_header(sh, ws, worksheet_name):
+    key = (sh.id, worksheet_name)
+    if key not in _headers:
+        first = _retrying(ws.get, "1:1")
+        _headers[key] = [h.strip() for h in first[0]] if first else []
+    return _headers[key]
+
+def _read_columns(sh, worksheet_name, columns, anchor=False):
+    # Only the named columns' data cells, one column-major batch_get.
+    # Columns come back trimmed to their last non-empty cell, unpadded;
+    # anchor adds the first column (ids, always filled) to fix the row count.
+    ws = _worksheet(sh, worksheet_name)
+    header = _sheet_header(sh, ws, worksheet_name)
+    if anchor:
+        columns = header[:1] + list(columns)
+    pos = {}
+    for i, c in enumerate(header):
+        pos.setdefault(c, i + 1)
+    wanted = [c for c in dict.fromkeys(columns) if c in pos]
+    if not wanted:
+        return {}
+    ranges = [f"{_col_letter(pos[c])}2:{_col_letter(pos[c])}" for c in wanted]
+    values = _retrying(lambda: ws.batch_get(ranges, major_dimension="COLUMNS"))
+    return {c: list(v[0]) if v else [] for c, v in zip(wanted, values)}
+
+def _get_shared():
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            url = os.environ.get("WLOG_SHARED_CACHE")
+            if url and not OFFLINE:
+                import shared_cache
+                _shared = shared_cache.open_store(url)
+            else:
+                _shared = False
+    return _shared or None
+
+def _shared_key(sh, worksheet_name):
+    return f"{sh.id}/{worksheet_name}"
+
+def _fetch_table(sh, worksheet_name):
+    # Runs on the fetch pool: the shared cache first, then Sheets (filling
+    # it). Returns (generation, raw frame); generation is None without a
+    # shared cache. It is read before the sheet, so a write landing in
+    # between makes the fill stale and put() refuses it.
+    store = _get_shared()
+    if store is None:
+        return None, _read_worksheet(sh, worksheet_name)
+    key = _shared_key(sh, worksheet_name)
+    gen, df = store.get(key)
+    if df is None:
+        df = _read_worksheet(sh, worksheet_name)
+        store.put(key, gen, df)
+    return gen, df
+
+def _loaded(worksheet_name, gen):
+    # Remember which shared generation this session's copy was loaded at
+    if gen is not None:
+        st.session_state.setdefault("gs_gen", {})[worksheet_name] = gen
+
+def _polled_generations(sh, worksheet_names):
+    # Current generations, from a per-process snapshot refreshed every _SHARED_POLL
+    global _shared_polled
+    store = _get_shared()
+    keys = [_shared_key(sh, n) for n in worksheet_names]
+    with _shared_lock:
+        stale = time.monotonic() - _shared_polled > _SHARED_POLL
+    if stale or any(k not in _shared_gens for k in keys):
+        gens = store.generations(set(keys) | set(_shared_gens))
+        with _shared_lock:
+            _shared_gens.update(gens)
+            _shared_polled = time.monotonic()
+    return [_shared_gens.get(k, 0) for k in keys]
+
+def _check_shared(worksheet_names):
+    # Drop this session's copies of tables another process has written to
+    # since they were loaded (its own writes move the generation it keeps)
+    seen = st.session_state.get("gs_gen")
+    if not seen or _get_shared() is None:
+        return
+    names = list(worksheet_names)
+    if any(n in _TOMBSTONE_FILTERS for n in names):
+        names.append("tombstones")
+    # Tables with unsent writes keep them until the transaction ends
+    tx = _active_tx()
+    names = [n for n in dict.fromkeys(names) if n in seen and (tx is None or n not in tx.saved)]
+    if not names:
+        return
+    _, sh = _get_connection()
+    changed = [n for n, gen in zip(names, _polled_generations(sh, names)) if gen != seen[n]]
+    for n in changed:
+        del seen[n]
+        _drop_cache(n)
+    if "tombstones" in changed:
+        # Deletes made elsewhere: hide them in the copies we keep
+        for name in _TOMBSTONE_FILTERS:
+            cache_key = f"gs_cache_{name}"
+            if cache_key in st.session_state:
+                _set_cache(name, _apply_tombstones(name, st.session_state[cache_key]))
+            elif f"gs_cols_{name}" in st.session_state:
+                _bump(name)
+
+def _publish(sh, worksheet_names, own=True):
+    # Invalidate the shared copies after a write. own: this session's
+    # copies already include the write, so they stay valid. Reads in flight
+    # may have started before it, later misses must not join them
+    with _inflight_lock:
+        for n in worksheet_names:
+            _inflight.pop((sh.id, n), None)
+    store = _get_shared()
+    if store is None:
+        return
+    for n in worksheet_names:
+        key = _shared_key(sh, n)
+        gen = store.invalidate(key)
+        with _shared_lock:
+            _shared_gens[key] = gen
+        if own:
+            seen = st.session_state.get("gs_gen")
+            if seen is not None and n in seen:
+                seen[n] = gen
+
+def _forget_inflight(key, fut):
+    with _inflight_lock:
+        if _inflight.get(key) is fut:
+            del _inflight[key]
+
+def _submit_fetch(sh, worksheet_name):
+    # Join an in-flight read of the same table (from any session) instead of issuing another
+    key = (sh.id, worksheet_name)
+    created = False
+    with _inflight_lock:
+        fut = _inflight.get(key)
+        if fut is None:
+            fut = _fetch_pool.submit(_fetch_table, sh, worksheet_name)
+            _inflight[key] = fut
+            created = True
+    if created:
+        fut.add_done_callback(lambda f: _forget_inflight(key, f))
+    return fut
+
+def _project(df, columns):
+    if columns is None:
         return df
-        
-    headers = data[0]
-    # print(f"DEBUG: Sheet '{worksheet_name}' RAW HEADERS: {headers}")
-    rows = data[1:]
+    return df.reindex(columns=columns) if df.empty else df[columns]
+
+def _get_df(worksheet_name, columns=None):
+    # columns: read (and cache) only those, see _get_columns
+    if OFFLINE:
+        return _project(_get_local_df(worksheet_name), columns)
+
+    # Cache key
+    cache_key = f"gs_cache_{worksheet_name}"
+    _check_shared((worksheet_name,))
     
-    # Handle duplicate headers if they exist by strictly creating DF
-    df = pd.DataFrame(rows, columns=headers)
+    # Return from cache if available
+    if cache_key in st.session_state:
+        # print(f"DEBUG: Reading '{worksheet_name}' from CACHE")
+        return _project(st.session_state[cache_key], columns)
     
-    # Clean whitespace from headers just in case
-    df.columns = df.columns.str.strip()
+    if columns is not None and _get_shared() is None:
+        # With a shared cache the whole table is fetched once per host
+        # instead, which costs less quota than columns per session
+        return _get_columns(worksheet_name, columns)
+
+    # print(f"Reading sheet: {worksheet_name} from API")
+    _, sh = _get_connection()
+    df, gen = _widen_columns(sh, worksheet_name), None
+    if df is None:
+        # The fetched frame may be shared with other sessions, keep a private copy
+        gen, df = _submit_fetch(sh, worksheet_name).result()
+        df = df.copy()
     
-    # Save to Cache
-    st.session_state[cache_key] = df
+    # Save to Cache (empty results too), soft-deleted rows already dropped
+    st.session_state[cache_key] = _apply_tombstones(worksheet_name, df)
+    _drop_columns(worksheet_name)
+    _loaded(worksheet_name, gen)
     
-    return df
+    return _project(st.session_state[cache_key], columns)
 
-def _append_row(worksheet_name, row_data):
+# --- Column projection ---
+# Narrow reads fetch single columns and keep them in a per-session frame
+# (gs_cols_<table>, raw rows, tombstones not applied) that grows as wider
+# reads ask for more; a full read then only fetches what is still missing.
+# The full table cache, once loaded, serves every projection.
+#
+# Columns are joined by row position, so every widening re-reads the first
+# column (ids, always filled) in the same request, and any difference from
+# the frame's copy (rows added, deleted or moved by another session or the
+# compactor) makes it read all its columns again.
+#
+# The app's pages prefetch whole tables, since their queries filter and
+# join whole rows, so in the app this path stays idle. It serves callers
+# that want a few columns of a large table without a page around them:
+# export_history or the list helpers called from a script, a job or a
+# notebook. With a shared cache it is off, a whole table fetched once per
+# host costs less quota than columns per session.
+
+def _fetch_columns(sh, worksheet_name, columns):
+    # The session's column frame, widened to include columns
+    key = f"gs_cols_{worksheet_name}"
+    part = st.session_state.get(key)
+    missing = [c for c in dict.fromkeys(columns) if part is None or c not in part.columns]
+    if not missing:
+        return part
+    cols = _read_columns(sh, worksheet_name, missing, anchor=True)
+    if part is not None and cols:
+        anchor = next(iter(cols))
+        ids = cols.pop(anchor) if anchor in part.columns else None
+        if (ids is None or len(ids) > len(part) or ids + [""] * (len(part) - len(ids)) != part[anchor].tolist()
+                or any(len(v) > len(part) for v in cols.values())):
+            # The sheet's rows moved since the frame was started: read it all again
+            cols = _read_columns(sh, worksheet_name, list(part.columns) + missing, anchor=True)
+            part = None
+            _bump(worksheet_name)
+    rows = len(part) if part is not None else max((len(v) for v in cols.values()), default=0)
+    new = pd.DataFrame({c: v + [""] * (rows - len(v)) for c, v in cols.items()}, index=pd.RangeIndex(rows))
+    part = new if part is None else pd.concat([part, new], axis=1)
+    st.session_state[key] = part
+    return part
+
+def _cache_keys(worksheet_name):
+    return (f"gs_cache_{worksheet_name}", f"gs_cols_{worksheet_name}", f"gs_colsf_{worksheet_name}")
+
+def _drop_columns(worksheet_name):
+    st.session_state.pop(f"gs_cols_{worksheet_name}", None)
+    st.session_state.pop(f"gs_colsf_{worksheet_name}", None)
+
+def _get_columns(worksheet_name, columns):
     _, sh = _get_connection()
-    try:
-        ws = sh.worksheet(worksheet_name)
-    except gspread.WorksheetNotFound:
-         # Lowercase fallback
-         all_ws = {w.title.lower(): w for w in sh.worksheets()}
-         ws = all_ws.get(worksheet_name.lower())
-         if not ws:
-             raise ValueError(f"Worksheet {worksheet_name} not found")
-             
-    ws.append_row(row_data)
+    need = list(columns)
+    if worksheet_name in _TOMBSTONE_FILTERS:
+        need.append(_TOMBSTONE_FILTERS[worksheet_name][1])
+    part = _fetch_columns(sh, worksheet_name, need)
+    if part.empty:
+        return pd.DataFrame(columns=columns)
+    # Filtered once per (column frame, tombstones) pair; both are replaced,
+    # never changed in place, when they move
+    key = f"gs_colsf_{worksheet_name}"
+    tomb = _get_df("tombstones") if worksheet_name in _TOMBSTONE_FILTERS else None
+    hit = st.session_state.get(key)
+    if hit is None or hit[0] is not part or hit[1] is not tomb:
+        hit = (part, tomb, _apply_tombstones(worksheet_name, part))
+        st.session_state[key] = hit
+    return _project(hit[2], columns)
+
+def _widen_columns(sh, worksheet_name):
+    # Full read on top of a column frame: fetch only the missing columns
+    part = st.session_state.get(f"gs_cols_{worksheet_name}")
+    header = _headers.get((sh.id, worksheet_name))
+    if part is None or not header or len(set(header)) < len(header):
+        return None
+    return _fetch_columns(sh, worksheet_name, header)[header]
+
+def table_versions(worksheet_names):
+    # Per-session counters bumped whenever a cached table is written or
+    # dropped. Offline the mirror version is folded in, so rows pulled by
+    # the sync engine count as a change too; with a shared cache, writes
+    # by other processes drop (and so bump) the tables they touched.
+    _check_shared(worksheet_names)
+    vers = st.session_state.get("gs_tver", {})
+    if OFFLINE:
+        return tuple((vers.get(n, 0),) + _local_version(n) for n in worksheet_names)
+    return tuple(vers.get(n, 0) for n in worksheet_names)
+
+def _bump(worksheet_name):
+    _touch(worksheet_name)
+    vers = st.session_state.setdefault("gs_tver", {})
+    vers[worksheet_name] = vers.get(worksheet_name, 0) + 1
+
+def _set_cache(worksheet_name, df):
+    _touch(worksheet_name)
+    st.session_state[f"gs_cache_{worksheet_name}"] = df
+    _drop_columns(worksheet_name)
+    _bump(worksheet_name)
+
+def _drop_cache(worksheet_name):
+    _touch(worksheet_name)
+    st.session_state.pop(f"gs_cache_{worksheet_name}", None)
+    _drop_columns(worksheet_name)
+    _bump(worksheet_name)
+
+def _memoize(*tables):
+    # Memoize a pure read for this session, keyed on its arguments; the
+    # entry keeps the versions of the tables it read and is replaced once
+    # they move. Bounded, least recently used go first.
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args):
+            memo = st.session_state.setdefault("gs_memo", OrderedDict())
+            key = (fn.__name__, args)
+            versions = table_versions(tables)
+            if key in memo and memo[key][0] == versions:
+                memo.move_to_end(key)
+                return memo[key][1]
+            value = fn(*args)
+            memo[key] = (versions, value)
+            memo.move_to_end(key)
+            while len(memo) > _MEMO_SIZE:
+                memo.popitem(last=False)
+            return value
+        return inner
+    return wrap
+
+def prefetch(worksheet_names):
+    # Load every uncached table in worksheet_names in one parallel wave
+    if OFFLINE:
+        # Local reads, nothing to overlap
+        for n in worksheet_names:
+            _get_local_df(n)
+        return
+
+    names = list(worksheet_names)
+    if any(n in _TOMBSTONE_FILTERS for n in names):
+        # Needed to filter those, load it in the same wave (and store it first)
+        names.insert(0, "tombstones")
+    _check_shared(names)
+    missing = [n for n in dict.fromkeys(names) if f"gs_cache_{n}" not in st.session_state]
+    if not missing:
+        return
     
+    # Connect on the script thread, workers must not touch st.*
+    _, sh = _get_connection()
+    futures = {n: _submit_fetch(sh, n) for n in missing}
+    for n, fut in futures.items():
+        gen, df = fut.result()
+        st.session_state[f"gs_cache_{n}"] = _apply_tombstones(n, df.copy())
+        _drop_columns(n)
+        _loaded(n, gen)
+
+def _cache_append(worksheet_name, rows):
     # Update Cache
     cache_key = f"gs_cache_{worksheet_name}"
     if cache_key in st.session_state:
         df = st.session_state[cache_key]
-        if not df.empty:
+        if len(df.columns) > 0:
             # Convert row_data to strings to match WS behavior
-            str_row = [str(item) for item in row_data]
-            # Create a 1-row DF
-            new_row_df = pd.DataFrame([str_row], columns=df.columns)
+            str_rows = [[str(item) for item in row] for row in rows]
+            new_rows_df = pd.DataFrame(str_rows, columns=df.columns)
             # Concat
-            st.session_state[cache_key] = pd.concat([df, new_row_df], ignore_index=True)
+            before = table_versions((worksheet_name,))
+            _set_cache(worksheet_name, pd.concat([df, new_rows_df], ignore_index=True))
+            _update_derived(f"gs_idx_{worksheet_name}", (worksheet_name,), before,
+                            lambda idx: _index_rows(idx, df.columns, len(df), str_rows))
         else:
             # If df was empty, we can't easily append without headers.
             # Invalidate cache so next read fetches with new headers/data
-            del st.session_state[cache_key]
+            _drop_cache(worksheet_name)
+    elif f"gs_cols_{worksheet_name}" in st.session_state:
+        _cols_append(worksheet_name, rows)
+
+def _cols_append(worksheet_name, rows):
+    # Rows are in header order, keep the cached columns of them
+    _touch(worksheet_name)
+    part = st.session_state[f"gs_cols_{worksheet_name}"]
+    _, sh = _get_connection()
+    header = _headers.get((sh.id, worksheet_name))
+    if not header or len(set(header)) < len(header) or any(len(r) != len(header) for r in rows):
+        _drop_cache(worksheet_name)
+        return
+    pos = {c: i for i, c in enumerate(header)}
+    new = pd.DataFrame({c: [str(row[pos[c]]) for row in rows] for c in part.columns})
+    grown = pd.concat([part, new], ignore_index=True)
+    st.session_state[f"gs_cols_{worksheet_name}"] = grown
+    # New rows are live, extend the filtered frame rather than refilter
+    hit = st.session_state.get(f"gs_colsf_{worksheet_name}")
+    if hit is not None and hit[0] is part:
+        st.session_state[f"gs_colsf_{worksheet_name}"] = (grown, hit[1], pd.concat([hit[2], new], ignore_index=True))
+    _bump(worksheet_name)
+
+def _append_row(worksheet_name, row_data):
+    _append_rows(worksheet_name, [row_data])
+
+def _append_rows(worksheet_name, rows):
+    if not rows:
+        return
+    if OFFLINE:
+        ver_key = f"gs_ver_{worksheet_name}"
+        before = st.session_state.get(ver_key)
+        fresh = before is not None and before == _local_version(worksheet_name)
+        version = _get_mirror().append(worksheet_name, rows)
+        _sync.kick()
+        if fresh and version == before[0] + 1:
+            # Only our own write happened since the cache was loaded
+            _cache_append(worksheet_name, rows)
+            st.session_state[ver_key] = (version,) + before[1:]
+        else:
+            _drop_cache(worksheet_name)
+        return
+
+    tx = _active_tx()
+    if tx is not None:
+        # Sent on commit, so the rows can only show in the full cached table:
+        # a column read widened from the sheet meanwhile would not have them
+        _get_df(worksheet_name)
+        tx.append(worksheet_name, rows)
+        _cache_append(worksheet_name, rows)
+        return
+    
+    _, sh = _get_connection()
+    ws = _worksheet(sh, worksheet_name)
+    ws.append_rows(rows)
+    _cache_append(worksheet_name, rows)
+    _publish(sh, (worksheet_name,))
 
 def _replace_sheet_data(worksheet_name, df):
+    if OFFLINE:
+        _get_mirror().replace(worksheet_name, df.columns.tolist(), df.values.tolist())
+        _sync.kick()
+        _set_cache(worksheet_name, df.copy())
+        st.session_state[f"gs_ver_{worksheet_name}"] = _local_version(worksheet_name)
+        return
+
     _, sh = _get_connection()
+    tx = _active_tx()
+    if tx is not None:
+        if worksheet_name not in _worksheet_ids(sh):
+            sh.add_worksheet(title=worksheet_name, rows=100, cols=20)
+            _ws_ids.pop(sh.id, None)
+        tx.replace(worksheet_name, df.copy())
+        _set_cache(worksheet_name, df.copy())
+        return
+    
     try:
-        ws = sh.worksheet(worksheet_name)
+        ws = _worksheet(sh, worksheet_name)
     except gspread.WorksheetNotFound:
         ws = sh.add_worksheet(title=worksheet_name, rows=100, cols=20)
         
@@ -153,120 +831,656 @@ def _replace_sheet_data(worksheet_name, df):
             ws.update([df.columns.values.tolist()])
             
     # Update Cache
-    st.session_state[f"gs_cache_{worksheet_name}"] = df.copy()
+    _set_cache(worksheet_name, df.copy())
+    _publish(sh, (worksheet_name,))
 
-# --- Implementation ---
+def _tombstoned_ids(table, tomb=None):
+    # Ids of soft-deleted rows of table, as strings
+    tomb = _get_df("tombstones") if tomb is None else tomb
+    if tomb.empty:
+        return set()
+    return set(tomb.loc[tomb['table'] == table, 'row_id'].astype(str))
 
-def init_db():
-    _, sh = _get_connection()
-    # Define schema with default headers
-    schema = {
-        "exercises": ["id", "name", "target_muscle", "instructions", "difficulty", "category"],
-        "workouts": ["id", "timestamp", "total_volume", "session_name", "duration_minutes"],
-        "log_entries": ["id", "workout_id", "exercise_id", "set_order", "weight", "reps"],
-        "sessions": ["id", "name", "created_at"],
-        "session_items": ["id", "session_id", "exercise_id", "item_order"]
+def _tombstone_mask(worksheet_name, df, tomb):
+    # True for rows hidden by a tombstone (vectorized, one isin per table)
+    src, col = _TOMBSTONE_FILTERS[worksheet_name]
+    if df.empty:
+        return np.zeros(len(df), dtype=bool)
+    dead = _tombstoned_ids(src, tomb)
+    if not dead:
+        return np.zeros(len(df), dtype=bool)
+    return df[col].astype(str).isin(dead).to_numpy()
+
+def _apply_tombstones(worksheet_name, df):
+    if worksheet_name not in _TOMBSTONE_FILTERS or df.empty:
+        return df
+    mask = _tombstone_mask(worksheet_name, df, _get_df("tombstones"))
+    if not mask.any():
+        return df
+    if 'id' in df.columns:
+        # Rows hidden with a tombstoned parent keep their ids, see _max_dead_id
+        hidden = pd.to_numeric(df.loc[mask, 'id'], errors='coerce').dropna()
+        if not hidden.empty:
+            seen = st.session_state.setdefault("gs_hidden_ids", {})
+            seen[worksheet_name] = max(seen.get(worksheet_name, 0), int(hidden.max()))
+    return df[~mask].reset_index(drop=True)
+
+@_memoize("tombstones")
+def _max_tombstoned_id(table):
+    ids = pd.to_numeric(pd.Series(list(_tombstoned_ids(table)), dtype=object), errors='coerce').dropna()
+    return int(ids.max()) if not ids.empty else 0
+
+def _max_dead_id(table):
+    # Tombstoned ids, and the ids of rows hidden with them, stay reserved
+    # until compaction, so new rows never get hidden or collide with them
+    return max(_max_tombstoned_id(table), st.session_state.get("gs_hidden_ids", {}).get(table, 0))
+
+def _tombstone(table, row_id):
+    # O(1) delete: one appended row instead of rewriting the sheets
+    deleted_at = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    _append_row("tombstones", [table, str(row_id), deleted_at])
+    
+    # Hide it (and its children) in this session's caches right away
+    for name, (src, _) in _TOMBSTONE_FILTERS.items():
+        cache_key = f"gs_cache_{name}"
+        if src == table and cache_key in st.session_state:
+            _set_cache(name, _apply_tombstones(name, st.session_state[cache_key]))
+            if OFFLINE and f"gs_ver_{name}" in st.session_state:
+                st.session_state[f"gs_ver_{name}"] = _local_version(name)
+        elif src == table and f"gs_cols_{name}" in st.session_state:
+            # Filtered when read, but memoized results must go
+            _bump(name)
+    _start_compactor()
+
+def _start_compactor():
+    global _compactor
+    with _compactor_lock:
+        _compact_pending.add(_current_tenant())
+        if _compactor is None and _COMPACTOR:
+            _compactor = threading.Thread(target=_compaction_loop, name="wlog-compact", daemon=True)
+            _compactor.start()
+    _compact_wake.set()
+
+def _compaction_loop():
+    while True:
+        _compact_wake.wait(_COMPACT_INTERVAL)
+        _compact_wake.clear()
+        _compaction_pass()
+
+def _compaction_pass():
+    # Only spreadsheets that got a tombstone since their last pass: with
+    # none, the ratio can only have gone down
+    with _compactor_lock:
+        tenants = set(_compact_pending)
+        _compact_pending.clear()
+    for tenant in tenants:
+        try:
+            _compact(None if OFFLINE else _connection(tenant)[1], False)
+        except Exception:
+            # Tombstones keep the data correct meanwhile, retry next round
+            with _compactor_lock:
+                _compact_pending.add(tenant)
+
+def compact(force=False):
+    # Physically drop tombstoned rows (and the tombstones) once they make up
+    # _COMPACT_RATIO of the affected tables, in this session's spreadsheet.
+    # Returns the number of data rows removed.
+    return _compact(None if OFFLINE else _get_connection()[1], force)
+
+@contextlib.contextmanager
+def _rows_lock(sh):
+    # Held from reading row positions to writing by them: this process's
+    # compactor and commits, and every process sharing the store, take turns
+    # on the spreadsheet
+    with _compactor_lock:
+        lock = _row_locks.setdefault(sh.id, threading.Lock())
+    with lock:
+        store = _get_shared()
+        if store is None:
+            yield
+        else:
+            with store.lock(f"rows/{sh.id}"):
+                yield
+
+def _compaction_reads(sh, names):
+    futures = {n: _compact_pool.submit(_read_worksheet, sh, n) for n in names}
+    return {n: f.result() for n, f in futures.items()}
+
+def _compact(sh, force):
+    # Also runs on the compactor thread, so it reads the sheets directly
+    # and never touches st.session_state
+    names = ["tombstones"] + list(_TOMBSTONE_FILTERS)
+    if not OFFLINE:
+        # The check needs no lock: tombstones alone first, with none there
+        # is nothing to drop; then the tables, for the ratio
+        tomb = _read_worksheet(sh, "tombstones")
+        if tomb.empty:
+            return 0
+        if not force:
+            raw = _compaction_reads(sh, _TOMBSTONE_FILTERS)
+            raw["tombstones"] = tomb
+            if not _compaction_drops(raw, False):
+                return 0
+    with (_compact_lock if OFFLINE else _rows_lock(sh)):
+        if OFFLINE:
+            mirror = _get_mirror()
+            with mirror.locked():
+                raw = {n: mirror.read_df(n)[0] for n in names}
+                drops = _compaction_drops(raw, force)
+                for n, mask in drops.items():
+                    mirror.replace(n, raw[n].columns.tolist(), raw[n][~mask].values.tolist())
+            if drops:
+                _sync.kick()
+            return sum(int(m.sum()) for n, m in drops.items() if n != "tombstones")
+        
+        # Straight from the sheets: delete positions must not come from a
+        # shared copy that could be behind. Read again under the lock, the
+        # rows may have moved since the check
+        raw = _compaction_reads(sh, names)
+        drops = _compaction_drops(raw, force)
+        if not drops:
+            return 0
+        
+        # Every table in one request; appends landing meanwhile go below the
+        # positions we read, so they are untouched
+        sheet_ids = _worksheet_ids(sh)
+        requests = []
+        for n, mask in drops.items():
+            requests += _delete_rows_requests(sheet_ids[n], np.flatnonzero(mask))
+        sh.batch_update({"requests": requests})
+        # Shared raw frames must go: a stale one next to the shrunk
+        # tombstones would show the deleted rows again
+        _publish(sh, drops, own=False)
+        return sum(int(m.sum()) for n, m in drops.items() if n != "tombstones")
+
+def _compaction_drops(raw, force):
+    # name -> bool mask of raw rows to delete, or {} if below the threshold
+    tomb = raw["tombstones"]
+    if tomb.empty:
+        return {}
+    drops = {n: _tombstone_mask(n, raw[n], tomb) for n in _TOMBSTONE_FILTERS}
+    dead = sum(int(m.sum()) for m in drops.values())
+    total = sum(len(raw[n]) for n in _TOMBSTONE_FILTERS)
+    if not force and (total == 0 or dead / total < _COMPACT_RATIO):
+        return {}
+    # The tombstones we just applied go too
+    drops["tombstones"] = tomb['table'].isin(set(v[0] for v in _TOMBSTONE_FILTERS.values())).to_numpy()
+    return {n: m for n, m in drops.items() if m.any()}
+
+def sync_status():
+    # None when online-only; otherwise what is still waiting to reach the sheet
+    if not OFFLINE:
+        return None
+    pending = _get_mirror().pending_counts()
+    return {
+        "pending_rows": sum(p["rows"] for p in pending.values()),
+        "pending_tables": [t for t, p in pending.items() if p["replace"]],
+        "last_sync": _sync.last_sync,
+        "last_error": _sync.last_error,
     }
+
+def _worksheet_ids(sh):
+    # sheetIds never change for a worksheet, one metadata call per spreadsheet
+    if sh.id not in _ws_ids:
+        _ws_ids[sh.id] = {ws.title: ws.id for ws in sh.worksheets()}
+    return _ws_ids[sh.id]
+
+def _col_letter(n):
+    # 1 -> A, 27 -> AA
+    return gspread.utils.rowcol_to_a1(1, n)[:-1]
+
+def _delete_rows_requests(sheet_id, positions):
+    # Data-row positions (0 = first row under the header) -> deleteDimension
+    # requests, one per contiguous run, bottom-up so earlier deletes don't
+    # shift the rows later ones point at
+    runs = []
+    for p in sorted(int(p) for p in positions):
+        if runs and runs[-1][1] == p:
+            runs[-1][1] = p + 1
+        else:
+            runs.append([p, p + 1])
+    return [
+        {"deleteDimension": {"range": {
+            "sheetId": sheet_id, "dimension": "ROWS",
+            "startIndex": start + 1, "endIndex": end + 1,
+        }}}
+        for start, end in reversed(runs)
+    ]
+
+def _cell_data(value):
+    if isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, bool):
+        return {"userEnteredValue": {"numberValue": value.item() if hasattr(value, "item") else value}}
+    return {"userEnteredValue": {"stringValue": "" if value is None else str(value)}}
+
+def _update_cells_request(sheet_id, position, column, value):
+    # position: data row (0 = first row under the header), column 0-based
+    return {"updateCells": {
+        "start": {"sheetId": sheet_id, "rowIndex": position + 1, "columnIndex": column},
+        "rows": [{"values": [_cell_data(value)]}],
+        "fields": "userEnteredValue",
+    }}
+
+def _append_cells_request(sheet_id, rows):
+    return {"appendCells": {
+        "sheetId": sheet_id,
+        "rows": [{"values": [_cell_data(v) for v in row]} for row in rows],
+        "fields": "userEnteredValue",
+    }}
+
+# --- Transactions ---
+# transaction() buffers the writes made inside it and sends them as one
+# batch_update. Rows to update or delete are found by id (or key column)
+# at commit time, from one fresh read of those columns, and every request
+# addresses them as the requests before it left the sheet.
+
+class _Transaction:
+    def __init__(self):
+        self.ops = []
+        # table -> its cache entries from before the first write, for rollback
+        self.saved = {}
+        # table -> header, to address columns
+        self.columns = {}
+        # Tables the sheet turned out to disagree with at commit
+        self.stale = set()
     
-    # Clean check: Get titles, normalize to lowercase for check
-    existing_titles_map = {ws.title.lower(): ws.title for ws in sh.worksheets()}
+    def touch(self, worksheet_name):
+        if worksheet_name not in self.saved:
+            self.saved[worksheet_name] = {k: st.session_state[k] for k in _cache_keys(worksheet_name)
+                                          if k in st.session_state}
     
-    for table, columns in schema.items():
-        if table.lower() not in existing_titles_map:
-            # Create new
-            ws = sh.add_worksheet(title=table, rows=100, cols=20)
-            ws.append_row(columns)
-        else:
-            # Check if empty, if so write headers
-            real_title = existing_titles_map[table.lower()]
-            ws = sh.worksheet(real_title)
-            if not ws.get_all_values():
-                ws.append_row(columns)
+    def _header(self, worksheet_name):
+        if worksheet_name not in self.columns:
+            self.columns[worksheet_name] = _get_df(worksheet_name).columns
+        return self.columns[worksheet_name]
+    
+    def append(self, worksheet_name, rows):
+        self.ops.append(("append", worksheet_name, rows))
+    
+    def update(self, worksheet_name, row_id, cells):
+        # cells: {column: value} for the row with this id
+        self._header(worksheet_name)
+        self.ops.append(("update", worksheet_name, str(row_id), cells))
+    
+    def delete(self, worksheet_name, column, values):
+        # Every row whose column holds one of values
+        self._header(worksheet_name)
+        self.ops.append(("delete", worksheet_name, column, {str(v) for v in values}))
+    
+    def replace(self, worksheet_name, df):
+        self.ops.append(("replace", worksheet_name, df))
+    
+    def commit(self, sh):
+        # Columns that locate rows, and which of them must come from the sheet
+        keys, read, replaced = {}, [], set()
+        for op in self.ops:
+            kind, table = op[0], op[1]
+            if kind == "replace":
+                replaced.add(table)
+            elif kind in ("update", "delete"):
+                col = 'id' if kind == "update" else op[2]
+                if col not in keys.setdefault(table, set()) and table not in replaced:
+                    read.append((table, col))
+                keys[table].add(col)
+        
+        sheet_ids = _worksheet_ids(sh)
+        # The compactor deletes rows too, keep it out between read and write.
+        # Appends address no rows and land below any positions it read
+        moves = any(op[0] != "append" for op in self.ops)
+        with (_rows_lock(sh) if moves else contextlib.nullcontext()):
+            cols = {t: {} for t in keys}
+            if read:
+                ranges = []
+                for table, col in read:
+                    letter = _col_letter(self.columns[table].get_loc(col) + 1)
+                    ranges.append(f"'{table}'!{letter}:{letter}")
+                resp = sh.values_batch_get(ranges)
+                for (table, col), vr in zip(read, resp.get("valueRanges", [])):
+                    values = [r[0] if r else "" for r in vr.get("values", [])]
+                    if not values or values[0].strip() != col:
+                        self.stale.add(table)
+                        raise ValueError(f"Unexpected header in '{table}', expected '{col}' column")
+                    cols[table][col] = values[1:]
+                for found in cols.values():
+                    # Sheets trims trailing blanks per column
+                    height = max((len(v) for v in found.values()), default=0)
+                    for v in found.values():
+                        v.extend([""] * (height - len(v)))
+            
+            requests = []
+            for op in self.ops:
+                kind, table = op[0], op[1]
+                sheet_id = sheet_ids[table]
+                tracked = cols.get(table, {})
+                if kind == "append":
+                    requests.append(_append_cells_request(sheet_id, op[2]))
+                    for col, values in tracked.items():
+                        i = self.columns[table].get_loc(col)
+                        values.extend(str(r[i]) if i < len(r) else "" for r in op[2])
+                elif kind == "update":
+                    row_id, cells = op[2], op[3]
+                    found = [p for p, v in enumerate(tracked['id']) if v == row_id]
+                    if len(found) != 1:
+                        self.stale.add(table)
+                    if not found:
+                        raise ValueError(f"Row {row_id} of '{table}' is gone, reload and try again")
+                    if len(found) > 1:
+                        raise ValueError(f"Id {row_id} matches {len(found)} rows of '{table}', not updating any")
+                    pos = found[0]
+                    for col, value in cells.items():
+                        requests.append(_update_cells_request(sheet_id, pos, self.columns[table].get_loc(col), value))
+                        if col in tracked:
+                            tracked[col][pos] = str(value)
+                elif kind == "delete":
+                    gone = {p for p, v in enumerate(tracked[op[2]]) if v in op[3]}
+                    requests += _delete_rows_requests(sheet_id, gone)
+                    for col in tracked:
+                        tracked[col] = [v for p, v in enumerate(tracked[col]) if p not in gone]
+                else:
+                    # Clear the values, then the new contents go to the top
+                    df = op[2]
+                    requests.append({"updateCells": {"range": {"sheetId": sheet_id}, "fields": "userEnteredValue"}})
+                    if len(df.columns) > 0:
+                        requests.append(_append_cells_request(sheet_id, [df.columns.tolist()] + df.values.tolist()))
+                    self.columns[table] = df.columns
+                    cols[table] = {c: df[c].astype(str).tolist() for c in keys.get(table, ())}
+            
+            if requests:
+                sh.batch_update({"requests": requests})
+    
+    def rollback(self):
+        # Put the caches back; the version bump drops anything memoized or
+        # derived from the unsent writes
+        for name, entries in self.saved.items():
+            for key in _cache_keys(name):
+                st.session_state.pop(key, None)
+            for key, value in entries.items():
+                st.session_state[key] = value
+            _bump(name)
+
+def _active_tx():
+    return st.session_state.get("gs_tx")
+
+def _touch(worksheet_name):
+    # Called before a table's caches change
+    tx = _active_tx()
+    if tx is not None:
+        tx.touch(worksheet_name)
+
+@contextlib.contextmanager
+def transaction():
+    # Unit of work: appends, cell updates, row deletes and rewrites made by
+    # the functions here inside the block show in this session's caches
+    # right away and reach the sheet in one batch_update when it ends. If
+    # the block raises or the commit fails, nothing is written and the
+    # caches go back to how they were. Nested blocks join the outer one.
+    # Offline, writes are local and land as they are made.
+    if OFFLINE or _active_tx() is not None:
+        yield
+        return
+    tx = _Transaction()
+    st.session_state["gs_tx"] = tx
+    sh = None
+    try:
+        yield
+        if tx.ops:
+            _, sh = _get_connection()
+            tx.commit(sh)
+    except BaseException:
+        st.session_state.pop("gs_tx", None)
+        tx.rollback()
+        # Our copies are behind the sheet: the retry has to reload them
+        for name in tx.stale:
+            _drop_cache(name)
+        raise
+    st.session_state.pop("gs_tx", None)
+    if tx.ops:
+        _publish(sh, dict.fromkeys(op[1] for op in tx.ops))
+
+def _num(value, default=0.0):
+    # Sheets hands back strings; '' and junk become the default
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+def _derived(state_key, tables, build):
+    # Session state derived from tables, rebuilt when they changed under it
+    state = st.session_state.get(state_key)
+    versions = table_versions(tables)
+    if state is None or state["versions"] != versions:
+        state = build()
+        state["versions"] = versions
+        st.session_state[state_key] = state
+    return state
+
+def _update_derived(state_key, tables, before, apply):
+    # Move derived state forward by one write if it was current right
+    # before it; otherwise drop it and let the next read rebuild
+    state = st.session_state.get(state_key)
+    if state is None:
+        return
+    # Offline, the sync engine can land rows between our read and our write
+    if OFFLINE or state["versions"] != before:
+        del st.session_state[state_key]
+        return
+    try:
+        apply(state)
+    except KeyError:
+        # Touches a row we never saw, rebuild instead
+        del st.session_state[state_key]
+        return
+    state["versions"] = table_versions(tables)
+
+# --- Indexes & Queries ---
+# Hash indexes over the cached tables: column value -> row positions in the
+# cached frame. Built on first use per table version and extended in place
+# by appends, so an equality lookup costs O(matches) instead of a scan.
+
+_NO_ROWS = np.empty(0, dtype=np.intp)
+
+def _index(table, column, lower=False):
+    idx = _derived(f"gs_idx_{table}", (table,), lambda: {"columns": {}})
+    mapping = idx["columns"].get((column, lower))
+    if mapping is None:
+        keys = _get_df(table)[column].astype(str)
+        if lower:
+            keys = keys.str.lower()
+        mapping = keys.groupby(keys.to_numpy(), sort=False).indices
+        idx["columns"][(column, lower)] = mapping
+    return mapping
+
+def _index_rows(idx, columns, start, rows):
+    # Add appended rows (already strings) to every index built so far
+    for (column, lower), mapping in idx["columns"].items():
+        i = columns.get_loc(column)
+        for n, row in enumerate(rows):
+            key = row[i].lower() if lower else row[i]
+            mapping[key] = np.append(mapping.get(key, _NO_ROWS), start + n)
+
+def _lookup(table, column, value, lower=False):
+    key = str(value).lower() if lower else str(value)
+    return _index(table, column, lower).get(key, _NO_ROWS)
+
+class Query:
+    # Select over one cached table. where() narrows through the indexes;
+    # joins, ordering and limit then only touch the matching rows.
+    def __init__(self, table):
+        self.table = table
+        self._positions = None
+        self._joins = []
+        self._order = None
+        self._limit = None
+    
+    def where(self, column, value, lower=False):
+        hits = _lookup(self.table, column, value, lower)
+        self._positions = hits if self._positions is None else np.intersect1d(self._positions, hits)
+        return self
+    
+    def join(self, table, on, right_on="id"):
+        # Inner join on a key of table (first match per value); clashing
+        # column names from table get a _<table> suffix
+        self._joins.append((table, on, right_on))
+        return self
+    
+    def order_by(self, column, descending=False, numeric=False):
+        self._order = (column, descending, numeric)
+        return self
+    
+    def limit(self, n):
+        self._limit = n
+        return self
+    
+    def frame(self):
+        df = _get_df(self.table)
+        rows = df if self._positions is None else df.iloc[np.sort(self._positions)]
+        for table, on, right_on in self._joins:
+            # Only the keys on this side are looked up, not the whole index
+            idx = _index(table, right_on)
+            keys = rows[on].astype(str)
+            first = {k: idx[k][0] for k in keys.unique() if k in idx}
+            pos = keys.map(first)
+            keep = pos.notna().to_numpy()
+            right = _get_df(table).iloc[pos[keep].astype(int).to_numpy()]
+            right = right.rename(columns={c: f"{c}_{table}" for c in right.columns if c in rows.columns})
+            rows = pd.concat([rows[keep].reset_index(drop=True), right.reset_index(drop=True)], axis=1)
+        if self._order:
+            column, descending, numeric = self._order
+            keys = pd.to_numeric(rows[column], errors='coerce') if numeric else rows[column]
+            rows = rows.iloc[keys.argsort(kind='stable').to_numpy()[::-1 if descending else 1]]
+        if self._limit is not None:
+            rows = rows.iloc[:self._limit]
+        return rows.reset_index(drop=True)
+    
+    def first(self):
+        rows = self.limit(1).frame()
+        return None if rows.empty else rows.iloc[0]
+
+def query(table):
+    return Query(table)
+
+# --- Records returned to the UI ---
+# Tuples instead of a dict per row: smaller, built straight from itertuples
+
+Exercise = namedtuple("Exercise", ["id", "name", "muscle", "instructions", "difficulty", "category"])
+Session = namedtuple("Session", ["id", "name"])
+SessionExercise = namedtuple("SessionExercise", ["id", "name", "muscle"])
+WorkoutSummary = namedtuple("WorkoutSummary", ["id", "date", "volume", "session", "duration", "sets"])
+SetRow = namedtuple("SetRow", ["exercise", "weight", "reps", "muscle"])
+
+class SetColumns:
+    # The sets of one workout, column-oriented: slices of arrays shared by the
+    # whole history, so no per-set objects unless someone iterates
+    __slots__ = ("_cols", "_start", "_stop")
+    
+    def __init__(self, cols, start, stop):
+        self._cols = cols
+        self._start = start
+        self._stop = stop
+    
+    def __len__(self):
+        return self._stop - self._start
+    
+    def __getitem__(self, field):
+        return self._cols[field][self._start:self._stop]
+    
+    def __iter__(self):
+        return map(SetRow._make, zip(*(self[f] for f in SetRow._fields)))
+    
+    def to_frame(self):
+        return pd.DataFrame({f: self[f] for f in SetRow._fields})
+
+def _records(record, df):
+    return list(map(record._make, df.itertuples(index=False, name=None)))
+
+# --- Implementation ---
+
+def init_db():
+    if OFFLINE:
+        # Local tables only; the sync engine migrates the sheet when it connects
+        mirror = _get_mirror()
+        for table, columns in migrations.SCHEMA.items():
+            mirror.ensure_table(table, columns)
+        return
+    
+    # Runs pending migrations once per process, nothing on later reruns
+    _, sh = _get_connection()
+    migrations.migrate(sh)
+
+def _next_id(df):
+    # One past the largest numeric id, 1 for an empty table
+    if df.empty:
+        return 1
+    ids = pd.to_numeric(df['id'], errors='coerce').dropna()
+    return int(ids.max()) + 1 if not ids.empty else 1
+
+def _new_id(table):
+    # Next id for a table whose rows can be soft-deleted
+    return max(_next_id(_get_df(table, ["id"])), _max_dead_id(table) + 1)
 
 def seed_exercises(cursor=None):
     pass
 
+@_memoize("exercises")
 def get_all_exercises():
     df = _get_df("exercises")
     if df.empty: return []
     
     # Rename target_muscle to muscle to match app expectations
-    if 'target_muscle' in df.columns:
-        df = df.rename(columns={'target_muscle': 'muscle'})
-        
-    return df.to_dict('records')
+    return _records(Exercise, df.rename(columns={'target_muscle': 'muscle'})[list(Exercise._fields)])
 
 def add_custom_exercise(name, muscle, instructions="Custom Exercise", difficulty=1, category='Custom'):
     df = _get_df("exercises")
     
     # Check uniqueness
-    if not df.empty and name.lower() in df['name'].str.lower().values:
+    if len(_lookup("exercises", "name", name, lower=True)):
         raise ValueError("Exercise already exists.")
         
-    new_id = 1
-    if not df.empty:
-        ids = pd.to_numeric(df['id'], errors='coerce')
-        if not ids.dropna().empty:
-            new_id = ids.max() + 1
+    new_id = _next_id(df)
     row = [int(new_id), name, muscle, instructions, int(difficulty), category]
     _append_row("exercises", row)
 
 def create_workout(total_volume, session_name=None, duration_minutes=0):
-    df = _get_df("workouts")
-    new_id = 1
-    if not df.empty:
-        ids = pd.to_numeric(df['id'], errors='coerce')
-        if not ids.dropna().empty:
-            new_id = ids.max() + 1
+    new_id = _new_id("workouts")
     timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     
     row = [int(new_id), timestamp, total_volume, session_name, duration_minutes]
+    before = table_versions(_AGG_TABLES)
     _append_row("workouts", row)
+    _update_derived("gs_agg", _AGG_TABLES, before, lambda agg: _agg_add_workout(agg, new_id, timestamp, total_volume))
     return new_id
 
 def log_set(workout_id, exercise_id, weight, reps, set_order):
-    df = _get_df("log_entries")
-    new_id = 1
-    if not df.empty:
-        ids = pd.to_numeric(df['id'], errors='coerce')
-        if not ids.dropna().empty:
-            new_id = ids.max() + 1
+    new_id = _new_id("log_entries")
     row = [int(new_id), int(workout_id), int(exercise_id), int(set_order), float(weight), int(reps)]
+    before, before_pr = table_versions(_AGG_TABLES), table_versions(_PR_TABLES)
     _append_row("log_entries", row)
+    _update_derived("gs_agg", _AGG_TABLES, before, lambda agg: _agg_add_set(agg, workout_id, exercise_id, float(weight) * int(reps)))
+    _update_derived("gs_prs", _PR_TABLES, before_pr, lambda prs: _pr_add_set(prs, workout_id, exercise_id, float(weight), int(reps)))
 
+@_memoize("log_entries", "workouts")
 def get_last_performance(exercise_id):
-    # Slow operation in Sheets: Join LogEntries + Workouts
-    logs = _get_df("log_entries")
-    workouts = _get_df("workouts")
-    
-    if logs.empty or workouts.empty:
-        return None
-        
-    # Filter logs for exercise
-    ex_logs = logs[logs['exercise_id'] == exercise_id]
-    if ex_logs.empty:
-        return None
-        
-    # Merge
-    merged = pd.merge(ex_logs, workouts, left_on='workout_id', right_on='id', suffixes=('_log', '_wo'))
-    if merged.empty:
+    # This exercise's sets via the index, latest workout first
+    last = (query("log_entries").where("exercise_id", exercise_id)
+            .join("workouts", on="workout_id")
+            .order_by("workout_id", descending=True, numeric=True).first())
+    if last is None:
         return None
-        
-    # Sort by workout id desc
-    last = merged.sort_values('workout_id', ascending=False).iloc[0]
     return {
-        "weight": last['weight'], 
-        "reps": last['reps'], 
+        "weight": _num(last['weight']), 
+        "reps": int(_num(last['reps'])), 
         "date": str(last['timestamp']).split(" ")[0]
     }
 
+@_memoize("workouts")
+def _workout_dates():
+    # Distinct workout days, newest first
+    workouts = _get_df("workouts", ["timestamp"])
+    if workouts.empty: return []
+    return sorted(pd.to_datetime(workouts['timestamp']).dt.date.unique(), reverse=True)
+
 def get_streak():
-    workouts = _get_df("workouts")
-    if workouts.empty: return 0
-    
-    dates = pd.to_datetime(workouts['timestamp']).dt.date.unique()
-    dates = sorted(dates, reverse=True)
-    
+    # Not memoized itself, the answer changes at midnight
+    dates = _workout_dates()
     if not dates: return 0
     
     streak = 1
@@ -282,160 +1496,164 @@ def get_streak():
             break
     return streak
 
+@_memoize("workouts", "log_entries", "exercises")
 def get_last_workout_summary():
-    workouts = _get_df("workouts")
-    if workouts.empty: return None
-    
-    last = workouts.sort_values('id', ascending=False).iloc[0]
-    w_id = last['id']
+    last = query("workouts").order_by("id", descending=True, numeric=True).first()
+    if last is None: return None
     
-    logs = _get_df("log_entries")
-    exs = _get_df("exercises")
+    merged = (query("log_entries").where("workout_id", last['id'])
+              .join("exercises", on="exercise_id")
+              .order_by("set_order", numeric=True).frame())
     
-    w_logs = logs[logs['workout_id'] == w_id]
-    merged = pd.merge(w_logs, exs, left_on='exercise_id', right_on='id')
-    
-    sets = []
-    for _, row in merged.iterrows():
-        # Format matching tuple expected by UI (name, weight, reps)
-        sets.append((row['name'], row['weight'], row['reps']))
+    # Format matching tuple expected by UI (name, weight, reps)
+    sets = list(merged[['name', 'weight', 'reps']].itertuples(index=False, name=None))
         
     return {
         "date": last['timestamp'],
-        "volume": last['total_volume'],
+        "volume": _num(last['total_volume']),
         "sets": sets
     }
 
 # --- Session Management ---
 
 def create_session(name, exercise_ids):
-    sess = _get_df("sessions")
-    
-    # Validation / Self-Healing for Sessions Sheet
-    if sess.empty:
-         s_new_id = 1
-    else:
-         if 'id' not in sess.columns:
-             # Header corrupt, fix it
-             _replace_sheet_data("sessions", pd.DataFrame(columns=["id", "name", "created_at"]))
-             sess = _get_df("sessions")
-             
-         sess['id'] = pd.to_numeric(sess['id'], errors='coerce')
-         if sess['id'].dropna().empty:
-             s_new_id = 1
-         else:
-             s_new_id = int(sess['id'].max()) + 1
-            
-    created_at = datetime.datetime.now().strftime("%Y-%m-%d")
-    _append_row("sessions", [int(s_new_id), name, created_at])
-    
-    # Validation / Self-Healing for Items Sheet
-    items = _get_df("session_items")
-    if items.empty:
-        start_id = 1
-    else:
-        if 'id' not in items.columns:
-            _replace_sheet_data("session_items", pd.DataFrame(columns=["id", "session_id", "exercise_id", "item_order"]))
-            items = _get_df("session_items")
-            
-        items['id'] = pd.to_numeric(items['id'], errors='coerce')
-        if items['id'].dropna().empty:
-            start_id = 1
-        else:
-            start_id = int(items['id'].max()) + 1
-    
-    rows_to_add = []
-    for idx, eid in enumerate(exercise_ids):
-        rows_to_add.append([int(start_id + idx), int(s_new_id), int(eid), int(idx)])
-    
-    # Batch add manual
-    _, sh = _get_connection()
-    ws = sh.worksheet("session_items")
-    ws.append_rows(rows_to_add)
-    
-    # Invalidate Cache for session_items since we did a manual append
-    if "gs_cache_session_items" in st.session_state:
-        del st.session_state["gs_cache_session_items"]
+    with transaction():
+        s_new_id = _new_id("sessions")
+                
+        created_at = datetime.datetime.now().strftime("%Y-%m-%d")
+        _append_row("sessions", [int(s_new_id), name, created_at])
+        
+        start_id = _new_id("session_items")
+        rows_to_add = []
+        for idx, eid in enumerate(exercise_ids):
+            rows_to_add.append([int(start_id + idx), int(s_new_id), int(eid), int(idx)])
+        
+        # Batch add
+        _append_rows("session_items", rows_to_add)
 
+@_memoize("sessions")
 def get_all_sessions():
-    df = _get_df("sessions")
+    df = _get_df("sessions", ["id", "name"])
     if df.empty: return []
-    
-    required = {'id', 'name'}
-    if not required.issubset(df.columns):
-        # print(f"ERROR: sessions table missing columns. Found: {df.columns.tolist()}")
-        # Fallback: Return empty to trigger re-init button in UI
-        return []
         
-    return tuple(df[['id', 'name']].to_dict('records'))
+    return tuple(_records(Session, df[['id', 'name']]))
 
+@_memoize("session_items", "exercises")
 def get_session_details(session_id):
-    s_items = _get_df("session_items")
-    exs = _get_df("exercises")
-    
-    if s_items.empty: return []
+    # Ids may arrive as int (get_session_by_name) or str (get_all_sessions),
+    # the index keys are strings either way
+    merged = (query("session_items").where("session_id", session_id)
+              .join("exercises", on="exercise_id")
+              .order_by("item_order", numeric=True).frame())
     
-    items = s_items[s_items['session_id'] == session_id].sort_values('item_order')
-    merged = pd.merge(items, exs, left_on='exercise_id', right_on='id')
-    
-    return merged[['id_y', 'name', 'target_muscle']].rename(columns={'id_y': 'id', 'target_muscle': 'muscle'}).to_dict('records')
+    return _records(SessionExercise, merged[['id_exercises', 'name', 'target_muscle']])
 
+@_memoize("sessions")
 def get_session_by_name(name):
-    df = _get_df("sessions")
-    if df.empty: return None
-    row = df[df['name'] == name]
-    if row.empty: return None
-    return int(row.iloc[0]['id'])
+    row = query("sessions").where("name", name).first()
+    if row is None: return None
+    return int(row['id'])
+
+def _diff_items(old, exercise_ids):
+    # old: [(item id, exercise id, item_order)] in routine order. Items whose
+    # exercise stays keep their row (new order if it moved); leftover old
+    # rows are reused for leftover new exercises, then deleted or appended.
+    # Returns ({item id: {column: value}}, [item ids to delete], [(exercise id, order)])
+    pool = {}
+    for item in old:
+        pool.setdefault(str(item[1]), []).append(item)
+    changes, unmatched = {}, []
+    for order, eid in enumerate(exercise_ids):
+        matches = pool.get(str(int(eid)))
+        if matches:
+            item_id, _, item_order = matches.pop(0)
+            if str(item_order) != str(order):
+                changes[item_id] = {"item_order": order}
+        else:
+            unmatched.append((int(eid), order))
+    spare = [item for items in pool.values() for item in items]
+    spare.sort(key=lambda item: _num(item[2]))
+    for (item_id, _, _), (eid, order) in zip(spare, unmatched):
+        changes[item_id] = {"exercise_id": eid, "item_order": order}
+    deletes = [item_id for item_id, _, _ in spare[len(unmatched):]]
+    adds = unmatched[len(spare):]
+    return changes, deletes, adds
+
+def _apply_item_diff(items, changes, deletes, new_rows):
+    # The same diff on a cached session_items frame
+    items = items.copy()
+    ids = items['id'].astype(str)
+    for item_id, cells in changes.items():
+        for col, value in cells.items():
+            items.loc[ids == str(item_id), col] = str(value)
+    items = items[~ids.isin([str(d) for d in deletes])]
+    if new_rows:
+        added = pd.DataFrame([[str(v) for v in row] for row in new_rows], columns=items.columns)
+        items = pd.concat([items, added], ignore_index=True)
+    return items.reset_index(drop=True)
 
 def update_session_by_id(session_id, name, exercise_ids):
-    # This involves rewriting sessions and session_items
-    # 1. Update name
+    # Diff the routine's items against exercise_ids and write only what
+    # changed (cell updates, appended rows, deleted rows) in one transaction
     sess = _get_df("sessions")
-    sess.loc[sess['id'].astype(str) == str(session_id), 'name'] = name
-    _replace_sheet_data("sessions", sess)
+    current = sess.loc[sess['id'].astype(str) == str(session_id), 'name']
+    if current.empty:
+        raise ValueError(f"Routine {session_id} not found.")
+    rename = str(current.iloc[0]) != name
     
-    # 2. Delete old items
     items = _get_df("session_items")
-    items = items[items['session_id'].astype(str) != str(session_id)] # Keep others
-    
-    # 3. Add new items
-    start_id = 1
-    if not items.empty:
-        ids = pd.to_numeric(items['id'], errors='coerce')
-        if not ids.dropna().empty:
-            start_id = ids.max() + 1
-    new_rows = []
-    for idx, eid in enumerate(exercise_ids):
-        new_rows.append({
-            "id": int(start_id + idx),
-            "session_id": int(session_id),
-            "exercise_id": int(eid),
-            "item_order": int(idx)
-        })
-    
-    new_items_df = pd.DataFrame(new_rows)
-    final_items = pd.concat([items, new_items_df], ignore_index=True)
-    _replace_sheet_data("session_items", final_items)
+    mine = (query("session_items").where("session_id", session_id)
+            .order_by("item_order", numeric=True).frame())
+    old = list(mine[['id', 'exercise_id', 'item_order']].itertuples(index=False, name=None))
+    changes, deletes, adds = _diff_items(old, exercise_ids)
+    start_id = _new_id("session_items")
+    new_rows = [[start_id + i, int(session_id), eid, order] for i, (eid, order) in enumerate(adds)]
+    if not (rename or changes or deletes or new_rows):
+        return
+    
+    new_sess = sess.copy()
+    new_sess.loc[new_sess['id'].astype(str) == str(session_id), 'name'] = name
+    new_items = _apply_item_diff(items, changes, deletes, new_rows)
+    
+    if OFFLINE:
+        # Local rewrites; the sync engine pushes them
+        if rename:
+            _replace_sheet_data("sessions", new_sess)
+        _replace_sheet_data("session_items", new_items)
+        return
+    
+    with transaction():
+        tx = _active_tx()
+        if rename:
+            tx.update("sessions", session_id, {"name": name})
+        for item_id, cells in changes.items():
+            tx.update("session_items", item_id, cells)
+        if new_rows:
+            tx.append("session_items", new_rows)
+        if deletes:
+            tx.delete("session_items", "id", deletes)
+        if rename:
+            _set_cache("sessions", new_sess)
+        _set_cache("session_items", new_items)
+
+def update_session(name, exercise_ids, new_name=None):
+    # update_session_by_id, looked up by routine name
+    session_id = get_session_by_name(name)
+    if session_id is None:
+        raise ValueError(f"Routine '{name}' not found.")
+    update_session_by_id(session_id, new_name or name, exercise_ids)
 
 def delete_session(session_id):
-    # Filter out
-    sess = _get_df("sessions")
-    sess = sess[sess['id'].astype(str) != str(session_id)]
-    _replace_sheet_data("sessions", sess)
-    
-    items = _get_df("session_items")
-    items = items[items['session_id'].astype(str) != str(session_id)]
-    _replace_sheet_data("session_items", items)
+    # Soft delete; its items are hidden along with it
+    _tombstone("sessions", session_id)
 
 def delete_workout(workout_id):
-    w = _get_df("workouts")
-    w = w[w['id'].astype(str) != str(workout_id)]
-    _replace_sheet_data("workouts", w)
-    
-    l = _get_df("log_entries")
-    l = l[l['workout_id'].astype(str) != str(workout_id)]
-    _replace_sheet_data("log_entries", l)
+    # Soft delete; its sets are hidden along with it
+    before = table_versions(_AGG_TABLES)
+    _tombstone("workouts", workout_id)
+    _update_derived("gs_agg", _AGG_TABLES, before, lambda agg: _agg_remove_workout(agg, workout_id))
 
+@_memoize("workouts", "log_entries", "exercises")
 def get_history():
     workouts = _get_df("workouts")
     if workouts.empty: return []
@@ -443,41 +1661,60 @@ def get_history():
     logs = _get_df("log_entries")
     exs = _get_df("exercises")
     
-    # Sort workouts desc
-    workouts = workouts.sort_values('id', ascending=False)
+    # Sort workouts desc (ids are text in the sheet, compare as numbers)
+    workouts = workouts.iloc[pd.to_numeric(workouts['id'], errors='coerce').argsort(kind='stable')[::-1]]
+    
+    # One join and one sort over every set ever logged, then each workout
+    # gets a slice of the resulting columns
+    if logs.empty or exs.empty:
+        merged = pd.DataFrame(columns=['workout_id', 'set_order', 'weight', 'reps', 'name', 'target_muscle'])
+    else:
+        merged = pd.merge(logs, exs[['id', 'name', 'target_muscle']], left_on='exercise_id', right_on='id', suffixes=('', '_ex'))
+    keys = merged['workout_id'].astype(str)
+    order = pd.DataFrame({
+        'w': keys,
+        'o': pd.to_numeric(merged['set_order'], errors='coerce'),
+    }).sort_values(['w', 'o'], kind='stable').index
+    merged = merged.loc[order]
+    keys = keys.loc[order].to_numpy()
+    cols = {
+        "exercise": merged['name'].to_numpy(),
+        "weight": pd.to_numeric(merged['weight'], errors='coerce').fillna(0).to_numpy(),
+        "reps": pd.to_numeric(merged['reps'], errors='coerce').fillna(0).astype(int).to_numpy(),
+        "muscle": merged['target_muscle'].to_numpy(),
+    }
     
     history = []
-    for _, w in workouts.iterrows():
-        w_id = w['id']
-        w_logs = logs[logs['workout_id'] == w_id].sort_values('set_order')
-        
-        merged = pd.merge(w_logs, exs, left_on='exercise_id', right_on='id')
-        sets_data = []
-        for _, r in merged.iterrows():
-            sets_data.append({
-                "exercise": r['name'],
-                "weight": r['weight'],
-                "reps": r['reps'],
-                "muscle": r['target_muscle']
-            })
-            
-        history.append({
-            "id": w_id,
-            "date": w['timestamp'],
-            "volume": w['total_volume'],
-            "session": w['session_name'],
-            "duration": w['duration_minutes'],
-            "sets": sets_data
-        })
+    meta = workouts[['id', 'timestamp', 'total_volume', 'session_name', 'duration_minutes']]
+    for w_id, date, volume, session, duration in meta.itertuples(index=False, name=None):
+        start = np.searchsorted(keys, str(w_id), side='left')
+        stop = np.searchsorted(keys, str(w_id), side='right')
+        history.append(WorkoutSummary(w_id, date, _num(volume), session, duration, SetColumns(cols, start, stop)))
     return history
 
 def delete_exercise(exercise_id):
-    # This is heavy.
-    for table in ["exercises", "session_items", "log_entries"]:
-        df = _get_df(table)
-        col = 'id' if table == "exercises" else 'exercise_id'
-        df = df[df[col].astype(str) != str(exercise_id)]
-        _replace_sheet_data(table, df)
+    # Cascade: the exercise, its routine items and its logged sets
+    targets = {"exercises": "id", "session_items": "exercise_id", "log_entries": "exercise_id"}
+    
+    if OFFLINE:
+        # Local rewrites; the sync engine pushes them
+        for table, col in targets.items():
+            df = _get_df(table)
+            if not df.empty:
+                _replace_sheet_data(table, df[df[col].astype(str) != str(exercise_id)])
+        return
+    
+    # All three sheets in one transaction: either everything goes or nothing.
+    # Positions are read from the sheet at commit, so rows shifted by other
+    # sessions can't make us delete the wrong ones.
+    with transaction():
+        tx = _active_tx()
+        for table, col in targets.items():
+            df = _get_df(table)
+            if df.empty:
+                continue
+            tx.delete(table, col, [exercise_id])
+            _set_cache(table, df[df[col].astype(str) != str(exercise_id)].reset_index(drop=True))
 
 def create_default_schedule():
     # Only run if sessions empty
@@ -525,27 +1762,8 @@ def create_default_schedule():
         }
          
          # Logic to add these
-         # Ensure headers correct
          ex_df = _get_df("exercises")
-         
-         if ex_df.empty and len(ex_df.columns) == 0:
-              _replace_sheet_data("exercises", pd.DataFrame(columns=["id", "name", "target_muscle", "instructions", "difficulty", "category"]))
-              ex_df = _get_df("exercises")
-         
-         if 'id' not in ex_df.columns:
-             _, sh = _get_connection()
-             ws = sh.worksheet("exercises")
-             ws.update(range_name='A1', values=[["id", "name", "target_muscle", "instructions", "difficulty", "category"]])
-             ex_df = _get_df("exercises")
-
-         if ex_df.empty: 
-             next_id = 1
-         else:
-             ex_df['id'] = pd.to_numeric(ex_df['id'], errors='coerce')
-             if ex_df['id'].dropna().empty:
-                 next_id = 1
-             else:
-                 next_id = int(ex_df['id'].max()) + 1
+         next_id = _next_id(ex_df)
              
          new_exercises_rows = []
          final_schedule_ids = {} # Routine -> [ExIDs]
@@ -574,47 +1792,16 @@ def create_default_schedule():
                 r_ex_ids.append(eid)
             final_schedule_ids[routine] = r_ex_ids
             
-         # BATCH WRITE EXERCISES
-         if new_exercises_rows:
-             _, sh = _get_connection()
-             ws = sh.worksheet("exercises")
-             ws.append_rows(new_exercises_rows)
-             # print(f"Batch inserted {len(new_exercises_rows)} exercises.")
-             
          # Batch create sessions
          # OPTIMIZATION: Do not call create_session() in loop. Batch everything.
          
          # print("Batching sessions and items creation...")
          
          # 1. Prepare Sessions Data
-         sess = _get_df("sessions")
-         if sess.empty:
-             s_next_id = 1
-         else:
-             if 'id' not in sess.columns:
-                 _replace_sheet_data("sessions", pd.DataFrame(columns=["id", "name", "created_at"]))
-                 sess = _get_df("sessions")
-             
-             sess['id'] = pd.to_numeric(sess['id'], errors='coerce')
-             if sess['id'].dropna().empty:
-                 s_next_id = 1
-             else:
-                 s_next_id = int(sess['id'].max()) + 1
+         s_next_id = _new_id("sessions")
                  
          # 2. Prepare Items Data
-         items = _get_df("session_items")
-         if items.empty:
-             i_next_id = 1
-         else:
-             if 'id' not in items.columns:
-                 _replace_sheet_data("session_items", pd.DataFrame(columns=["id", "session_id", "exercise_id", "item_order"]))
-                 items = _get_df("session_items")
-                 
-             items['id'] = pd.to_numeric(items['id'], errors='coerce')
-             if items['id'].dropna().empty:
-                 i_next_id = 1
-             else:
-                 i_next_id = int(items['id'].max()) + 1
+         i_next_id = _new_id("session_items")
                  
          # 3. Generate Rows
          new_sess_rows = []
@@ -633,22 +1820,372 @@ def create_default_schedule():
                  new_item_rows.append([int(i_next_id), int(s_id), int(eid), int(idx)])
                  i_next_id += 1
                  
-         # 4. Batch Write
-         _, sh = _get_connection()
-         
-         if new_sess_rows:
-             ws_s = sh.worksheet("sessions")
-             ws_s.append_rows(new_sess_rows)
-             # print(f"Batch inserted {len(new_sess_rows)} sessions.")
-             
-         if new_item_rows:
-             ws_i = sh.worksheet("session_items")
-             ws_i.append_rows(new_item_rows)
-             # print(f"Batch inserted {len(new_item_rows)} session items.")
+         # 4. Batch Write: exercises, sessions and items in one request
+         with transaction():
+             if new_exercises_rows:
+                 _append_rows("exercises", new_exercises_rows)
+                 # print(f"Batch inserted {len(new_exercises_rows)} exercises.")
+                 
+             if new_sess_rows:
+                 _append_rows("sessions", new_sess_rows)
+                 # print(f"Batch inserted {len(new_sess_rows)} sessions.")
+                 
+             if new_item_rows:
+                 _append_rows("session_items", new_item_rows)
+                 # print(f"Batch inserted {len(new_item_rows)} session items.")
              
          # print("Schedule initialization complete.")
-         
-         # Invalidate all caches affected
-         for k in ["gs_cache_exercises", "gs_cache_sessions", "gs_cache_session_items"]:
-             if k in st.session_state:
-                 del st.session_state[k]
+
+# --- Aggregates & Charts ---
+# Daily buckets kept per session and moved forward by the writes below, so
+# charts never re-join the raw tables. Weeks and months are rolled up from
+# the days, and every series is downsampled before it reaches the browser.
+
+_AGG_TABLES = ("workouts", "log_entries", "exercises")
+_BUCKETS = {"day": "D", "week": "W", "month": "MS"}
+
+def _bucket_add(buckets, key, amount):
+    buckets[key] = buckets.get(key, 0) + amount
+
+@_memoize("exercises")
+def _exercise_muscles():
+    exs = _get_df("exercises", ["id", "target_muscle"])
+    if exs.empty:
+        return {}
+    return dict(zip(exs['id'].astype(str), exs['target_muscle']))
+
+def _build_aggregates():
+    # Full pass over the raw tables, only when there is nothing to update
+    agg = {
+        "workouts": {},         # workout id -> (day, total_volume)
+        "workout_muscles": {},  # workout id -> {muscle: set volume}
+        "day_volume": {},
+        "day_muscle": {},       # (day, muscle) -> set volume
+    }
+    workouts = _get_df("workouts", ["id", "timestamp", "total_volume"])
+    if workouts.empty:
+        return agg
+    
+    days = pd.to_datetime(workouts['timestamp'], errors='coerce').dt.normalize()
+    vols = pd.to_numeric(workouts['total_volume'], errors='coerce').fillna(0)
+    ok = days.notna()
+    wids = workouts['id'].astype(str)
+    agg["workouts"] = dict(zip(wids[ok], zip(days[ok], vols[ok])))
+    agg["day_volume"] = vols[ok].groupby(days[ok]).sum().to_dict()
+    
+    logs = _get_df("log_entries", ["workout_id", "exercise_id", "weight", "reps"])
+    if logs.empty:
+        return agg
+    sets = pd.DataFrame({
+        "wid": logs['workout_id'].astype(str),
+        "muscle": logs['exercise_id'].astype(str).map(_exercise_muscles()).fillna("Other"),
+        "volume": pd.to_numeric(logs['weight'], errors='coerce').fillna(0) * pd.to_numeric(logs['reps'], errors='coerce').fillna(0),
+    })
+    sets["day"] = sets["wid"].map({w: d for w, (d, _) in agg["workouts"].items()})
+    sets = sets.dropna(subset=["day"])
+    per_workout = sets.groupby(["wid", "muscle"])["volume"].sum()
+    for (wid, muscle), vol in per_workout.items():
+        agg["workout_muscles"].setdefault(wid, {})[muscle] = vol
+    agg["day_muscle"] = sets.groupby(["day", "muscle"])["volume"].sum().to_dict()
+    return agg
+
+def _aggregates():
+    return _derived("gs_agg", _AGG_TABLES, _build_aggregates)
+
+def _agg_add_workout(agg, workout_id, timestamp, total_volume):
+    day = pd.Timestamp(timestamp).normalize()
+    agg["workouts"][str(int(workout_id))] = (day, _num(total_volume))
+    _bucket_add(agg["day_volume"], day, _num(total_volume))
+
+def _agg_add_set(agg, workout_id, exercise_id, volume):
+    day, _ = agg["workouts"][str(int(workout_id))]
+    muscle = _exercise_muscles().get(str(exercise_id), "Other")
+    _bucket_add(agg["workout_muscles"].setdefault(str(int(workout_id)), {}), muscle, volume)
+    _bucket_add(agg["day_muscle"], (day, muscle), volume)
+
+def _agg_remove_workout(agg, workout_id):
+    day, total_volume = agg["workouts"].pop(str(int(workout_id)))
+    _bucket_add(agg["day_volume"], day, -total_volume)
+    for muscle, vol in agg["workout_muscles"].pop(str(int(workout_id)), {}).items():
+        _bucket_add(agg["day_muscle"], (day, muscle), -vol)
+
+def _lttb(x, y, threshold):
+    # Largest-Triangle-Three-Buckets: indices of the points to keep
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    keep = np.empty(threshold, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nxt = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[hi:nxt].mean()
+        avg_y = y[hi:nxt].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(area.argmax())
+        keep[i + 1] = a
+    return keep
+
+def _downsample(series, points):
+    # series indexed by date -> DataFrame(date, volume) of at most points rows
+    x = series.index.asi8.astype(float)
+    y = series.to_numpy(dtype=float)
+    keep = _lttb(x, y, points)
+    return pd.DataFrame({"date": series.index[keep], "volume": y[keep]})
+
+@_memoize(*_AGG_TABLES)
+def volume_chart(bucket="week", points=300):
+    # Total workout volume per day/week/month
+    day_volume = _aggregates()["day_volume"]
+    if not day_volume:
+        return pd.DataFrame(columns=["date", "volume"])
+    series = pd.Series(day_volume).sort_index().resample(_BUCKETS[bucket]).sum()
+    return _downsample(series, points)
+
+@_memoize(*_AGG_TABLES)
+def muscle_chart(bucket="week", points=300):
+    # Set volume (weight x reps) per muscle group, long format for color=
+    day_muscle = _aggregates()["day_muscle"]
+    if not day_muscle:
+        return pd.DataFrame(columns=["date", "volume", "muscle"])
+    wide = pd.Series(day_muscle).unstack(fill_value=0).sort_index().resample(_BUCKETS[bucket]).sum()
+    frames = [_downsample(wide[m], points).assign(muscle=m) for m in wide.columns]
+    return pd.concat(frames, ignore_index=True)
+
+# --- Personal Records ---
+# Per exercise: heaviest weight, best estimated 1RM and best single-workout
+# volume, plus the most reps done at each weight. log_set moves it forward
+# in O(1); deletes bump log_entries, which triggers a rebuild.
+
+_PR_TABLES = ("log_entries",)
+
+def _e1rm(weight, reps):
+    # Epley
+    return weight * (1 + reps / 30)
+
+def _build_prs():
+    prs = {
+        "best": {},     # exercise id -> [weight, e1rm, workout volume]
+        "reps": {},     # (exercise id, weight) -> reps
+        "workout": {},  # (workout id, exercise id) -> volume
+    }
+    logs = _get_df("log_entries", ["workout_id", "exercise_id", "weight", "reps"])
+    if logs.empty:
+        return prs
+    sets = pd.DataFrame({
+        "wid": logs['workout_id'].astype(str),
+        "eid": logs['exercise_id'].astype(str),
+        "weight": pd.to_numeric(logs['weight'], errors='coerce').fillna(0),
+        "reps": pd.to_numeric(logs['reps'], errors='coerce').fillna(0),
+    })
+    sets = sets[sets['reps'] > 0]
+    sets['e1rm'] = _e1rm(sets['weight'], sets['reps'])
+    sets['volume'] = sets['weight'] * sets['reps']
+    
+    per_workout = sets.groupby(['wid', 'eid'])['volume'].sum()
+    prs["workout"] = per_workout.to_dict()
+    best = sets.groupby('eid')[['weight', 'e1rm']].max()
+    best['volume'] = per_workout.groupby(level='eid').max()
+    prs["best"] = {eid: list(vals) for eid, vals in zip(best.index, best[['weight', 'e1rm', 'volume']].to_numpy().tolist())}
+    prs["reps"] = sets.groupby(['eid', 'weight'])['reps'].max().to_dict()
+    return prs
+
+def _pr_add_set(prs, workout_id, exercise_id, weight, reps):
+    if reps <= 0:
+        return
+    eid = str(int(exercise_id))
+    best = prs["best"].setdefault(eid, [0.0, 0.0, 0.0])
+    key = (str(int(workout_id)), eid)
+    prs["workout"][key] = prs["workout"].get(key, 0) + weight * reps
+    best[0] = max(best[0], weight)
+    best[1] = max(best[1], _e1rm(weight, reps))
+    best[2] = max(best[2], prs["workout"][key])
+    prs["reps"][(eid, weight)] = max(prs["reps"].get((eid, weight), 0), reps)
+
+def new_records(exercise_id, sets):
+    # Records broken by the last of sets, this workout's unsaved
+    # (weight, reps) for the exercise in order. Nothing on a first log.
+    prs = _derived("gs_prs", _PR_TABLES, _build_prs)
+    eid = str(int(exercise_id))
+    if eid not in prs["best"] or not sets:
+        return []
+    best_weight, best_e1rm, best_volume = prs["best"][eid]
+    *earlier, (weight, reps) = sets
+    best_reps = prs["reps"].get((eid, float(weight)), 0)
+    for w, r in earlier:
+        best_weight = max(best_weight, w)
+        best_e1rm = max(best_e1rm, _e1rm(w, r))
+        if w == weight:
+            best_reps = max(best_reps, r)
+    volume = sum(w * r for w, r in sets)
+    
+    broken = []
+    if weight > best_weight:
+        broken.append("Heaviest weight")
+    if best_reps and reps > best_reps:
+        broken.append(f"Most reps at {weight:g}kg")
+    if _e1rm(weight, reps) > best_e1rm:
+        broken.append("Best est. 1RM")
+    if volume > best_volume >= volume - weight * reps:
+        broken.append("Best workout volume")
+    return broken
+
+# --- Export ---
+# Every logged set joined to its workout and exercise, streamed as encoded
+# chunks so a full history never sits in memory as one joined frame.
+
+_EXPORT_CHUNK = int(os.environ.get("WLOG_EXPORT_CHUNK", "5000"))
+_EXPORT_COLUMNS = ["workout_id", "timestamp", "session_name", "duration_minutes", "exercise_id",
+                   "exercise", "target_muscle", "set_order", "weight", "reps"]
+
+def _frame_chunks(df, rows):
+    for start in range(0, len(df), rows):
+        yield df.iloc[start:start + rows]
+
+def _sheet_chunks(sh, ws, rows):
+    # Row-range reads straight from the sheet, header from row 1. Only API
+    # calls in here: the worksheet is resolved by the caller, in the script run
+    header, chunks = _range_chunks(sh, ws, rows)
+    for values in chunks:
+        yield pd.DataFrame(values, columns=header)
+
+def _first_by_id(df, columns):
+    # Lookup frame indexed by id (as text), first row wins on duplicates
+    if df.empty:
+        return pd.DataFrame(columns=columns, index=pd.Index([], dtype=object))
+    ids = df['id'].astype(str)
+    keep = ~ids.duplicated().to_numpy()
+    out = df.loc[keep, columns]
+    out.index = ids[keep]
+    return out
+
+def _joined_chunks(chunks, workouts, exs):
+    # Sets of workouts that aren't live (soft-deleted, or never saved) drop
+    # out of the inner join with the filtered workouts frame
+    w = _first_by_id(workouts, ['timestamp', 'session_name', 'duration_minutes'])
+    e = _first_by_id(exs, ['name', 'target_muscle'])
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        wpos = w.index.get_indexer(chunk['workout_id'].astype(str))
+        chunk = chunk[wpos >= 0]
+        wpos = wpos[wpos >= 0]
+        if chunk.empty:
+            continue
+        # Unknown exercises (-1) pick the trailing None
+        epos = e.index.get_indexer(chunk['exercise_id'].astype(str))
+        exercise = pd.Series(np.append(e['name'].to_numpy(dtype=object), None)[epos], dtype=object)
+        muscle = pd.Series(np.append(e['target_muscle'].to_numpy(dtype=object), None)[epos], dtype=object)
+        yield pd.DataFrame({
+            "workout_id": pd.to_numeric(chunk['workout_id'], errors='coerce').astype('Int64').to_numpy(),
+            "timestamp": w['timestamp'].to_numpy()[wpos],
+            "session_name": w['session_name'].to_numpy()[wpos],
+            "duration_minutes": pd.to_numeric(pd.Series(w['duration_minutes'].to_numpy()[wpos]), errors='coerce').to_numpy(),
+            "exercise_id": pd.to_numeric(chunk['exercise_id'], errors='coerce').astype('Int64').to_numpy(),
+            "exercise": exercise.to_numpy(),
+            "target_muscle": muscle.to_numpy(),
+            "set_order": pd.to_numeric(chunk['set_order'], errors='coerce').astype('Int64').to_numpy(),
+            "weight": pd.to_numeric(chunk['weight'], errors='coerce').to_numpy(),
+            "reps": pd.to_numeric(chunk['reps'], errors='coerce').astype('Int64').to_numpy(),
+        }, columns=_EXPORT_COLUMNS)
+
+def _csv_stream(frames):
+    header = True
+    for df in frames:
+        yield df.to_csv(index=False, header=header).encode("utf-8")
+        header = False
+    if header:
+        yield (",".join(_EXPORT_COLUMNS) + "\n").encode("utf-8")
+
+def _jsonl_stream(frames):
+    for df in frames:
+        text = df.to_json(orient="records", lines=True, force_ascii=False)
+        yield (text if text.endswith("\n") else text + "\n").encode("utf-8")
+
+class _Drain:
+    # Write-only file for the Parquet writer: hands back what was written
+    # since the last take() while tell() keeps counting from the start
+    def __init__(self):
+        self.parts = []
+        self.pos = 0
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+def _parquet_stream(frames):
+    # One row group per chunk (pyarrow ships with streamlit)
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = pa.schema([
+        ("workout_id", pa.int64()), ("timestamp", pa.string()), ("session_name", pa.string()),
+        ("duration_minutes", pa.float64()), ("exercise_id", pa.int64()), ("exercise", pa.string()),
+        ("target_muscle", pa.string()), ("set_order", pa.int64()), ("weight", pa.float64()),
+        ("reps", pa.int64()),
+    ])
+    sink = _Drain()
+    writer = pq.ParquetWriter(sink, schema)
+    for df in frames:
+        writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", _csv_stream),
+    "jsonl": ("application/x-ndjson", _jsonl_stream),
+    "parquet": ("application/vnd.apache.parquet", _parquet_stream),
+}
+
+def history_export(fmt="csv", chunk_rows=None):
+    # Resolve the tables now, in the script run, and return a function that
+    # starts a fresh export stream on every call. The streams only make API
+    # calls and touch no session state, so the function can back a deferred
+    # download, which Streamlit may run more than once and off the script thread.
+    # Uses the cached log_entries frame when there is one, row-range sheet
+    # reads otherwise.
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}', expected one of {', '.join(EXPORT_FORMATS)}")
+    rows = chunk_rows or _EXPORT_CHUNK
+    workouts = _get_df("workouts", ["id", "timestamp", "session_name", "duration_minutes"])
+    exs = _get_df("exercises", ["id", "name", "target_muscle"])
+    logs = st.session_state.get("gs_cache_log_entries")
+    if OFFLINE or logs is not None:
+        logs = _get_df("log_entries")
+        chunks = lambda: _frame_chunks(logs, rows)
+    else:
+        _, sh = _get_connection()
+        ws = _worksheet(sh, "log_entries")
+        chunks = lambda: _sheet_chunks(sh, ws, rows)
+    return lambda: EXPORT_FORMATS[fmt][1](_joined_chunks(chunks(), workouts, exs))
+
+def export_history(fmt="csv", chunk_rows=None):
+    # Generator of bytes, see history_export
+    return history_export(fmt, chunk_rows)()
+
+def export_to_file(path, fmt="csv", chunk_rows=None):
+    # Stream an export to disk; returns the bytes written
+    written = 0
+    with open(path, "wb") as f:
+        for data in export_history(fmt, chunk_rows):
+            f.write(data)
+            written += len(data)
+    return written
@@ -0,0 +1,275 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Multi-session load test for app.py.
+#
+# Drives N simulated lifters through Streamlit's AppTest against the
+# in-memory backend (local_backend.py), then reports rerun latency
+# percentiles, API calls per action and process RSS. Headless, no
+# credentials or network needed:
+#
+#   python loadtest.py --users 8 --workouts 2 --latency 0.05
+#   python loadtest.py --users 16 --json report.json --max-p95 2.0
+
+os.environ["WLOG_BACKEND"] = "local"
+
+from streamlit import config
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import script_cache
+from streamlit.testing.v1 import AppTest
+
+import database_gsheets as database
+import local_backend
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+# AppTest builds a fresh ScriptCache per run, so app.py would be recompiled on
+# every rerun of every user, concurrently. A server compiles once; share one
+# cache so we measure the same thing (and dodge CPython's non-thread-safe
+# ast.parse, which fails under parallel compiles on 3.11).
+_shared_script_cache = script_cache.ScriptCache()
+_get_bytecode = script_cache.ScriptCache.get_bytecode
+script_cache.ScriptCache.get_bytecode = lambda self, path: _get_bytecode(_shared_script_cache, path)
+
+# AppTest also installs a mock Runtime singleton per run and clears it when the
+# run ends, pulling it out from under other users' scripts that are still
+# running. Keep the last one alive for the whole load test.
+_last_runtime = []
+
+def _runtime_instance(cls):
+    if cls._instance is not None:
+        _last_runtime[:] = [cls._instance]
+    if not _last_runtime:
+        raise RuntimeError("Runtime hasn't been created!")
+    return _last_runtime[0]
+
+Runtime.instance = classmethod(_runtime_instance)
+Runtime.exists = classmethod(lambda cls: cls._instance is not None or bool(_last_runtime))
+
+# Same for the appTest config flag it patches on and off around each run
+config.set_option("global.appTest", True)
+
+def _rss_mb():
+    # Current resident set size of this process, Linux first
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+class Recorder:
+    # Collects (action, seconds, api_calls) samples from all users
+    def __init__(self, counter):
+        self.counter = counter
+        self.samples = []
+        self.errors = []
+        self._lock = threading.Lock()
+
+    def timed(self, action, fn):
+        calls_before = self.counter.total()
+        t0 = time.perf_counter()
+        at = fn()
+        elapsed = time.perf_counter() - t0
+        calls = self.counter.total() - calls_before
+        with self._lock:
+            self.samples.append((action, elapsed, calls))
+        if at.exception:
+            with self._lock:
+                self.errors.append((action, at.exception[0].value))
+        return at
+
+def _by_label(widgets, label):
+    for w in widgets:
+        if w.label == label:
+            return w
+    raise LookupError(f"No widget labelled {label!r}")
+
+def _navigate(rec, at, page):
+    return rec.timed(f"open:{page}", lambda: at.sidebar.radio[0].set_value(page).run())
+
+def seed(rec):
+    # One user initializes the default schedule, as a fresh install would
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    rec.timed("load", at.run)
+    at = _navigate(rec, at, "Routines")
+    init = [b for b in at.button if b.label.startswith("📥")]
+    if init:
+        rec.timed("init_schedule", lambda: init[0].click().run())
+
+def lifter_session(rec, user_idx, workouts, sets_per_workout):
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    at = rec.timed("load", at.run)
+
+    for w in range(workouts):
+        at = _navigate(rec, at, "Log Workout")
+        routine_box = _by_label(at.selectbox, "Choose Routine or start a New Workout")
+        routines = [o for o in routine_box.options if o != "New Workout"]
+        choice = routines[(user_idx + w) % len(routines)] if routines else "New Workout"
+        routine_box.set_value(choice)
+        at = rec.timed("start_routine", lambda: _by_label(at.button, "Start Workout ⏱️").click().run())
+
+        for s in range(sets_per_workout):
+            ex_box = _by_label(at.selectbox, "Select Exercise")
+            real = [o for o in ex_box.options if o not in ("---", "➕ Add from Database", "✨ Create New Exercise")]
+            if real:
+                ex_box.set_value(real[s % len(real)])
+                at = rec.timed("select_exercise", at.run)
+            else:
+                # Routine items not resolved, go through the full library
+                ex_box.set_value("➕ Add from Database")
+                at = rec.timed("select_exercise", at.run)
+                search = _by_label(at.selectbox, "Search All Exercises")
+                search.set_value(search.options[(user_idx + s) % len(search.options)])
+                at = rec.timed("select_exercise", at.run)
+            at.number_input(key="w_input").set_value(20.0 + 2.5 * s)
+            at.number_input(key="r_input").set_value(8 + s % 4)
+            at = rec.timed("add_set", lambda: _by_label(at.button, "Add Set").click().run())
+
+        at = rec.timed("finish_save", lambda: _by_label(at.button, "Finish & Save").click().run())
+
+    at = _navigate(rec, at, "History")
+    at = _navigate(rec, at, "Dashboard")
+    return at
+
+def _reset_backend(latency):
+    client = local_backend.reset_client(latency)
+    database._reset_connections()
+    return client
+
+def _summarize(samples):
+    by_action = {}
+    for action, elapsed, calls in samples:
+        by_action.setdefault(action, ([], []))
+        by_action[action][0].append(elapsed)
+        by_action[action][1].append(calls)
+    out = {}
+    for action, (times, calls) in sorted(by_action.items()):
+        out[action] = {
+            "count": len(times),
+            "p50_s": round(_percentile(times, 50), 4),
+            "p95_s": round(_percentile(times, 95), 4),
+            "p99_s": round(_percentile(times, 99), 4),
+            "api_calls_mean": round(statistics.mean(calls), 2),
+        }
+    return out
+
+def run(users, workouts, sets_per_workout, latency):
+    rss_start = _rss_mb()
+
+    # Pass 1: single user on a fresh backend. Calls can be attributed to
+    # actions exactly because nothing else is running.
+    client = _reset_backend(latency)
+    calib = Recorder(client.counter)
+    seed(calib)
+    lifter_session(calib, 0, workouts, sets_per_workout)
+
+    # Pass 2: N users at once on a freshly seeded backend
+    client = _reset_backend(latency)
+    seed(Recorder(client.counter))
+    client.counter.reset()
+    rec = Recorder(client.counter)
+    rss_peak = _rss_mb()
+    stop = threading.Event()
+
+    def sample_rss():
+        nonlocal rss_peak
+        while not stop.wait(0.2):
+            rss_peak = max(rss_peak, _rss_mb())
+
+    sampler = threading.Thread(target=sample_rss, daemon=True)
+    sampler.start()
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        futures = [pool.submit(lifter_session, rec, i, workouts, sets_per_workout) for i in range(users)]
+        for f in futures:
+            try:
+                f.result()
+            except Exception as e:
+                rec.errors.append(("session", repr(e)))
+    wall = time.perf_counter() - t0
+    stop.set()
+    sampler.join()
+
+    times = [s[1] for s in rec.samples]
+    calib_actions = _summarize(calib.samples)
+    report = {
+        "users": users,
+        "workouts_per_user": workouts,
+        "sets_per_workout": sets_per_workout,
+        "latency_s": latency,
+        "wall_s": round(wall, 2),
+        "reruns": len(times),
+        "rerun_latency": {
+            "p50_s": round(_percentile(times, 50), 4),
+            "p95_s": round(_percentile(times, 95), 4),
+            "p99_s": round(_percentile(times, 99), 4),
+        },
+        "actions": _summarize(rec.samples),
+        # Exact per-action call counts from the single-user pass
+        "api_calls_per_action": {a: v["api_calls_mean"] for a, v in calib_actions.items()},
+        "api_calls_total": client.counter.total(),
+        "api_calls_by_method": client.counter.snapshot(),
+        "rss_mb": {"start": round(rss_start, 1), "peak": round(rss_peak, 1), "end": round(_rss_mb(), 1)},
+        "errors": [f"{a}: {e}" for a, e in rec.errors + calib.errors],
+    }
+    return report
+
+def _print_report(report):
+    lat = report["rerun_latency"]
+    print(f"{report['users']} users, {report['reruns']} reruns in {report['wall_s']}s "
+          f"(simulated API latency {report['latency_s']}s)")
+    print(f"rerun latency  p50 {lat['p50_s']:.3f}s  p95 {lat['p95_s']:.3f}s  p99 {lat['p99_s']:.3f}s")
+    print(f"{'action':<22}{'n':>6}{'p50':>9}{'p95':>9}{'p99':>9}{'calls':>8}")
+    for action, a in report["actions"].items():
+        calls = report["api_calls_per_action"].get(action, a["api_calls_mean"])
+        print(f"{action:<22}{a['count']:>6}{a['p50_s']:>9.3f}{a['p95_s']:>9.3f}{a['p99_s']:>9.3f}{calls:>8}")
+    print(f"API calls total {report['api_calls_total']}  {report['api_calls_by_method']}")
+    rss = report["rss_mb"]
+    print(f"RSS MB  start {rss['start']}  peak {rss['peak']}  end {rss['end']}")
+    for e in report["errors"]:
+        print(f"ERROR {e}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Multi-session load test for WLog")
+    parser.add_argument("--users", type=int, default=4, help="concurrent simulated users")
+    parser.add_argument("--workouts", type=int, default=1, help="workouts logged per user")
+    parser.add_argument("--sets", type=int, default=3, help="sets added per workout")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated seconds per API call")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--max-p95", type=float, help="exit 1 if rerun p95 exceeds this many seconds")
+    args = parser.parse_args(argv)
+
+    report = run(args.users, args.workouts, args.sets, args.latency)
+    _print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if report["errors"]:
+        return 1
+    if args.max_p95 is not None and report["rerun_latency"]["p95_s"] > args.max_p95:
+        print(f"FAIL: p95 {report['rerun_latency']['p95_s']}s > {args.max_p95}s")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,356 @@
+import re
+import threading
+import time
+import uuid
+
+import gspread
+
+# In-process stand-in for the gspread client, used by the load-test harness
+# and for offline development (WLOG_BACKEND=local). Data lives in memory
+# and is shared by every session of the server process, like a real
+# spreadsheet would be.
+
+_A1_RE = re.compile(r"^([A-Za-z]*)(\d*)(?::([A-Za-z]*)(\d*))?$")
+
+def _col_to_index(letters):
+    n = 0
+    for c in letters.upper():
+        n = n * 26 + (ord(c) - 64)
+    return n
+
+def _parse_range(a1):
+    # 'A2:F500' -> (row_start, col_start, row_end, col_end), 1-based, None = open
+    if "!" in a1:
+        a1 = a1.split("!", 1)[1]
+    m = _A1_RE.match(a1.replace("'", "").replace("$", ""))
+    if not m:
+        raise ValueError(f"Bad range: {a1}")
+    c1, r1, c2, r2 = m.groups()
+    single = m.group(3) is None and m.group(4) is None
+    col_start = _col_to_index(c1) if c1 else 1
+    row_start = int(r1) if r1 else 1
+    if single:
+        col_end = col_start if c1 else None
+        row_end = row_start if r1 else None
+    else:
+        col_end = _col_to_index(c2) if c2 else None
+        row_end = int(r2) if r2 else None
+    return row_start, col_start, row_end, col_end
+
+def _cell(value):
+    return "" if value is None else str(value)
+
+def _entered(cell):
+    # CellData from updateCells/appendCells -> the text Sheets shows
+    value = cell.get("userEnteredValue", {})
+    if "numberValue" in value:
+        number = value["numberValue"]
+        return str(int(number)) if float(number).is_integer() else str(number)
+    if "boolValue" in value:
+        return "TRUE" if value["boolValue"] else "FALSE"
+    return _cell(value.get("stringValue", value.get("formulaValue")))
+
+class CallCounter:
+    # Counts API calls by method name; thread-safe
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {}
+
+    def hit(self, method):
+        with self._lock:
+            self.counts[method] = self.counts.get(method, 0) + 1
+
+    def total(self):
+        with self._lock:
+            return sum(self.counts.values())
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counts)
+
+    def reset(self):
+        with self._lock:
+            self.counts = {}
+
+class LocalWorksheet:
+    def __init__(self, spreadsheet, title, sheet_id, rows=100, cols=20):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.id = sheet_id
+        self._rows = []
+        self._min_rows = rows
+        self._min_cols = cols
+
+    @property
+    def row_count(self):
+        return max(self._min_rows, len(self._rows))
+
+    @property
+    def col_count(self):
+        return max([self._min_cols] + [len(r) for r in self._rows])
+
+    def _call(self, method):
+        self.spreadsheet._call(method)
+
+    def _read(self, a1):
+        row_start, col_start, row_end, col_end = _parse_range(a1)
+        with self.spreadsheet._lock:
+            rows = self._rows[row_start - 1:row_end]
+            out = []
+            for r in rows:
+                vals = r[col_start - 1:col_end]
+                # Sheets trims trailing empty cells and rows
+                while vals and vals[-1] == "":
+                    vals = vals[:-1]
+                out.append(list(vals))
+        while out and not out[-1]:
+            out.pop()
+        return out
+
+    def _write(self, a1, values):
+        row_start, col_start, _, _ = _parse_range(a1)
+        with self.spreadsheet._lock:
+            for i, row in enumerate(values):
+                r = row_start - 1 + i
+                while len(self._rows) <= r:
+                    self._rows.append([])
+                cur = self._rows[r]
+                for j, v in enumerate(row):
+                    c = col_start - 1 + j
+                    while len(cur) <= c:
+                        cur.append("")
+                    cur[c] = _cell(v)
+
+    def get_all_values(self, **kwargs):
+        self._call("get_all_values")
+        with self.spreadsheet._lock:
+            return [list(r) for r in self._rows]
+
+    def get(self, range_name=None, **kwargs):
+        self._call("get")
+        return self._read(range_name or "A1:ZZ")
+
+    def batch_get(self, ranges, major_dimension=None, **kwargs):
+        self._call("batch_get")
+        if major_dimension == "COLUMNS":
+            return [self._read_columns(r) for r in ranges]
+        return [self._read(r) for r in ranges]
+
+    def _read_columns(self, a1):
+        # Column-major: one list per column, each trimmed like Sheets does
+        row_start, col_start, row_end, col_end = _parse_range(a1)
+        with self.spreadsheet._lock:
+            rows = self._rows[row_start - 1:row_end]
+            if col_end is None:
+                col_end = max((len(r) for r in rows), default=0)
+            cols = [[r[c] if c < len(r) else "" for r in rows] for c in range(col_start - 1, col_end)]
+        while cols and not any(cols[-1]):
+            cols.pop()
+        for col in cols:
+            while col and col[-1] == "":
+                col.pop()
+        return cols
+
+    def append_row(self, values, **kwargs):
+        self._call("append_row")
+        with self.spreadsheet._lock:
+            self._rows.append([_cell(v) for v in values])
+
+    def append_rows(self, values, **kwargs):
+        self._call("append_rows")
+        with self.spreadsheet._lock:
+            self._rows.extend([_cell(v) for v in row] for row in values)
+
+    def clear(self):
+        self._call("clear")
+        with self.spreadsheet._lock:
+            self._rows = []
+
+    def update(self, values=None, range_name=None, **kwargs):
+        self._call("update")
+        # gspread accepts both update(values, range) and update(range, values)
+        if isinstance(values, str):
+            values, range_name = range_name, values
+        self._write(range_name or "A1", values or [])
+
+    def update_title(self, title):
+        self._call("update_title")
+        with self.spreadsheet._lock:
+            del self.spreadsheet._worksheets[self.title]
+            self.title = title
+            self.spreadsheet._worksheets[title] = self
+
+    def delete_rows(self, start_index, end_index=None):
+        self._call("delete_rows")
+        with self.spreadsheet._lock:
+            del self._rows[start_index - 1:(end_index or start_index)]
+
+class LocalSpreadsheet:
+    def __init__(self, title="WLog_DB", latency=0.0, counter=None):
+        self.id = uuid.uuid4().hex
+        self.title = title
+        # Simulated network round-trip per API call, in seconds
+        self.latency = latency
+        self.counter = counter or CallCounter()
+        self._lock = threading.RLock()
+        self._worksheets = {}
+        self._next_sheet_id = 1
+
+    def _call(self, method):
+        self.counter.hit(method)
+        if self.latency:
+            time.sleep(self.latency)
+
+    def worksheets(self, **kwargs):
+        self._call("worksheets")
+        with self._lock:
+            return list(self._worksheets.values())
+
+    def worksheet(self, title):
+        self._call("worksheet")
+        with self._lock:
+            if title not in self._worksheets:
+                raise gspread.WorksheetNotFound(title)
+            return self._worksheets[title]
+
+    def _by_id(self, sheet_id):
+        for ws in self._worksheets.values():
+            if ws.id == sheet_id:
+                return ws
+        raise gspread.WorksheetNotFound(str(sheet_id))
+
+    def _split_range(self, a1):
+        title, rng = a1.split("!", 1)
+        title = title.strip("'")
+        if title not in self._worksheets:
+            raise gspread.WorksheetNotFound(title)
+        return self._worksheets[title], rng
+
+    def values_batch_get(self, ranges, params=None):
+        self._call("values_batch_get")
+        out = []
+        for a1 in ranges:
+            ws, rng = self._split_range(a1)
+            values = ws._read(rng)
+            out.append({"range": a1, "values": values} if values else {"range": a1})
+        return {"spreadsheetId": self.id, "valueRanges": out}
+
+    def _staged(self, staged, sheet_id):
+        # Copy of a sheet's row list, taken the first time a request touches
+        # it; rows themselves are copied before a cell of theirs changes
+        if sheet_id not in staged:
+            staged[sheet_id] = list(self._by_id(sheet_id)._rows)
+        return staged[sheet_id]
+
+    def batch_update(self, body):
+        self._call("batch_update")
+        with self._lock:
+            # Apply to copies first so a bad request leaves nothing half-done
+            staged = {}
+            for req in body.get("requests", []):
+                if "deleteDimension" in req:
+                    rng = req["deleteDimension"]["range"]
+                    if rng.get("dimension") != "ROWS":
+                        raise NotImplementedError("Only row deletes are supported")
+                    del self._staged(staged, rng["sheetId"])[rng["startIndex"]:rng["endIndex"]]
+                elif "updateCells" in req and "range" in req["updateCells"]:
+                    # Clear a block (the whole sheet when no bounds are given)
+                    rng = req["updateCells"]["range"]
+                    rows = self._staged(staged, rng["sheetId"])
+                    for r in range(rng.get("startRowIndex", 0), min(rng.get("endRowIndex", len(rows)), len(rows))):
+                        row = rows[r] = list(rows[r])
+                        for c in range(rng.get("startColumnIndex", 0), min(rng.get("endColumnIndex", len(row)), len(row))):
+                            row[c] = ""
+                elif "updateCells" in req:
+                    spec = req["updateCells"]
+                    start = spec["start"]
+                    rows = self._staged(staged, start["sheetId"])
+                    for i, row in enumerate(spec.get("rows", [])):
+                        r = start.get("rowIndex", 0) + i
+                        while len(rows) <= r:
+                            rows.append([])
+                        rows[r] = list(rows[r])
+                        for j, value in enumerate(row.get("values", [])):
+                            c = start.get("columnIndex", 0) + j
+                            while len(rows[r]) <= c:
+                                rows[r].append("")
+                            rows[r][c] = _entered(value)
+                elif "appendCells" in req:
+                    spec = req["appendCells"]
+                    rows = self._staged(staged, spec["sheetId"])
+                    # Goes after the last row with data, like Sheets does
+                    while rows and not any(rows[-1]):
+                        rows.pop()
+                    for row in spec.get("rows", []):
+                        rows.append([_entered(v) for v in row.get("values", [])])
+                else:
+                    raise NotImplementedError(f"Unsupported request: {list(req)}")
+            for sheet_id, rows in staged.items():
+                self._by_id(sheet_id)._rows = rows
+        return {"spreadsheetId": self.id, "replies": [{} for _ in body.get("requests", [])]}
+
+    def add_worksheet(self, title, rows=100, cols=20, **kwargs):
+        self._call("add_worksheet")
+        with self._lock:
+            if title not in self._worksheets:
+                self._worksheets[title] = LocalWorksheet(self, title, self._next_sheet_id, rows, cols)
+                self._next_sheet_id += 1
+            return self._worksheets[title]
+
+class LocalClient:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.counter = CallCounter()
+        self._lock = threading.Lock()
+        self._spreadsheets = {}
+
+    def open(self, title):
+        with self._lock:
+            if title not in self._spreadsheets:
+                self._spreadsheets[title] = LocalSpreadsheet(title, self.latency, self.counter)
+            return self._spreadsheets[title]
+
+    def open_by_key(self, key):
+        self.counter.hit("open_by_key")
+        with self._lock:
+            for sh in self._spreadsheets.values():
+                if sh.id == key:
+                    return sh
+        raise gspread.SpreadsheetNotFound(key)
+
+    def create(self, title, folder_id=None):
+        self.counter.hit("create")
+        with self._lock:
+            sh = LocalSpreadsheet(title, self.latency, self.counter)
+            self._spreadsheets[title] = sh
+            return sh
+
+    def copy(self, file_id, title=None, copy_permissions=False, **kwargs):
+        self.counter.hit("copy")
+        src = self.open_by_key(file_id)
+        with self._lock, src._lock:
+            sh = LocalSpreadsheet(title or f"Copy of {src.title}", self.latency, self.counter)
+            for ws in src._worksheets.values():
+                dup = LocalWorksheet(sh, ws.title, ws.id, ws._min_rows, ws._min_cols)
+                dup._rows = [list(r) for r in ws._rows]
+                sh._worksheets[ws.title] = dup
+            sh._next_sheet_id = src._next_sheet_id
+            self._spreadsheets[sh.title] = sh
+            return sh
+
+# One client per process so all sessions share the same data
+_client = None
+_client_lock = threading.Lock()
+
+def get_client(latency=0.0):
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LocalClient(latency)
+        return _client
+
+def reset_client(latency=0.0):
+    global _client
+    with _client_lock:
+        _client = LocalClient(latency)
+        return _client
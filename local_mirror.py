@@ -0,0 +1,499 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+import gspread
+import pandas as pd
+
+# Offline-first mirror of the spreadsheet (WLOG_OFFLINE=1).
+#
+# Every read and write from database_gsheets goes to a local SQLite file.
+# A background SyncEngine reconciles it with the spreadsheet:
+#   - push: rows appended locally go up in one append_rows per table,
+#     locally rewritten tables are pushed whole
+#   - pull: new remote rows are read by row range from the last known row,
+#     with a full re-read every few cycles to catch remote rewrites. A
+#     locally rewritten table is always read whole and merged three-way
+#     (against the remote rows known when it was rewritten), so rows other
+#     devices added, changed or deleted meanwhile survive its push; rows
+#     both sides changed keep the local version
+#   - conflicts: remote rows keep their ids; unpushed local rows whose id
+#     is already taken are renumbered above the current max, in local
+#     insertion order, and references to them in other unpushed rows follow.
+#
+# Rows are stored as JSON lists of strings, exactly what Sheets returns.
+# Synced rows carry their remote position (pos); unpushed rows have pos NULL
+# and sort after them.
+
+# parent table -> [(child table, column)] for id renumbering
+FOREIGN_KEYS = {
+    "workouts": [("log_entries", "workout_id")],
+    "exercises": [("log_entries", "exercise_id"), ("session_items", "exercise_id")],
+    "sessions": [("session_items", "session_id")],
+}
+
+def _col_letter(n):
+    letters = ""
+    while n > 0:
+        n, r = divmod(n - 1, 26)
+        letters = chr(65 + r) + letters
+    return letters or "A"
+
+def _cells(row, width):
+    # Stringify like Sheets does, pad/trim to the header width
+    out = ["" if v is None else str(v) for v in row[:width]]
+    return out + [""] * (width - len(out))
+
+def _realign(row, old_header, new_header):
+    by_name = dict(zip(old_header, row))
+    return [by_name.get(c, "") for c in new_header]
+
+class LocalMirror:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS tables (
+                name TEXT PRIMARY KEY,
+                header TEXT NOT NULL,
+                version INTEGER NOT NULL DEFAULT 0,
+                remote_rows INTEGER,
+                pending_replace INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS rows (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                tbl TEXT NOT NULL,
+                pos INTEGER,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS rows_tbl ON rows (tbl, pos);
+            -- Remote rows as known when a pending rewrite started, to merge against
+            CREATE TABLE IF NOT EXISTS base (
+                tbl TEXT NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS base_tbl ON base (tbl);
+        """)
+
+    def _tx(self):
+        # BEGIN IMMEDIATE keeps other processes on the same file out until commit
+        conn = self._conn
+        class _Tx:
+            def __enter__(self_):
+                conn.execute("BEGIN IMMEDIATE")
+                return conn
+            def __exit__(self_, exc_type, exc, tb):
+                conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return _Tx()
+
+    def _meta(self, conn, name):
+        row = conn.execute(
+            "SELECT header, version, remote_rows, pending_replace FROM tables WHERE name = ?", (name,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"header": json.loads(row[0]), "version": row[1], "remote_rows": row[2], "pending_replace": row[3]}
+
+    def _bump(self, conn, name):
+        conn.execute("UPDATE tables SET version = version + 1 WHERE name = ?", (name,))
+
+    def _rows(self, conn, name, pending_only=False):
+        sql = "SELECT seq, data FROM rows WHERE tbl = ?"
+        if pending_only:
+            sql += " AND pos IS NULL"
+        sql += " ORDER BY pos IS NULL, pos, seq"
+        return [(seq, json.loads(data)) for seq, data in conn.execute(sql, (name,))]
+
+    # --- Local API (interactive path, never touches the network) ---
+
+    def ensure_table(self, name, header):
+        with self._lock, self._tx() as conn:
+            if self._meta(conn, name) is None:
+                conn.execute("INSERT INTO tables (name, header) VALUES (?, ?)", (name, json.dumps(header)))
+
+    def tables(self):
+        with self._lock:
+            return [r[0] for r in self._conn.execute("SELECT name FROM tables")]
+
+    def version(self, name):
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM tables WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def read_df(self, name):
+        with self._lock:
+            meta = self._meta(self._conn, name)
+            if meta is None:
+                return pd.DataFrame(), 0
+            rows = [data for _, data in self._rows(self._conn, name)]
+        header = meta["header"]
+        if not header:
+            return pd.DataFrame(), meta["version"]
+        return pd.DataFrame(rows, columns=header), meta["version"]
+
+    def append(self, name, rows):
+        # Returns the new table version
+        with self._lock, self._tx() as conn:
+            meta = self._meta(conn, name)
+            if meta is None:
+                raise ValueError(f"Worksheet {name} not found")
+            width = len(meta["header"])
+            conn.executemany(
+                "INSERT INTO rows (tbl, pos, data) VALUES (?, NULL, ?)",
+                [(name, json.dumps(_cells(r, width))) for r in rows],
+            )
+            self._bump(conn, name)
+            return meta["version"] + 1
+
+    def replace(self, name, header, rows):
+        with self._lock, self._tx() as conn:
+            meta = self._meta(conn, name)
+            if meta is None:
+                conn.execute("INSERT INTO tables (name, header) VALUES (?, ?)", (name, json.dumps(header)))
+            elif not meta["pending_replace"]:
+                # The synced rows are what the rewrite was made against
+                synced = conn.execute("SELECT data FROM rows WHERE tbl = ? AND pos IS NOT NULL ORDER BY pos", (name,))
+                self._set_base(conn, name, [_realign(json.loads(d), meta["header"], header) for (d,) in synced])
+            conn.execute("DELETE FROM rows WHERE tbl = ?", (name,))
+            width = len(header)
+            conn.executemany(
+                "INSERT INTO rows (tbl, pos, data) VALUES (?, NULL, ?)",
+                [(name, json.dumps(_cells(r, width))) for r in rows],
+            )
+            conn.execute(
+                "UPDATE tables SET header = ?, pending_replace = 1, version = version + 1 WHERE name = ?",
+                (json.dumps(header), name),
+            )
+            return self._meta(conn, name)["version"]
+
+    def _set_base(self, conn, name, rows):
+        conn.execute("DELETE FROM base WHERE tbl = ?", (name,))
+        conn.executemany("INSERT INTO base (tbl, data) VALUES (?, ?)", [(name, json.dumps(r)) for r in rows])
+
+    def locked(self):
+        # Hold off other threads of this process (e.g. for read-modify-replace)
+        return self._lock
+
+    def pending_counts(self):
+        with self._lock:
+            out = {}
+            for name, n, rep in self._conn.execute(
+                "SELECT t.name, COUNT(r.seq), t.pending_replace FROM tables t "
+                "LEFT JOIN rows r ON r.tbl = t.name AND r.pos IS NULL GROUP BY t.name"
+            ):
+                out[name] = {"rows": n, "replace": bool(rep)}
+            return out
+
+    # --- Sync side ---
+
+    def _set_remote(self, conn, name, header, remote_rows, full=True):
+        # Remote content becomes the synced part of the table; unpushed rows stay
+        meta = self._meta(conn, name)
+        pending = self._rows(conn, name, pending_only=True)
+        old_header = meta["header"] if meta else header
+        if meta is None:
+            conn.execute("INSERT INTO tables (name, header) VALUES (?, ?)", (name, json.dumps(header)))
+        if full:
+            conn.execute("DELETE FROM rows WHERE tbl = ? AND pos IS NOT NULL", (name,))
+            start = 0
+        else:
+            start = meta["remote_rows"] or 0
+        width = len(header)
+        conn.executemany(
+            "INSERT INTO rows (tbl, pos, data) VALUES (?, ?, ?)",
+            [(name, start + i, json.dumps(_cells(r, width))) for i, r in enumerate(remote_rows)],
+        )
+        if header != old_header:
+            conn.executemany(
+                "UPDATE rows SET data = ? WHERE seq = ?",
+                [(json.dumps(_realign(data, old_header, header)), seq) for seq, data in pending],
+            )
+        conn.execute(
+            "UPDATE tables SET header = ?, remote_rows = ?, version = version + 1 WHERE name = ?",
+            (json.dumps(header), start + len(remote_rows), name),
+        )
+
+    def apply_pull(self, name, header, rows, full):
+        with self._lock, self._tx() as conn:
+            meta = self._meta(conn, name)
+            if meta and meta["pending_replace"]:
+                # Merge into the local rewrite instead, from a whole read
+                return self._merge(conn, name, meta, header, rows) if full else {}
+            if not full and not rows:
+                return {}
+            if full and meta and meta["remote_rows"] is not None and header == meta["header"]:
+                width = len(header)
+                synced = conn.execute(
+                    "SELECT data FROM rows WHERE tbl = ? AND pos IS NOT NULL ORDER BY pos", (name,)
+                )
+                if [json.loads(d) for (d,) in synced] == [_cells(r, width) for r in rows]:
+                    # Nothing changed remotely, keep versions (and session caches) as they are
+                    return {}
+            self._set_remote(conn, name, header, rows, full=full)
+            return self._resolve_ids(conn, name)
+
+    def _resolve_ids(self, conn, name):
+        # Renumber unpushed rows whose id already exists remotely
+        header = self._meta(conn, name)["header"]
+        if "id" not in header:
+            return {}
+        id_col = header.index("id")
+        taken = set()
+        max_id = 0
+        for _, data in self._rows(conn, name):
+            try:
+                max_id = max(max_id, int(float(data[id_col])))
+            except (TypeError, ValueError, IndexError):
+                pass
+        synced = conn.execute("SELECT data FROM rows WHERE tbl = ? AND pos IS NOT NULL", (name,))
+        for (data,) in synced:
+            taken.add(json.loads(data)[id_col])
+        remap = {}
+        updates = []
+        for seq, data in self._rows(conn, name, pending_only=True):
+            old = data[id_col]
+            if old in taken:
+                max_id += 1
+                remap[old] = str(max_id)
+                data[id_col] = str(max_id)
+                updates.append((json.dumps(data), seq))
+            taken.add(data[id_col])
+        if not remap:
+            return {}
+        conn.executemany("UPDATE rows SET data = ? WHERE seq = ?", updates)
+        for child, col in FOREIGN_KEYS.get(name, []):
+            meta = self._meta(conn, child)
+            if meta is None or col not in meta["header"]:
+                continue
+            c = meta["header"].index(col)
+            child_updates = []
+            for seq, data in self._rows(conn, child, pending_only=True):
+                if data[c] in remap:
+                    data[c] = remap[data[c]]
+                    child_updates.append((json.dumps(data), seq))
+            if child_updates:
+                conn.executemany("UPDATE rows SET data = ? WHERE seq = ?", child_updates)
+                self._bump(conn, child)
+        return remap
+
+    def _merge(self, conn, name, meta, header, remote_rows):
+        # Fold the sheet's current rows into a pending rewrite. Per distinct
+        # row: local count + remote count - base count, so additions and
+        # deletions from either side both apply and an edit is a deletion
+        # plus an addition. Where both sides changed the same id, the remote
+        # version goes. New local rows whose id the sheet has taken meanwhile
+        # are renumbered as in a pull. Returns that remap.
+        local_header = meta["header"]
+        width = len(local_header)
+        remote = [tuple(_cells(_realign(_cells(r, len(header)), header, local_header), width)) for r in remote_rows]
+        base = [tuple(json.loads(d)) for (d,) in conn.execute("SELECT data FROM base WHERE tbl = ?", (name,))]
+        local = [tuple(data) for _, data in self._rows(conn, name)]
+        keep = Counter(local)
+        keep.update(remote)
+        keep.subtract(base)
+
+        base_set = set(base)
+        id_col = local_header.index("id") if "id" in local_header else None
+        base_ids = {r[id_col] for r in base} if id_col is not None else set()
+        changed_locally = {r[id_col] for r in set(local) - base_set} & base_ids if id_col is not None else set()
+        # Sheet order; a local version takes the place of the remote row it replaces
+        slot = {}
+        if id_col is not None:
+            for i, row in enumerate(remote):
+                slot.setdefault(row[id_col], i)
+        merged = []
+        for source, rows in (("remote", remote), ("local", local)):
+            for i, row in enumerate(rows):
+                if keep[row] <= 0:
+                    continue
+                if source == "remote" and id_col is not None and row[id_col] in changed_locally and row not in base_set:
+                    continue
+                keep[row] -= 1
+                if source == "remote":
+                    merged.append(((i, 0), True, row))
+                else:
+                    # New local rows stay unpushed so their ids get checked
+                    synced = id_col is None or row[id_col] in base_ids
+                    at = slot.get(row[id_col], len(remote)) if synced and id_col is not None else len(remote)
+                    merged.append(((at, 1), synced, row))
+        merged = [(synced, row) for _, synced, row in sorted(merged, key=lambda m: m[0])]
+
+        if [r for _, r in merged] != local:
+            conn.execute("DELETE FROM rows WHERE tbl = ?", (name,))
+            conn.executemany(
+                "INSERT INTO rows (tbl, pos, data) VALUES (?, ?, ?)",
+                [(name, i if synced else None, json.dumps(list(r))) for i, (synced, r) in enumerate(merged)],
+            )
+            self._bump(conn, name)
+        # Later merges only need what changes on the sheet from now on
+        self._set_base(conn, name, [list(r) for r in remote])
+        return self._resolve_ids(conn, name)
+
+    def rewritten(self, name):
+        # A local rewrite is waiting to be pushed
+        with self._lock:
+            meta = self._meta(self._conn, name)
+        return bool(meta and meta["pending_replace"])
+
+    def take_push(self, name):
+        # What needs to go up for this table: ('replace', header, rows) or ('append', header, rows)
+        with self._lock:
+            meta = self._meta(self._conn, name)
+            if meta is None:
+                return None
+            if meta["pending_replace"]:
+                rows = self._rows(self._conn, name)
+                return "replace", meta["header"], rows, meta["version"]
+            pending = self._rows(self._conn, name, pending_only=True)
+            if not pending:
+                return None
+            return "append", meta["header"], pending, meta["version"]
+
+    def mark_pushed(self, name, kind, seqs, version, values=None):
+        with self._lock, self._tx() as conn:
+            meta = self._meta(conn, name)
+            if meta["pending_replace"] and (kind == "append" or meta["version"] != version):
+                # Rewritten locally while we were pushing; that rewrite goes up
+                # next, merged against what the sheet now holds
+                if kind == "replace":
+                    self._set_base(conn, name, values)
+                return
+            if kind == "replace":
+                # Rows appended while the snapshot was in flight stay unpushed
+                start = 0
+                conn.execute("UPDATE rows SET pos = NULL WHERE tbl = ?", (name,))
+            else:
+                start = meta["remote_rows"] or 0
+            conn.executemany(
+                "UPDATE rows SET pos = ? WHERE seq = ?",
+                [(start + i, seq) for i, seq in enumerate(seqs)],
+            )
+            conn.execute(
+                "UPDATE tables SET remote_rows = ?, pending_replace = 0 WHERE name = ?",
+                (start + len(seqs), name),
+            )
+            conn.execute("DELETE FROM base WHERE tbl = ?", (name,))
+
+    def mark_replace(self, name):
+        # Sheet missing or blank: send the whole local table next push
+        with self._lock, self._tx() as conn:
+            conn.execute("UPDATE tables SET pending_replace = 1, remote_rows = 0 WHERE name = ?", (name,))
+            conn.execute("DELETE FROM base WHERE tbl = ?", (name,))
+
+    def header(self, name):
+        with self._lock:
+            meta = self._meta(self._conn, name)
+        return meta["header"] if meta else []
+
+    def remote_rows(self, name):
+        with self._lock:
+            meta = self._meta(self._conn, name)
+        return None if meta is None else meta["remote_rows"]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class SyncEngine:
+    # Background thread reconciling a LocalMirror with the spreadsheet
+    def __init__(self, mirror, connect, interval=5.0, full_every=12):
+        self.mirror = mirror
+        # connect() -> gspread Spreadsheet; may raise when offline
+        self._connect = connect
+        self.interval = interval
+        self.full_every = full_every
+        self.last_error = None
+        self.last_sync = None
+        self._cycle = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="wlog-sync", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join()
+
+    def kick(self):
+        # Ask for a sync soon (after local writes)
+        self._wake.set()
+
+    def _loop(self):
+        backoff = self.interval
+        while not self._stop.is_set():
+            try:
+                self.sync_once()
+                backoff = self.interval
+            except Exception as e:
+                # Offline or API error: keep working locally, retry later
+                self.last_error = repr(e)
+                backoff = min(backoff * 2, 300)
+            self._wake.wait(backoff)
+            self._wake.clear()
+            # Let bursts of writes (a whole workout save) collapse into one push
+            self._stop.wait(0.5)
+
+    def _worksheet(self, sh, name, header):
+        try:
+            return sh.worksheet(name)
+        except gspread.WorksheetNotFound:
+            ws = sh.add_worksheet(title=name, rows=100, cols=max(20, len(header)))
+            return ws
+
+    def sync_once(self):
+        sh = self._connect()
+        full = self._cycle % self.full_every == 0
+        self._cycle += 1
+        for name in self.mirror.tables():
+            self._pull(sh, name, full)
+        for name in self.mirror.tables():
+            self._push(sh, name)
+        self.last_sync = time.time()
+        self.last_error = None
+
+    def _pull(self, sh, name, full):
+        known = self.mirror.remote_rows(name)
+        try:
+            ws = sh.worksheet(name)
+        except gspread.WorksheetNotFound:
+            # Nothing remote yet, push creates it from the local table
+            self.mirror.mark_replace(name)
+            return
+        if full or known is None or self.mirror.rewritten(name):
+            values = ws.get_all_values()
+            if not values:
+                self.mirror.mark_replace(name)
+                return
+            remote_header = [h.strip() for h in values[0]]
+            self.mirror.apply_pull(name, remote_header, values[1:], full=True)
+        else:
+            # Only rows past what we already have (+1 for the header row)
+            last_col = _col_letter(len(self.mirror.header(name)))
+            values = ws.get(f"A{known + 2}:{last_col}")
+            self.mirror.apply_pull(name, self.mirror.header(name), values, full=False)
+
+    def _push(self, sh, name):
+        job = self.mirror.take_push(name)
+        if job is None:
+            return
+        kind, header, rows, version = job
+        ws = self._worksheet(sh, name, header)
+        seqs = [seq for seq, _ in rows]
+        values = [data for _, data in rows]
+        if kind == "replace":
+            ws.clear()
+            ws.update([header] + values)
+        else:
+            ws.append_rows(values)
+        self.mirror.mark_pushed(name, kind, seqs, version, values)
@@ -0,0 +1,193 @@
+import threading
+
+import gspread
+
+# Versioned schema migrations for the WLog spreadsheet.
+#
+# The applied version lives in a 'meta' worksheet. migrate(sh) runs the
+# steps above it in order, recording each one as it lands, so a failure
+# resumes where it stopped. Every step is idempotent: rerunning one on an
+# already migrated sheet changes nothing. Once a spreadsheet is current,
+# the data layer assumes SCHEMA and never re-checks headers.
+#
+# So SCHEMA only changes together with a new step appended to MIGRATIONS
+# that brings existing sheets to it (an _add_columns over the new column
+# lists, say). The steps below read the tables as of their own version,
+# _V1, never SCHEMA: what an applied version did must not change later.
+
+SCHEMA = {
+    "exercises": ["id", "name", "target_muscle", "instructions", "difficulty", "category"],
+    "workouts": ["id", "timestamp", "total_volume", "session_name", "duration_minutes"],
+    "log_entries": ["id", "workout_id", "exercise_id", "set_order", "weight", "reps"],
+    "sessions": ["id", "name", "created_at"],
+    "session_items": ["id", "session_id", "exercise_id", "item_order"],
+    "tombstones": ["table", "row_id", "deleted_at"],
+}
+
+# The tables as version 1 (steps 1-4) leaves them
+_V1 = {
+    "exercises": ["id", "name", "target_muscle", "instructions", "difficulty", "category"],
+    "workouts": ["id", "timestamp", "total_volume", "session_name", "duration_minutes"],
+    "log_entries": ["id", "workout_id", "exercise_id", "set_order", "weight", "reps"],
+    "sessions": ["id", "name", "created_at"],
+    "session_items": ["id", "session_id", "exercise_id", "item_order"],
+    "tombstones": ["table", "row_id", "deleted_at"],
+}
+
+META = "meta"
+
+# Header spellings seen in hand-made or older sheets
+_ALIASES = {
+    "muscle": "target_muscle",
+    "target": "target_muscle",
+    "muscle_group": "target_muscle",
+    "date": "timestamp",
+    "volume": "total_volume",
+    "session": "session_name",
+    "duration": "duration_minutes",
+    "order": "item_order",
+}
+
+# Whole-number columns, stored as "3" rather than "3.0"
+_INT_COLUMNS = {
+    "exercises": ["id", "difficulty"],
+    "workouts": ["id", "duration_minutes"],
+    "log_entries": ["id", "workout_id", "exercise_id", "set_order", "reps"],
+    "sessions": ["id"],
+    "session_items": ["id", "session_id", "exercise_id", "item_order"],
+}
+
+# Blank cells the data layer would otherwise have to default on every read
+_DEFAULTS = {
+    "workouts": {"total_volume": "0", "duration_minutes": "0"},
+}
+
+_lock = threading.Lock()
+_current = set()  # spreadsheet ids already migrated by this process
+
+def _normalize(name):
+    return "_".join(str(name).strip().lower().split())
+
+def _header(ws):
+    values = ws.get("1:1")
+    return values[0] if values else []
+
+def _write_row1(ws, header):
+    ws.update(range_name="A1", values=[header])
+
+def _create_tables(sh):
+    # Every table exists under its canonical (lowercase) title
+    existing = {ws.title.lower(): ws for ws in sh.worksheets()}
+    for table, header in _V1.items():
+        ws = existing.get(table)
+        if ws is None:
+            ws = sh.add_worksheet(title=table, rows=100, cols=max(20, len(header)))
+            _write_row1(ws, header)
+        elif ws.title != table:
+            ws.update_title(table)
+
+def _fix_headers(sh):
+    # Normalized names, known aliases renamed (e.g. muscle -> target_muscle),
+    # and a header put back above the data when row 1 isn't one
+    for table, header in _V1.items():
+        ws = sh.worksheet(table)
+        values = ws.get_all_values()
+        if not values:
+            _write_row1(ws, header)
+            continue
+        fixed = [_ALIASES.get(_normalize(c), _normalize(c)) for c in values[0]]
+        if not set(fixed) & set(header):
+            if len(values[0]) > len(header):
+                raise ValueError(f"Unrecognized header in '{table}': {values[0]}")
+            # Row 1 is data: shift everything down under the header
+            ws.update(range_name="A1", values=[header] + values)
+        elif fixed != values[0]:
+            _write_row1(ws, fixed)
+
+def _add_columns(sh, schema=_V1):
+    # Columns of schema missing from a sheet go on the end
+    for table, header in schema.items():
+        ws = sh.worksheet(table)
+        current = _header(ws)
+        missing = [c for c in header if c not in current]
+        if missing:
+            _write_row1(ws, current + missing)
+
+def _as_int_text(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return value
+    return str(int(number)) if number.is_integer() else value
+
+def _backfill_types(sh):
+    # Whole numbers written as floats and blank defaults, fixed in one write per sheet
+    for table in _V1:
+        ints = _INT_COLUMNS.get(table, [])
+        defaults = _DEFAULTS.get(table, {})
+        if not ints and not defaults:
+            continue
+        ws = sh.worksheet(table)
+        values = ws.get_all_values()
+        if len(values) < 2:
+            continue
+        header = values[0]
+        positions = {c: i for i, c in enumerate(header)}
+        rows = [row + [""] * (len(header) - len(row)) for row in values[1:]]
+        changed = False
+        for row in rows:
+            for col in ints:
+                i = positions.get(col)
+                if i is not None and row[i] != _as_int_text(row[i]):
+                    row[i] = _as_int_text(row[i])
+                    changed = True
+            for col, default in defaults.items():
+                i = positions.get(col)
+                if i is not None and row[i].strip() == "":
+                    row[i] = default
+                    changed = True
+        if changed:
+            ws.update(range_name="A2", values=rows)
+
+# Append only: a step's position is its version number
+MIGRATIONS = [
+    _create_tables,
+    _fix_headers,
+    _add_columns,
+    _backfill_types,
+]
+
+def _meta_worksheet(sh):
+    try:
+        return sh.worksheet(META)
+    except gspread.WorksheetNotFound:
+        return None
+
+def schema_version(sh):
+    ws = _meta_worksheet(sh)
+    if ws is None:
+        return 0
+    for row in ws.get_all_values()[1:]:
+        if len(row) >= 2 and row[0] == "schema_version":
+            return int(row[1])
+    return 0
+
+def _set_version(sh, version):
+    ws = _meta_worksheet(sh)
+    if ws is None:
+        ws = sh.add_worksheet(title=META, rows=10, cols=2)
+    ws.update(range_name="A1", values=[["key", "value"], ["schema_version", str(version)]])
+
+def migrate(sh):
+    # Bring sh up to len(MIGRATIONS); a no-op after the first call per process
+    with _lock:
+        if sh.id in _current:
+            return
+        version = schema_version(sh)
+        if version > len(MIGRATIONS):
+            raise RuntimeError(f"Spreadsheet schema v{version} is newer than this app (v{len(MIGRATIONS)})")
+        for step in MIGRATIONS[version:]:
+            step(sh)
+            version += 1
+            _set_version(sh, version)
+        _current.add(sh.id)
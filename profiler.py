@@ -0,0 +1,157 @@
+import collections
+import contextlib
+import glob
+import json
+import os
+import sys
+import threading
+import time
+
+# Opt-in sampling profiler for app reruns.
+#
+# Enable with WLOG_PROFILE=1 or by opening the app with ?profile=1. Each
+# profiled rerun writes two files to WLOG_PROFILE_DIR (default 'profiles'):
+#
+#   <stamp>-<page>.collapsed  flame-graph input ("a;b;c <samples>" lines,
+#                             rooted at the page), e.g. for flamegraph.pl
+#                             or speedscope
+#   <stamp>-<page>.txt        top-N functions plus time per database_gsheets
+#                             entry point
+#
+# Only the newest WLOG_PROFILE_KEEP reports (default 50) are kept.
+# `python profiler.py` summarizes the kept reports per page.
+
+PROFILE_DIR = os.environ.get("WLOG_PROFILE_DIR", "profiles")
+KEEP = int(os.environ.get("WLOG_PROFILE_KEEP", "50"))
+INTERVAL = float(os.environ.get("WLOG_PROFILE_INTERVAL", "0.002"))
+TOP_N = 25
+
+_DB_FILE = "database_gsheets.py"
+
+def enabled(query_params=None):
+    if os.environ.get("WLOG_PROFILE") == "1":
+        return True
+    return query_params is not None and query_params.get("profile") == "1"
+
+def _qualname(code):
+    # co_qualname is 3.11+
+    return getattr(code, "co_qualname", code.co_name)
+
+def _label(code):
+    return f"{os.path.basename(code.co_filename)}:{_qualname(code)}"
+
+class Sampler:
+    # Samples one thread's Python stack from a background thread
+    def __init__(self, thread_id, interval=INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="wlog-profiler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            if stack:
+                # Root first, code objects resolved to labels when saving
+                self.stacks[tuple(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+def _safe(name):
+    return "".join(c if c.isalnum() else "_" for c in name).strip("_") or "page"
+
+def _report(page, stacks, wall):
+    total = sum(stacks.values()) or 1
+    ms = wall * 1000 / total  # wall time per sample
+    own = collections.Counter()
+    cumulative = collections.Counter()
+    db_calls = collections.Counter()
+    for stack, n in stacks.items():
+        labels = [_label(c) for c in stack]
+        own[labels[-1]] += n
+        for label in set(labels):
+            cumulative[label] += n
+        # Charge the outermost data layer function on the stack, looking
+        # through wrappers like the memoizer's closure
+        db_frames = [c for c in stack if os.path.basename(c.co_filename) == _DB_FILE]
+        named = [c for c in db_frames if "<locals>" not in _qualname(c)]
+        if db_frames:
+            db_calls[_qualname((named or db_frames)[0])] += n
+
+    lines = [f"page: {page}", f"wall: {wall * 1000:.1f} ms, {total} samples every {INTERVAL * 1000:g} ms", ""]
+    lines.append(f"{'cum ms':>9}{'own ms':>9}  function")
+    for label, n in cumulative.most_common(TOP_N):
+        lines.append(f"{n * ms:>9.1f}{own[label] * ms:>9.1f}  {label}")
+    lines += ["", f"{'ms':>9}  database_gsheets entry point"]
+    for name, n in db_calls.most_common():
+        lines.append(f"{n * ms:>9.1f}  {name}")
+    summary = {"page": page, "wall_ms": round(wall * 1000, 1), "db_ms": {k: round(v * ms, 1) for k, v in db_calls.items()}}
+    return "\n".join(lines) + "\n\n" + json.dumps(summary) + "\n"
+
+def _collapsed(page, stacks):
+    out = []
+    for stack, n in stacks.items():
+        out.append(";".join([f"page:{page}"] + [_label(c) for c in stack]) + f" {n}")
+    return "\n".join(out) + "\n"
+
+def _trim(directory, keep):
+    # Ring: drop the oldest reports beyond keep (both files of each)
+    stems = sorted({p.rsplit(".", 1)[0] for p in glob.glob(os.path.join(directory, "*.txt"))})
+    for stem in stems[:max(0, len(stems) - keep)]:
+        for ext in (".txt", ".collapsed"):
+            with contextlib.suppress(OSError):
+                os.remove(stem + ext)
+
+def save(page, stacks, wall, directory=PROFILE_DIR, keep=KEEP):
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns() % 10**9:09d}-{_safe(page)}")
+    with open(stem + ".collapsed", "w") as f:
+        f.write(_collapsed(page, stacks))
+    with open(stem + ".txt", "w") as f:
+        f.write(_report(page, stacks, wall))
+    _trim(directory, keep)
+    return stem
+
+@contextlib.contextmanager
+def rerun(page_of, query_params=None):
+    # Profile the block if enabled; page_of() names the page once it has run
+    if not enabled(query_params):
+        yield
+        return
+    sampler = Sampler(threading.get_ident()).start()
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - t0
+        save(page_of() or "unknown", sampler.stop(), wall)
+
+def summarize(directory=PROFILE_DIR):
+    # Mean wall time per page and data layer time per function, over the ring
+    pages = collections.defaultdict(list)
+    db = collections.defaultdict(lambda: collections.defaultdict(float))
+    for path in sorted(glob.glob(os.path.join(directory, "*.txt"))):
+        with open(path) as f:
+            summary = json.loads(f.read().rstrip().rsplit("\n", 1)[-1])
+        pages[summary["page"]].append(summary["wall_ms"])
+        for name, value in summary["db_ms"].items():
+            db[summary["page"]][name] += value
+    for page, walls in sorted(pages.items()):
+        print(f"{page}: {len(walls)} reruns, mean {sum(walls) / len(walls):.1f} ms, max {max(walls):.1f} ms")
+        for name, value in sorted(db[page].items(), key=lambda kv: -kv[1]):
+            print(f"    {value / len(walls):>8.1f} ms  {name}")
+
+if __name__ == "__main__":
+    summarize(sys.argv[1] if len(sys.argv) > 1 else PROFILE_DIR)
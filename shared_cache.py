@@ -0,0 +1,245 @@
+import contextlib
+import os
+import sqlite3
+import stat
+import threading
+import time
+import uuid
+
+import pyarrow as pa  # ships with streamlit
+
+# Second-level table cache shared by the server processes on one host
+# (WLOG_SHARED_CACHE).
+#
+# Each session keeps its own copies of the tables it reads. On a miss the
+# data layer looks here before calling Sheets, and a fill by any process
+# then serves every other one. Entries are raw worksheet frames, before
+# tombstones are applied. They are stored as Arrow IPC streams of string
+# columns: plain data, so whoever can write the store can at worst poison
+# the cache, never run code in the app.
+#
+# Every key has a generation. A writer publishes an invalidation by
+# bumping it, which also drops the stored frame. A fill is only stored if
+# the generation it read before fetching is still current, so a frame read
+# while a write was landing never shadows that write. Sessions compare the
+# generations they loaded at with the current ones to notice writes made
+# by other processes.
+#
+# lock(key) is a lease shared by the same processes: the data layer holds
+# it between reading row positions and deleting or updating by them, so
+# two processes never shift rows under each other. A holder that dies
+# frees it after ttl seconds.
+#
+#   WLOG_SHARED_CACHE=/var/lib/wlog/shared.sqlite3   SQLite file (default store)
+#   WLOG_SHARED_CACHE=redis://localhost:6379/0       Redis (needs the redis package)
+#
+# Keep the SQLite file in a directory only the app's user can write (not a
+# shared one like /tmp). It is created private (0600), and an existing file
+# another user owns or can write is refused.
+
+def _encode(df):
+    # Raw worksheet frames: string columns, header names may repeat
+    table = pa.Table.from_arrays(
+        [pa.array(df.iloc[:, i].tolist(), type=pa.string()) for i in range(df.shape[1])],
+        names=[str(c) for c in df.columns],
+    )
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def _decode(blob):
+    return pa.ipc.open_stream(blob).read_all().to_pandas()
+
+def _private_file(path):
+    # Create the file 0600; refuse one someone else could have written
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        info = os.fstat(fd)
+    finally:
+        os.close(fd)
+    if info.st_uid != os.getuid() or info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError(f"Shared cache file {path} must be owned by this user and not group/world writable")
+
+@contextlib.contextmanager
+def _lease(store, key, ttl, wait):
+    owner = uuid.uuid4().hex
+    deadline = time.time() + wait
+    while not store._acquire(key, owner, ttl):
+        if time.time() > deadline:
+            raise TimeoutError(f"Lock '{key}' is held by another process")
+        time.sleep(0.05)
+    try:
+        yield
+    finally:
+        store._release(key, owner)
+
+class SQLiteStore:
+    def __init__(self, path):
+        self.path = path
+        _private_file(path)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS generations (
+                key TEXT PRIMARY KEY,
+                generation INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                generation INTEGER NOT NULL,
+                value BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS locks (
+                key TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires REAL NOT NULL
+            );
+        """)
+
+    def _tx(self):
+        # BEGIN IMMEDIATE keeps other processes on the same file out until commit
+        conn = self._conn
+        class _Tx:
+            def __enter__(self_):
+                conn.execute("BEGIN IMMEDIATE")
+                return conn
+            def __exit__(self_, exc_type, exc, tb):
+                conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return _Tx()
+
+    def _generation(self, conn, key):
+        row = conn.execute("SELECT generation FROM generations WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def generations(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT key, generation FROM generations WHERE key IN ({','.join('?' * len(keys))})", keys
+            ).fetchall()
+        found = dict(rows)
+        return {k: found.get(k, 0) for k in keys}
+
+    def get(self, key):
+        # (current generation, value or None)
+        with self._lock:
+            gen = self._generation(self._conn, key)
+            row = self._conn.execute("SELECT generation, value FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None or row[0] != gen:
+            return gen, None
+        return gen, _decode(row[1])
+
+    def put(self, key, generation, value):
+        # Store value filled at generation; False if a writer moved it since
+        blob = _encode(value)
+        with self._lock, self._tx() as conn:
+            if self._generation(conn, key) != generation:
+                return False
+            conn.execute("INSERT OR REPLACE INTO entries (key, generation, value) VALUES (?, ?, ?)",
+                         (key, generation, blob))
+        return True
+
+    def invalidate(self, key):
+        # Publish a write: new generation, stored value dropped
+        with self._lock, self._tx() as conn:
+            gen = self._generation(conn, key) + 1
+            conn.execute("INSERT OR REPLACE INTO generations (key, generation) VALUES (?, ?)", (key, gen))
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        return gen
+
+    def lock(self, key, ttl=60.0, wait=120.0):
+        return _lease(self, key, ttl, wait)
+
+    def _acquire(self, key, owner, ttl):
+        now = time.time()
+        with self._lock, self._tx() as conn:
+            row = conn.execute("SELECT expires FROM locks WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[0] > now:
+                return False
+            conn.execute("INSERT OR REPLACE INTO locks (key, owner, expires) VALUES (?, ?, ?)", (key, owner, now + ttl))
+        return True
+
+    def _release(self, key, owner):
+        with self._lock, self._tx() as conn:
+            conn.execute("DELETE FROM locks WHERE key = ? AND owner = ?", (key, owner))
+
+class RedisStore:
+    # Same contract on a Redis server, for replicas on several hosts
+    def __init__(self, url, prefix="wlog"):
+        import redis
+        self._redis = redis
+        self._r = redis.Redis.from_url(url)
+        self._prefix = prefix
+
+    def _gen_key(self, key):
+        return f"{self._prefix}:gen:{key}"
+
+    def _data_key(self, key):
+        return f"{self._prefix}:data:{key}"
+
+    def generations(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = self._r.mget([self._gen_key(k) for k in keys])
+        return {k: int(v or 0) for k, v in zip(keys, values)}
+
+    def get(self, key):
+        gen, blob = self._r.mget([self._gen_key(key), self._data_key(key)])
+        gen = int(gen or 0)
+        if blob is None:
+            return gen, None
+        # b"<generation>:" then the frame
+        stored, _, data = blob.partition(b":")
+        return gen, (_decode(data) if int(stored) == gen else None)
+
+    def put(self, key, generation, value):
+        blob = f"{generation}:".encode() + _encode(value)
+        with self._r.pipeline() as pipe:
+            try:
+                pipe.watch(self._gen_key(key))
+                if int(pipe.get(self._gen_key(key)) or 0) != generation:
+                    return False
+                pipe.multi()
+                pipe.set(self._data_key(key), blob)
+                pipe.execute()
+                return True
+            except self._redis.WatchError:
+                return False
+
+    def invalidate(self, key):
+        with self._r.pipeline() as pipe:
+            pipe.incr(self._gen_key(key))
+            pipe.delete(self._data_key(key))
+            gen, _ = pipe.execute()
+        return int(gen)
+
+    def lock(self, key, ttl=60.0, wait=120.0):
+        return _lease(self, key, ttl, wait)
+
+    def _acquire(self, key, owner, ttl):
+        return bool(self._r.set(f"{self._prefix}:lock:{key}", owner, nx=True, px=int(ttl * 1000)))
+
+    def _release(self, key, owner):
+        # Only our own lease: it may have expired and gone to someone else
+        lock_key = f"{self._prefix}:lock:{key}"
+        with self._r.pipeline() as pipe:
+            try:
+                pipe.watch(lock_key)
+                if pipe.get(lock_key) != owner.encode():
+                    return
+                pipe.multi()
+                pipe.delete(lock_key)
+                pipe.execute()
+            except self._redis.WatchError:
+                pass
+
+def open_store(url):
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisStore(url)
+    return SQLiteStore(url)
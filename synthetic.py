@@ -0,0 +1,114 @@
+import argparse
+import csv
+import datetime
+import os
+
+import numpy as np
+
+from migrations import SCHEMA
+
+# Seeded synthetic WLog datasets, in the shape of the worksheets.
+#
+# generate() returns {table: [header, *rows]} with every cell a string, as
+# the Sheets API would return it. The same seed and end date always give
+# the same data. load() writes a dataset into a spreadsheet (the in-memory
+# one from local_backend for benchmarks, or a scratch copy of the real one):
+#
+#   python synthetic.py --log-entries 100000 --csv synthetic/
+
+MUSCLES = ["Chest", "Back", "Legs", "Shoulders", "Arms", "Core", "Cardio"]
+CATEGORIES = ["Strength", "Hypertrophy", "Endurance", "Mobility", "Cardio", "Custom"]
+MOVES = ["Press", "Row", "Squat", "Curl", "Raise", "Pulldown", "Deadlift", "Lunge", "Fly", "Extension"]
+
+def generate(seed=0, years=5, workouts=1500, log_entries=100_000, exercises=500,
+             sessions=12, items_per_session=6, deleted=0.01, end=None):
+    rng = np.random.default_rng(seed)
+    end = end or datetime.date.today()
+    tables = {name: [list(header)] for name, header in SCHEMA.items()}
+
+    # Exercises: unique names, a base working weight each
+    muscles = rng.choice(MUSCLES, exercises)
+    base_weight = rng.uniform(5, 120, exercises).round(1)
+    for i in range(exercises):
+        name = f"{muscles[i]} {MOVES[i % len(MOVES)]} {i + 1}"
+        tables["exercises"].append([
+            str(i + 1), name, muscles[i], f"Synthetic exercise {i + 1}",
+            str(rng.integers(1, 4)), CATEGORIES[i % len(CATEGORIES)],
+        ])
+
+    # Routines
+    routine_items = []
+    created = (end - datetime.timedelta(days=int(365 * years))).isoformat()
+    for s in range(sessions):
+        tables["sessions"].append([str(s + 1), f"Routine {s + 1}", created])
+        picks = rng.choice(exercises, items_per_session, replace=False) + 1
+        routine_items.append(picks)
+        for order, eid in enumerate(picks):
+            tables["session_items"].append([str(len(tables["session_items"])), str(s + 1), str(eid), str(order)])
+
+    # Workouts spread over the period, in time order
+    span = int(365 * years * 24 * 3600)
+    start = datetime.datetime.combine(end, datetime.time(20, 0)) - datetime.timedelta(seconds=span)
+    offsets = np.sort(rng.integers(0, span, workouts))
+    routine_of = rng.integers(-1, sessions, workouts)  # -1 = freestyle
+
+    # Sets: at least one per workout, the rest spread at random
+    per_workout = np.ones(workouts, dtype=int)
+    if log_entries > workouts:
+        per_workout += rng.multinomial(log_entries - workouts, np.full(workouts, 1 / workouts))
+    set_id = 1
+    for w in range(workouts):
+        n = per_workout[w]
+        pool = routine_items[routine_of[w]] if routine_of[w] >= 0 else rng.choice(exercises, 6, replace=False) + 1
+        ex_ids = rng.choice(pool, n)
+        progress = 0.7 + 0.5 * offsets[w] / span  # slow strength gains over the years
+        weights = (base_weight[ex_ids - 1] * progress * rng.uniform(0.85, 1.1, n) / 1.25).round() * 1.25
+        reps = rng.integers(3, 16, n)
+        for order in range(n):
+            tables["log_entries"].append([
+                str(set_id), str(w + 1), str(ex_ids[order]), str(order), str(weights[order]), str(reps[order]),
+            ])
+            set_id += 1
+        timestamp = (start + datetime.timedelta(seconds=int(offsets[w]))).strftime("%Y-%m-%d %H:%M:%S")
+        name = f"Routine {routine_of[w] + 1}" if routine_of[w] >= 0 else ""
+        tables["workouts"].append([
+            str(w + 1), timestamp, str(float((weights * reps).sum())), name, str(rng.integers(25, 95)),
+        ])
+
+    # A few soft-deleted workouts, as compaction would find them
+    now = datetime.datetime.combine(end, datetime.time(12, 0)).strftime("%Y-%m-%d %H:%M:%S")
+    for w in rng.choice(workouts, int(workouts * deleted), replace=False):
+        tables["tombstones"].append(["workouts", str(w + 1), now])
+    return tables
+
+def load(sh, tables):
+    # Replace each worksheet's contents with the dataset (header included)
+    for name, rows in tables.items():
+        ws = sh.worksheet(name)
+        ws.clear()
+        ws.append_rows(rows)
+
+def write_csv(tables, directory):
+    os.makedirs(directory, exist_ok=True)
+    for name, rows in tables.items():
+        with open(os.path.join(directory, f"{name}.csv"), "w", newline="") as f:
+            csv.writer(f).writerows(rows)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic WLog dataset")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--years", type=float, default=5)
+    parser.add_argument("--workouts", type=int, default=1500)
+    parser.add_argument("--log-entries", type=int, default=100_000)
+    parser.add_argument("--exercises", type=int, default=500)
+    parser.add_argument("--sessions", type=int, default=12)
+    parser.add_argument("--csv", default="synthetic", help="directory for one CSV per worksheet")
+    args = parser.parse_args(argv)
+
+    tables = generate(args.seed, args.years, args.workouts, args.log_entries, args.exercises, args.sessions)
+    write_csv(tables, args.csv)
+    for name, rows in tables.items():
+        print(f"{name:<15}{len(rows) - 1:>9} rows")
+
+if __name__ == "__main__":
+    main()
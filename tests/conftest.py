@@ -0,0 +1,33 @@
+import os
+import sys
+
+# Everything runs against the in-memory spreadsheet from local_backend
+os.environ.setdefault("WLOG_BACKEND", "local")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+import streamlit as st
+from streamlit import config, logger
+
+config.set_option("logger.level", "error")
+logger.set_log_level("error")
+
+import database_gsheets as database
+import local_backend
+import migrations
+
+@pytest.fixture
+def client():
+    return local_backend.reset_client()
+
+@pytest.fixture
+def sh(client, monkeypatch):
+    # A fresh, migrated WLog_DB with no session state and no compactor thread
+    monkeypatch.setattr(database, "_start_compactor", lambda: None)
+    database._reset_connections()
+    st.session_state.clear()
+    sh = client.open("WLog_DB")
+    migrations.migrate(sh)
+    yield sh
+    st.session_state.clear()
+    database._reset_connections()
@@ -0,0 +1,120 @@
+import threading
+import time
+
+# In-process stand-in for the parts of redis-py that shared_cache.RedisStore
+# uses (mget, get, set nx/px, incr, delete, WATCH/MULTI pipelines). Install
+# it as the 'redis' module; every from_url() with the same URL shares data.
+
+class WatchError(Exception):
+    pass
+
+_servers = {}
+_servers_lock = threading.Lock()
+
+class _Server:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.data = {}      # key -> (bytes, expires or None)
+        self.versions = {}  # key -> write counter, for WATCH
+
+    def read(self, key):
+        value = self.data.get(key)
+        if value is None:
+            return None
+        if value[1] is not None and value[1] <= time.time():
+            del self.data[key]
+            return None
+        return value[0]
+
+    def write(self, key, value, expires=None):
+        self.versions[key] = self.versions.get(key, 0) + 1
+        if value is None:
+            self.data.pop(key, None)
+        else:
+            self.data[key] = (value, expires)
+
+def _bytes(value):
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode()
+
+class Redis:
+    def __init__(self, server):
+        self._server = server
+
+    @classmethod
+    def from_url(cls, url):
+        with _servers_lock:
+            return cls(_servers.setdefault(url, _Server()))
+
+    def get(self, key):
+        with self._server.lock:
+            return self._server.read(key)
+
+    def mget(self, keys):
+        with self._server.lock:
+            return [self._server.read(k) for k in keys]
+
+    def set(self, key, value, nx=False, px=None):
+        with self._server.lock:
+            if nx and self._server.read(key) is not None:
+                return None
+            self._server.write(key, _bytes(value), time.time() + px / 1000 if px else None)
+            return True
+
+    def incr(self, key):
+        with self._server.lock:
+            value = int(self._server.read(key) or 0) + 1
+            self._server.write(key, _bytes(value))
+            return value
+
+    def delete(self, key):
+        with self._server.lock:
+            found = self._server.read(key) is not None
+            self._server.write(key, None)
+            return int(found)
+
+    def pipeline(self):
+        return Pipeline(self)
+
+class Pipeline:
+    def __init__(self, client):
+        self._client = client
+        self._watched = {}
+        self._queue = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._watched, self._queue = {}, None
+
+    def watch(self, *keys):
+        with self._client._server.lock:
+            for k in keys:
+                self._watched[k] = self._client._server.versions.get(k, 0)
+
+    def multi(self):
+        self._queue = []
+
+    def __getattr__(self, name):
+        # Immediate before multi() (or without watch), queued after
+        method = getattr(self._client, name)
+        def call(*args, **kwargs):
+            if self._queue is None and self._watched:
+                return method(*args, **kwargs)
+            if self._queue is None:
+                self._queue = []
+            self._queue.append((method, args, kwargs))
+            return self
+        return call
+
+    def execute(self):
+        server = self._client._server
+        with server.lock:
+            if any(server.versions.get(k, 0) != v for k, v in self._watched.items()):
+                self._watched, self._queue = {}, None
+                raise WatchError("Watched variable changed")
+            results = [method(*args, **kwargs) for method, args, kwargs in self._queue or []]
+        self._watched, self._queue = {}, None
+        return results
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+import streamlit as st
+
+import database_gsheets as database
+import synthetic
+
+@pytest.fixture
+def data(sh):
+    synthetic.load(sh, synthetic.generate(log_entries=400, workouts=40, exercises=20, sessions=2))
+    database.prefetch(["workouts", "log_entries", "exercises"])
+    return sh
+
+def _same(a, b):
+    # Buckets emptied by a delete stay behind as zeros in the updated state
+    if isinstance(a, dict):
+        a = {k: v for k, v in a.items() if not (isinstance(v, float) and abs(v) < 1e-9)}
+        b = {k: v for k, v in b.items() if not (isinstance(v, float) and abs(v) < 1e-9)}
+        assert a.keys() == b.keys()
+        for k in a:
+            _same(a[k], b[k])
+    elif isinstance(a, tuple):
+        assert len(a) == len(b)
+        for x, y in zip(a, b):
+            _same(x, y)
+    elif isinstance(a, (int, float)):
+        assert a == pytest.approx(b)
+    else:
+        assert a == b
+
+def _matches_rebuild(state_key, build):
+    state = st.session_state[state_key]
+    assert state["versions"] == database.table_versions(database._AGG_TABLES if state_key == "gs_agg" else database._PR_TABLES)
+    _same({k: v for k, v in state.items() if k != "versions"}, build())
+
+def test_updates_match_a_rebuild(data):
+    database._aggregates()
+    database.new_records(1, [(1.0, 1)])
+    w = database.create_workout(750.0, "Extra", 40)
+    for i, (eid, weight, reps) in enumerate([(1, 200.0, 3), (2, 50.0, 10), (1, 210.0, 1)]):
+        database.log_set(w, eid, weight, reps, i)
+    _matches_rebuild("gs_agg", database._build_aggregates)
+    _matches_rebuild("gs_prs", database._build_prs)
+
+    victim = database.get_history()[3].id
+    database.delete_workout(victim)
+    database.delete_workout(w)
+    _matches_rebuild("gs_agg", database._build_aggregates)
+
+def test_records_after_a_delete(sh):
+    database.add_custom_exercise("Squat", "Legs")
+    heavy = database.create_workout(500.0, "A", 30)
+    database.log_set(heavy, 1, 100.0, 5, 0)
+    light = database.create_workout(400.0, "B", 30)
+    database.log_set(light, 1, 80.0, 5, 0)
+    assert "Heaviest weight" not in database.new_records(1, [(90.0, 5)])
+
+    database.delete_workout(heavy)
+    assert "Heaviest weight" in database.new_records(1, [(90.0, 5)])
+    assert database.new_records(1, [(70.0, 5)]) == []
+
+def test_lttb_keeps_the_ends_within_budget():
+    rng = np.random.default_rng(0)
+    x = np.arange(1000, dtype=float)
+    y = rng.normal(size=1000).cumsum()
+    for budget in (3, 10, 299):
+        keep = database._lttb(x, y, budget)
+        assert len(keep) == budget
+        assert keep[0] == 0 and keep[-1] == 999
+        assert (np.diff(keep) > 0).all()
+    assert (database._lttb(x[:5], y[:5], 10) == np.arange(5)).all()
+
+def test_chart_respects_its_point_budget(data):
+    for points in (5, 20):
+        chart = database.volume_chart("day", points)
+        assert 0 < len(chart) <= points
+        full = database.volume_chart("day", 10_000)
+        assert chart["date"].iloc[0] == full["date"].iloc[0]
+        assert chart["date"].iloc[-1] == full["date"].iloc[-1]
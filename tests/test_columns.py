@@ -0,0 +1,31 @@
+import streamlit as st
+
+import database_gsheets as database
+
+def _workouts(sh, rows):
+    sh.worksheet("workouts").update(range_name="A2", values=rows)
+
+def test_widening_after_rows_moved_rereads_everything(sh):
+    _workouts(sh, [["1", "2024-01-01 10:00:00", "100", "Push", "30"],
+                   ["2", "2024-01-02 10:00:00", "200", "Pull", "40"],
+                   ["3", "2024-01-03 10:00:00", "300", "Legs", "50"]])
+    assert database._get_df("workouts", ["id"])["id"].tolist() == ["1", "2", "3"]
+    # Another session (or the compactor) deletes row 2 and someone appends
+    sh.worksheet("workouts").delete_rows(3)
+    sh.worksheet("workouts").append_rows([["4", "2024-01-04 10:00:00", "400", "Core", "20"]])
+
+    df = database._get_df("workouts", ["id", "total_volume", "session_name"])
+    assert df.values.tolist() == [["1", "100", "Push"], ["3", "300", "Legs"], ["4", "400", "Core"]]
+
+def test_widening_a_current_frame_reads_only_the_new_columns(sh, client):
+    _workouts(sh, [["1", "2024-01-01 10:00:00", "100", "Push", "30"],
+                   ["2", "2024-01-02 10:00:00", "200", "Pull", "40"]])
+    database._get_df("workouts", ["id"])
+    client.counter.reset()
+    df = database._get_df("workouts", ["id", "total_volume"])
+    assert df.values.tolist() == [["1", "100"], ["2", "200"]]
+    assert client.counter.snapshot() == {"batch_get": 1}
+    # The full read widens the same frame
+    full = database._get_df("workouts")
+    assert full["session_name"].tolist() == ["Push", "Pull"]
+    assert "gs_cache_workouts" in st.session_state
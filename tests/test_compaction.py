@@ -0,0 +1,51 @@
+import database_gsheets as database
+
+def _workouts(n):
+    ids = []
+    for i in range(n):
+        w = database.create_workout(100.0, "Push", 30)
+        database.log_set(w, 1, 20.0, 5, 0)
+        ids.append(w)
+    return ids
+
+def test_no_tombstones_is_one_read(sh, client):
+    _workouts(3)
+    database.compact()
+    client.counter.reset()
+    assert database.compact() == 0
+    assert client.counter.snapshot() == {"get": 1}
+
+def test_below_the_ratio_writes_nothing(sh, client, monkeypatch):
+    ids = _workouts(20)
+    database.delete_workout(ids[0])
+    taken = []
+    monkeypatch.setattr(database, "_rows_lock", lambda sh: taken.append(sh))
+    client.counter.reset()
+    assert database.compact() == 0
+    assert "batch_update" not in client.counter.snapshot()
+    assert taken == []
+
+def test_above_the_ratio_drops_the_rows(sh):
+    ids = _workouts(4)
+    database.delete_workout(ids[0])
+    assert database.compact() == 2
+    assert len(sh.worksheet("tombstones").get_all_values()) == 1
+
+def test_pass_only_visits_spreadsheets_with_new_tombstones(sh, client, monkeypatch):
+    seen = []
+    monkeypatch.setattr(database, "_compact", lambda sh, force: seen.append(sh.id))
+    database._compaction_pass()
+    assert seen == []
+    database._compact_pending.add(None)
+    database._compaction_pass()
+    database._compaction_pass()
+    assert seen == [sh.id]
+
+def test_failed_pass_is_retried(sh, monkeypatch):
+    def fail(sh, force):
+        raise OSError("quota")
+    monkeypatch.setattr(database, "_compact", fail)
+    database._compact_pending.add(None)
+    database._compaction_pass()
+    assert database._compact_pending == {None}
+    database._compact_pending.clear()
@@ -0,0 +1,41 @@
+import streamlit as st
+
+import database_gsheets as database
+
+def test_deferred_export_needs_no_session(sh, monkeypatch):
+    # Tenant mode: the connection depends on session state, which a
+    # deferred download consumed elsewhere does not have
+    monkeypatch.setattr(database, "TENANTS", True)
+    database.set_tenant("a@example.com")
+    w = database.create_workout(100.0, "Push", 30)
+    for i in range(5):
+        database.log_set(w, 1, 20.0, 5, i)
+    st.session_state.pop("gs_cache_log_entries", None)
+    st.session_state.pop("gs_cols_log_entries", None)
+
+    chunks = database.export_history("csv", chunk_rows=2)
+    st.session_state.clear()
+    lines = b"".join(chunks).decode().splitlines()
+    assert len(lines) == 6
+    assert lines[1].split(",")[-2:] == ["20.0", "5"]
+
+def test_deferred_download_repeats(sh, monkeypatch):
+    # What the app hands to download_button, run the way Streamlit serves a
+    # deferred download: off the script run, possibly more than once
+    from streamlit.runtime.download_data_util import convert_data_to_bytes_and_infer_mime
+
+    monkeypatch.setattr(database, "TENANTS", True)
+    database.set_tenant("a@example.com")
+    w = database.create_workout(100.0, "Push", 30)
+    for i in range(5):
+        database.log_set(w, 1, 20.0, 5, i)
+    st.session_state.pop("gs_cache_log_entries", None)
+    st.session_state.pop("gs_cols_log_entries", None)
+
+    export = database.history_export("csv", chunk_rows=2)
+    data = lambda: b"".join(export())
+    st.session_state.clear()
+    first, _ = convert_data_to_bytes_and_infer_mime(data(), unsupported_error=TypeError())
+    second, _ = convert_data_to_bytes_and_infer_mime(data(), unsupported_error=TypeError())
+    assert first == second
+    assert len(first.decode().splitlines()) == 6
@@ -0,0 +1,30 @@
+import pytest
+import streamlit as st
+
+import database_gsheets as database
+
+def _items(sh):
+    rows = sh.worksheet("session_items").get_all_values()
+    header = rows[0]
+    return [dict(zip(header, r)) for r in rows[1:]]
+
+@pytest.mark.parametrize("fresh_session", [False, True])
+def test_items_hidden_by_a_tombstone_keep_their_ids(sh, fresh_session):
+    database.create_session("R1", [1, 2])
+    database.create_session("R2", [3, 4])
+    r2 = database.get_session_by_name("R2")
+    database.delete_session(r2)
+    if fresh_session:
+        # Another session, which only ever sees R2's items filtered out
+        st.session_state.clear()
+    database.create_session("R3", [5, 1])
+    r3 = database.get_session_by_name("R3")
+    database.update_session_by_id(r3, "R3", [1, 5])
+
+    items = _items(sh)
+    ids = [r["id"] for r in items]
+    assert len(ids) == len(set(ids))
+    r2_items = [(r["exercise_id"], r["item_order"]) for r in items if r["session_id"] == str(r2)]
+    assert r2_items == [("3", "0"), ("4", "1")]
+    r3_items = sorted((int(r["item_order"]), r["exercise_id"]) for r in items if r["session_id"] == str(r3))
+    assert [e for _, e in r3_items] == ["1", "5"]
@@ -0,0 +1,87 @@
+import copy
+
+import streamlit as st
+
+import database_gsheets as database
+
+ROWS = [["1", "Push", "2024-01-01"], ["2", "Pull", "2024-01-02"], [], ["4", "Legs", "2024-01-04"], ["5", "Core", "2024-01-05"]]
+
+def _sessions(sh):
+    ws = sh.worksheet("sessions")
+    ws.update(range_name="A2", values=ROWS)
+    return ws
+
+def test_blank_row_at_a_chunk_end_does_not_end_the_table(sh):
+    ws = _sessions(sh)
+    header, chunks = database._range_chunks(sh, ws, rows=3)
+    rows = [r for chunk in chunks for r in chunk]
+    assert header == ["id", "name", "created_at"]
+    # The blank row keeps its place, so positions still match the sheet
+    assert rows == [r or ["", "", ""] for r in ROWS]
+
+def test_chunked_load_reads_every_row(sh, monkeypatch):
+    _sessions(sh)
+    monkeypatch.setattr(database, "_LOAD_CHUNK", 3)
+    st.session_state.clear()
+    assert database._get_df("sessions")["name"].tolist() == ["Push", "Pull", "", "Legs", "Core"]
+
+def test_one_call_when_the_chunk_covers_the_grid(sh, client):
+    ws = _sessions(sh)
+    client.counter.reset()
+    list(database._range_chunks(sh, ws, rows=ws.row_count)[1])
+    assert client.counter.snapshot() == {"get": 1}
+
+def test_a_load_is_one_read(sh, client):
+    _sessions(sh)
+    st.session_state.clear()
+    database._get_df("tombstones")
+    client.counter.reset()
+    assert len(database._get_df("sessions")) == 5
+    # Header and rows in the same read
+    assert client.counter.snapshot().get("get") == 1
+
+def test_rows_past_a_stale_grid_size_are_read(sh, client, monkeypatch):
+    ws = _sessions(sh)
+    # The cached handle's grid ends with the first chunk, the sheet has
+    # grown since
+    stale = copy.copy(ws)
+    grid = type(ws).row_count
+    monkeypatch.setattr(type(ws), "row_count", property(lambda self: 3 if self is stale else grid.fget(self)))
+    monkeypatch.setattr(database, "_ws_handles", {sh.id: {"sessions": stale}})
+    monkeypatch.setattr(database, "_LOAD_CHUNK", 2)
+    st.session_state.clear()
+    assert database._get_df("sessions")["name"].tolist() == ["Push", "Pull", "", "Legs", "Core"]
+
+def _slow_reads(monkeypatch):
+    # Reads stay in flight until the event is set
+    import threading
+    release = threading.Event()
+    fetch = database._fetch_table
+    def slow(sh, name):
+        release.wait(5)
+        return fetch(sh, name)
+    monkeypatch.setattr(database, "_fetch_table", slow)
+    return release
+
+def test_concurrent_misses_share_one_read(sh, client, monkeypatch):
+    _sessions(sh)
+    release = _slow_reads(monkeypatch)
+    client.counter.reset()
+    a = database._submit_fetch(sh, "sessions")
+    b = database._submit_fetch(sh, "sessions")
+    release.set()
+    assert a is b
+    assert len(a.result()[1]) == 5
+    assert client.counter.snapshot().get("get") == 1
+
+def test_a_miss_after_a_write_does_not_join_an_older_read(sh, monkeypatch):
+    _sessions(sh)
+    # This session's caches are loaded, another one misses
+    database.prefetch(["sessions", "session_items"])
+    release = _slow_reads(monkeypatch)
+    before = database._submit_fetch(sh, "sessions")
+    database.create_session("New", [1])
+    after = database._submit_fetch(sh, "sessions")
+    release.set()
+    assert after is not before
+    assert "New" in after.result()[1]["name"].tolist()
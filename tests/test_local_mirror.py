@@ -0,0 +1,80 @@
+import local_backend
+from local_mirror import LocalMirror, SyncEngine
+
+HEADER = ["id", "name", "value"]
+
+def _setup(tmp_path, rows):
+    # A sheet and a mirror that has pulled it
+    sh = local_backend.LocalClient().open("WLog_DB")
+    ws = sh.add_worksheet("workouts", rows=100, cols=len(HEADER))
+    ws.update([HEADER] + rows)
+    mirror = LocalMirror(str(tmp_path / "mirror.sqlite3"))
+    mirror.ensure_table("workouts", HEADER)
+    engine = SyncEngine(mirror, lambda: sh)
+    engine.sync_once()
+    return sh, ws, mirror, engine
+
+def _local(mirror, name="workouts"):
+    return mirror.read_df(name)[0].values.tolist()
+
+def test_remote_append_survives_local_rewrite(tmp_path):
+    sh, ws, mirror, engine = _setup(tmp_path, [["1", "a", "10"], ["2", "b", "20"]])
+    # Another device appends while this one rewrites the table offline
+    ws.append_rows([["3", "c", "30"]])
+    mirror.replace("workouts", HEADER, [["1", "a", "10"]])
+    engine.sync_once()
+    assert ws.get_all_values()[1:] == [["1", "a", "10"], ["3", "c", "30"]]
+    assert _local(mirror) == [["1", "a", "10"], ["3", "c", "30"]]
+    assert mirror.pending_counts()["workouts"] == {"rows": 0, "replace": False}
+
+def test_three_way_merge(tmp_path):
+    rows = [["1", "a", "10"], ["2", "b", "20"], ["3", "c", "30"], ["4", "d", "40"]]
+    sh, ws, mirror, engine = _setup(tmp_path, rows)
+    # Remote: edits 1, deletes 4, edits 3; local: deletes 2, edits 3
+    ws.clear()
+    ws.update([HEADER, ["1", "a2", "11"], ["2", "b", "20"], ["3", "remote", "30"]])
+    mirror.replace("workouts", HEADER, [["1", "a", "10"], ["3", "local", "30"], ["4", "d", "40"]])
+    engine.sync_once()
+    expected = [["1", "a2", "11"], ["3", "local", "30"]]
+    assert ws.get_all_values()[1:] == expected
+    assert _local(mirror) == expected
+
+def test_rewrite_after_rewrite_merges_against_pushed_rows(tmp_path):
+    sh, ws, mirror, engine = _setup(tmp_path, [["1", "a", "10"]])
+    mirror.replace("workouts", HEADER, [["1", "x", "10"]])
+    engine.sync_once()
+    ws.append_rows([["2", "b", "20"]])
+    mirror.replace("workouts", HEADER, [["1", "y", "10"]])
+    engine.sync_once()
+    assert ws.get_all_values()[1:] == [["1", "y", "10"], ["2", "b", "20"]]
+
+def test_new_local_row_renumbered_when_remote_took_its_id(tmp_path):
+    sh, ws, mirror, engine = _setup(tmp_path, [["1", "a", "10"]])
+    mirror.ensure_table("log_entries", ["id", "workout_id", "reps"])
+    ws.append_rows([["2", "remote", "20"]])
+    # Offline: a rewrite plus a new workout 2 with a set pointing at it
+    mirror.replace("workouts", HEADER, [["1", "a", "10"], ["2", "local", "5"]])
+    mirror.append("log_entries", [["1", "2", "8"]])
+    engine.sync_once()
+    assert ws.get_all_values()[1:] == [["1", "a", "10"], ["2", "remote", "20"], ["3", "local", "5"]]
+    assert sh.worksheet("log_entries").get_all_values()[1:] == [["1", "3", "8"]]
+
+def test_pull_renumbers_pending_rows_and_children(tmp_path):
+    sh, ws, mirror, engine = _setup(tmp_path, [["1", "a", "10"]])
+    mirror.ensure_table("log_entries", ["id", "workout_id", "reps"])
+    mirror.append("workouts", [["2", "local", "5"], ["3", "local2", "6"]])
+    mirror.append("log_entries", [["1", "2", "8"], ["2", "3", "9"], ["3", "1", "7"]])
+    ws.append_rows([["2", "remote", "20"], ["3", "remote2", "30"]])
+    engine.sync_once()
+    assert ws.get_all_values()[1:] == [
+        ["1", "a", "10"], ["2", "remote", "20"], ["3", "remote2", "30"], ["4", "local", "5"], ["5", "local2", "6"],
+    ]
+    # Sets follow their renumbered workouts, the one on a synced workout does not move
+    assert sh.worksheet("log_entries").get_all_values()[1:] == [["1", "4", "8"], ["2", "5", "9"], ["3", "1", "7"]]
+
+def test_blank_sheet_takes_the_local_table(tmp_path):
+    sh, ws, mirror, engine = _setup(tmp_path, [["1", "a", "10"]])
+    mirror.replace("workouts", HEADER, [["1", "a", "10"], ["2", "b", "20"]])
+    ws.clear()
+    engine.sync_once()
+    assert ws.get_all_values()[1:] == [["1", "a", "10"], ["2", "b", "20"]]
@@ -0,0 +1,21 @@
+import streamlit as st
+
+import database_gsheets as database
+import synthetic
+
+def _entries(name):
+    return [k for k in st.session_state["gs_memo"] if k[0] == name]
+
+def test_a_write_replaces_the_memoized_result(sh):
+    synthetic.load(sh, synthetic.generate(log_entries=10, workouts=2, exercises=10, sessions=1))
+    sid = database.get_all_sessions()[0].id
+    database.update_session_by_id(sid, "R1", [1, 2])
+    first = database.get_session_details(sid)
+    assert database.get_session_details(sid) is first
+    assert len(_entries("get_session_details")) == 1
+
+    database.update_session_by_id(sid, "R1", [3, 1, 2])
+    second = database.get_session_details(sid)
+    assert [str(e.id) for e in second] == ["3", "1", "2"]
+    # The entry was replaced, not joined by a new one
+    assert len(_entries("get_session_details")) == 1
@@ -0,0 +1,80 @@
+import pytest
+
+import local_backend
+import migrations
+
+def _spreadsheet():
+    return local_backend.LocalClient().open("WLog_DB")
+
+def _values(sh, table):
+    return sh.worksheet(table).get_all_values()
+
+def test_aliases_and_titles_are_normalized():
+    sh = _spreadsheet()
+    ws = sh.add_worksheet("Exercises")
+    ws.update([["ID", "Name", "Muscle Group", "Instructions", "Difficulty", "Category"],
+               ["1", "Squat", "Legs", "", "2", "Strength"]])
+    ws = sh.add_worksheet("Workouts")
+    ws.update([["id", "Date", "Volume", "Session", "Duration"], ["1", "2024-01-01 10:00:00", "500", "Push", "30.0"]])
+    migrations.migrate(sh)
+    assert _values(sh, "exercises")[0] == migrations.SCHEMA["exercises"]
+    assert _values(sh, "exercises")[1] == ["1", "Squat", "Legs", "", "2", "Strength"]
+    assert _values(sh, "workouts") == [migrations.SCHEMA["workouts"], ["1", "2024-01-01 10:00:00", "500", "Push", "30"]]
+    assert migrations.schema_version(sh) == len(migrations.MIGRATIONS)
+
+def test_data_in_row_one_gets_a_header_above_it():
+    sh = _spreadsheet()
+    ws = sh.add_worksheet("log_entries")
+    ws.update([["1", "1", "3", "0", "40", "10"], ["2", "1", "3", "1", "42.5", "8"]])
+    migrations.migrate(sh)
+    assert _values(sh, "log_entries") == [
+        migrations.SCHEMA["log_entries"], ["1", "1", "3", "0", "40", "10"], ["2", "1", "3", "1", "42.5", "8"],
+    ]
+
+def test_unrecognized_header_is_refused():
+    sh = _spreadsheet()
+    sh.add_worksheet("sessions").update([["a", "b", "c", "d"]])
+    with pytest.raises(ValueError):
+        migrations.migrate(sh)
+
+def test_interrupted_run_resumes_at_the_failed_step(monkeypatch):
+    sh = _spreadsheet()
+    sh.add_worksheet("sessions").update([["id", "name"], ["1", "Push"]])
+    calls = []
+    def step(fn, fail=False):
+        def run(sh):
+            calls.append(fn.__name__)
+            if fail:
+                raise RuntimeError("quota")
+            fn(sh)
+        run.__name__ = fn.__name__
+        return run
+    steps = [step(fn) for fn in migrations.MIGRATIONS]
+    monkeypatch.setattr(migrations, "MIGRATIONS", steps[:2] + [step(migrations._add_columns, fail=True)] + steps[3:])
+    with pytest.raises(RuntimeError):
+        migrations.migrate(sh)
+    assert migrations.schema_version(sh) == 2
+    assert sh.id not in migrations._current
+
+    calls.clear()
+    monkeypatch.setattr(migrations, "MIGRATIONS", steps)
+    migrations.migrate(sh)
+    assert calls == ["_add_columns", "_backfill_types"]
+    assert migrations.schema_version(sh) == len(steps)
+    assert _values(sh, "sessions") == [migrations.SCHEMA["sessions"], ["1", "Push"]]
+
+    # Current now: later calls don't touch the sheet
+    calls.clear()
+    migrations.migrate(sh)
+    assert calls == []
+
+def test_migrated_headers_match_the_schema():
+    # Fails when SCHEMA changes without a step that brings sheets to it
+    fresh = _spreadsheet()
+    old = local_backend.LocalClient().open("Old")
+    old.add_worksheet("sessions").update([["id", "name"], ["1", "Push"]])
+    old.add_worksheet("Workouts").update([["id", "Date", "Volume"]])
+    for sh in (fresh, old):
+        migrations.migrate(sh)
+        for table, header in migrations.SCHEMA.items():
+            assert _values(sh, table)[0] == header, table
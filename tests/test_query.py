@@ -0,0 +1,17 @@
+import database_gsheets as database
+
+def test_join_keeps_matches_only_first_one_wins(sh):
+    database.add_custom_exercise("Squat", "Legs")
+    database.add_custom_exercise("Row", "Back")
+    # A duplicate id further down: the first row with it is joined
+    database._append_row("exercises", [1, "Squat again", "Legs", "", 1, "Custom"])
+    w = database.create_workout(100.0, "Legs", 30)
+    database.log_set(w, 1, 60.0, 5, 0)
+    database.log_set(w, 9, 60.0, 5, 1)
+    database.log_set(w, 2, 40.0, 8, 2)
+
+    rows = (database.query("log_entries").where("workout_id", w)
+            .join("exercises", on="exercise_id").order_by("set_order", numeric=True).frame())
+    # The set of the unknown exercise 9 has no match and is left out
+    assert rows["name"].tolist() == ["Squat", "Row"]
+    assert rows["id_exercises"].astype(str).tolist() == ["1", "2"]
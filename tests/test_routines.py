@@ -0,0 +1,72 @@
+import random
+
+import pytest
+import streamlit as st
+
+import database_gsheets as database
+import synthetic
+
+def _items(sh, sid):
+    rows = [r for r in sh.worksheet("session_items").get_all_values()[1:] if r[1] == str(sid)]
+    return [int(r[2]) for r in sorted(rows, key=lambda r: int(r[3]))], [r[0] for r in rows]
+
+@pytest.fixture
+def data(sh):
+    synthetic.load(sh, synthetic.generate(log_entries=300, workouts=30, exercises=60, sessions=6))
+    # Hidden rows in between the live ones
+    database.delete_session(2)
+    return sh
+
+def test_randomized_edits_write_only_the_diff(data, client):
+    sh = data
+    hidden = _items(sh, 2)
+    rng = random.Random(1)
+    for trial in range(60):
+        sid = rng.choice([1, 3, 4, 5, 6])
+        new, _ = _items(sh, sid)
+        if rng.random() < 0.3:
+            rng.shuffle(new)
+        if rng.random() < 0.5 and new:
+            new.pop(rng.randrange(len(new)))
+        if rng.random() < 0.5:
+            new.insert(rng.randrange(len(new) + 1), rng.randint(1, 60))
+        if rng.random() < 0.1:
+            new = []
+        name = f"Routine {sid}" if rng.random() < 0.7 else f"Renamed {sid} {trial}"
+        database.prefetch(["sessions", "session_items"])
+        client.counter.reset()
+        if rng.random() < 0.5:
+            database.update_session_by_id(sid, name, new)
+        else:
+            old_name = database._get_df("sessions").set_index("id").loc[str(sid), "name"]
+            database.update_session(old_name, new, new_name=name)
+        calls = client.counter.snapshot()
+
+        got, ids = _items(sh, sid)
+        assert got == new, trial
+        assert len(set(ids)) == len(ids), trial
+        assert set(calls) <= {"values_batch_get", "batch_update", "worksheets"}, calls
+        # The session's cache matches a fresh read
+        cached = [database._get_df(t).reset_index(drop=True) for t in ("session_items", "sessions")]
+        st.session_state.clear()
+        for df, t in zip(cached, ("session_items", "sessions")):
+            assert df.equals(database._get_df(t).reset_index(drop=True)), (trial, t)
+        assert [int(d.id) for d in database.get_session_details(sid)] == new
+    assert _items(sh, 2) == hidden
+
+def test_update_refuses_an_id_on_several_rows(data):
+    sh = data
+    ws = sh.worksheet("session_items")
+    rows = ws.get_all_values()
+    first = next(r for r in rows[1:] if r[1] == "1")
+    ws.append_rows([[first[0], "3", first[2], "99"]])
+    before = ws.get_all_values()
+    st.session_state.clear()
+    current, _ = _items(sh, 1)
+    with pytest.raises(ValueError, match="matches 2 rows"):
+        database.update_session_by_id(1, "Routine 1", list(reversed(current)))
+    assert ws.get_all_values() == before
+
+def test_unknown_routine_is_an_error(data):
+    with pytest.raises(ValueError):
+        database.update_session("nope", [1])
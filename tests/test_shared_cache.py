@@ -0,0 +1,136 @@
+import os
+import pickle
+import sys
+import uuid
+
+import pandas as pd
+import pytest
+
+import shared_cache
+
+from . import fake_redis
+
+@pytest.fixture(params=["sqlite", "redis"])
+def stores(request, tmp_path, monkeypatch):
+    # Two handles on one store, standing in for two processes
+    if request.param == "sqlite":
+        path = str(tmp_path / "shared.sqlite3")
+        return lambda: shared_cache.SQLiteStore(path)
+    monkeypatch.setitem(sys.modules, "redis", fake_redis)
+    url = f"redis://fake/{uuid.uuid4().hex}"
+    return lambda: shared_cache.open_store(url)
+
+def _frame():
+    # Raw worksheet frames can repeat a header name
+    return pd.DataFrame([["1", "Push", "x"], ["2", "", "y"]], columns=["id", "name", "name"])
+
+def test_fill_invalidate_and_stale_fill(stores):
+    a, b = stores(), stores()
+    gen, value = a.get("s/workouts")
+    assert (gen, value) == (0, None)
+    assert a.put("s/workouts", gen, _frame())
+    gen, value = b.get("s/workouts")
+    assert gen == 0 and value.values.tolist() == _frame().values.tolist()
+    assert value.columns.tolist() == ["id", "name", "name"]
+
+    # A fill read before a write landed is refused
+    assert b.invalidate("s/workouts") == 1
+    assert not a.put("s/workouts", 0, _frame())
+    assert a.get("s/workouts") == (1, None)
+    assert b.generations(["s/workouts", "s/other"]) == {"s/workouts": 1, "s/other": 0}
+
+def test_empty_frames_round_trip(stores):
+    a = stores()
+    for df in (pd.DataFrame(), pd.DataFrame(columns=["id", "name"])):
+        key = f"k{len(df.columns)}"
+        a.put(key, 0, df)
+        got = a.get(key)[1]
+        assert got.shape == df.shape and got.columns.tolist() == df.columns.tolist()
+
+def test_cross_process_lock(stores):
+    a, b = stores(), stores()
+    with a.lock("rows/x"):
+        with pytest.raises(TimeoutError):
+            with b.lock("rows/x", wait=0.2):
+                pass
+        with b.lock("rows/y", wait=0.2):
+            pass
+    with b.lock("rows/x", wait=0.2):
+        pass
+    # A holder that died without releasing
+    assert a._acquire("rows/z", "dead", ttl=0.1)
+    with b.lock("rows/z", wait=2):
+        pass
+
+class _Exploit:
+    ran = False
+    def __reduce__(self):
+        return (setattr, (_Exploit, "ran", True))
+
+def test_stored_bytes_are_never_unpickled(tmp_path):
+    store = shared_cache.SQLiteStore(str(tmp_path / "shared.sqlite3"))
+    store._conn.execute("INSERT INTO entries (key, generation, value) VALUES (?, 0, ?)",
+                        ("s/workouts", pickle.dumps(_Exploit())))
+    with pytest.raises(Exception):
+        store.get("s/workouts")
+    assert not _Exploit.ran
+
+def test_sqlite_file_is_private(tmp_path):
+    path = str(tmp_path / "shared.sqlite3")
+    shared_cache.SQLiteStore(path)
+    assert os.stat(path).st_mode & 0o777 == 0o600
+    os.chmod(path, 0o666)
+    with pytest.raises(PermissionError):
+        shared_cache.SQLiteStore(path)
+
+def test_compaction_waits_for_another_process(sh, tmp_path, monkeypatch):
+    import threading
+    import time
+
+    import database_gsheets as database
+
+    path = str(tmp_path / "shared.sqlite3")
+    monkeypatch.setattr(database, "_shared", shared_cache.SQLiteStore(path))
+    database.create_session("R1", [1, 2])
+    database.delete_session(database.get_session_by_name("R1"))
+
+    other = shared_cache.SQLiteStore(path)
+    held = threading.Event()
+    def hold():
+        with other.lock(f"rows/{sh.id}"):
+            held.set()
+            time.sleep(0.3)
+    t = threading.Thread(target=hold)
+    t.start()
+    held.wait()
+    start = time.time()
+    assert database.compact(force=True) == 3
+    assert time.time() - start >= 0.25
+    t.join()
+    assert len(sh.worksheet("sessions").get_all_values()) == 1
+
+def test_data_layer_on_redis(sh, monkeypatch):
+    import streamlit as st
+
+    import database_gsheets as database
+
+    monkeypatch.setitem(sys.modules, "redis", fake_redis)
+    store = shared_cache.open_store(f"redis://fake/{uuid.uuid4().hex}")
+    monkeypatch.setattr(database, "_shared", store)
+    monkeypatch.setattr(database, "_SHARED_POLL", 0)
+    key = database._shared_key(sh, "workouts")
+
+    # A fill serves the next session; this session's write drops it
+    database.prefetch(["workouts"])
+    assert store.get(key)[1] is not None
+    w = database.create_workout(100.0, "Push", 30)
+    gen, value = store.get(key)
+    assert gen == 1 and value is None
+    st.session_state.clear()
+    assert database._get_df("workouts")["id"].tolist() == [str(w)]
+    assert store.get(key)[1]["id"].tolist() == [str(w)]
+
+    # Another process writes and publishes: this session's next read sees it
+    sh.worksheet("workouts").append_rows([["99", "2024-01-01 10:00:00", "5", "Elsewhere", "1"]])
+    store.invalidate(key)
+    assert database._get_df("workouts")["id"].tolist() == [str(w), "99"]
@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+
+import database_gsheets as database
+import migrations
+
+@pytest.fixture
+def tenants(sh, monkeypatch):
+    monkeypatch.setattr(database, "TENANTS", True)
+    return sh
+
+def _listed(sh):
+    return {row[0]: row[1] for row in sh.worksheet("tenants").get_all_values()[1:]}
+
+def test_first_use_creates_migrates_and_lists(tenants, client):
+    _, a = database._connection("a@x.com")
+    assert a.title == "WLog_DB - a@x.com"
+    assert migrations.schema_version(a) == len(migrations.MIGRATIONS)
+    assert _listed(tenants) == {"a@x.com": a.id}
+    assert client.counter.snapshot().get("create") == 1
+
+def test_tenant_listed_by_another_process_is_opened(tenants, client):
+    other = client.create("Made elsewhere")
+    database._directory().append_row(["b@x.com", other.id, "2024-01-01 00:00:00"])
+    client.counter.reset()
+    assert database._connection("b@x.com")[1] is other
+    assert "create" not in client.counter.snapshot()
+
+def test_pool_evicts_least_recently_used(tenants, monkeypatch):
+    for t in ("a@x.com", "b@x.com", "c@x.com"):
+        database._connection(t)
+    database._pool.clear()
+    monkeypatch.setattr(database, "_TENANT_POOL", 2)
+    _, a = database._connection("a@x.com")
+    database._worksheet(a, "workouts")
+    database._connection("b@x.com")
+    database._connection("a@x.com")
+    database._connection("c@x.com")
+    assert list(database._pool) == ["a@x.com", "c@x.com"]
+    database._connection("b@x.com")
+    assert list(database._pool) == ["c@x.com", "b@x.com"]
+    # What was kept for an evicted spreadsheet goes with it
+    assert a.id not in database._ws_handles
+    # Opened again, not created again
+    assert database._connection("a@x.com")[1] is a
+
+def test_creating_one_tenant_does_not_hold_up_another(tenants, monkeypatch):
+    database._connection("b@x.com")
+    database._pool.clear()
+    started, release = threading.Event(), threading.Event()
+    migrate = migrations.migrate
+    def slow(sh):
+        if sh.title.endswith("a@x.com"):
+            started.set()
+            release.wait(5)
+        migrate(sh)
+    monkeypatch.setattr(migrations, "migrate", slow)
+    t = threading.Thread(target=database._connection, args=("a@x.com",))
+    t.start()
+    started.wait()
+    try:
+        assert database._connection("b@x.com")[1].title == "WLog_DB - b@x.com"
+        assert "a@x.com" not in database._tenant_keys
+    finally:
+        release.set()
+        t.join()
+    assert "a@x.com" in _listed(tenants)
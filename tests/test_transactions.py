@@ -0,0 +1,196 @@
+import pytest
+import streamlit as st
+
+import database_gsheets as database
+import migrations
+import synthetic
+
+def _norm(df):
+    # Sheets shows 500.0 as "500", the cache may still hold "500.0"
+    def number(x):
+        try:
+            return repr(float(x))
+        except ValueError:
+            return x
+    return df.reset_index(drop=True).map(number)
+
+def _matches_fresh_read(tables):
+    cached = {t: database._get_df(t) for t in tables}
+    st.session_state.clear()
+    for t in tables:
+        assert _norm(cached[t]).equals(_norm(database._get_df(t))), t
+
+@pytest.fixture
+def data(sh):
+    synthetic.load(sh, synthetic.generate(log_entries=400, workouts=30, exercises=30, sessions=6))
+    return sh
+
+def _calls(client):
+    # Sheet ids are looked up once per spreadsheet, not per transaction
+    return {k: v for k, v in client.counter.snapshot().items() if k != "worksheets"}
+
+ALL = ["workouts", "log_entries", "sessions", "session_items", "exercises", "tombstones"]
+
+def test_workout_and_sets_in_one_call(data, client):
+    database.prefetch(["workouts", "log_entries", "exercises"])
+    client.counter.reset()
+    with database.transaction():
+        w = database.create_workout(500.0, "Tx", 30)
+        for i in range(5):
+            database.log_set(w, i + 1, 40.0, 10, i)
+        # Reads inside the block see the pending rows
+        assert len(database.query("log_entries").where("workout_id", w).frame()) == 5
+    assert _calls(client) == {"batch_update": 1}
+    assert str(database.get_history()[0].id) == str(w)
+    _matches_fresh_read(["workouts", "log_entries"])
+
+def test_exception_rolls_back_without_calls(data, client):
+    tables = ["workouts", "log_entries", "sessions", "session_items"]
+    database.prefetch(tables + ["exercises"])
+    before = {t: database._get_df(t) for t in tables}
+    client.counter.reset()
+    with pytest.raises(RuntimeError):
+        with database.transaction():
+            w = database.create_workout(1.0, "Nope", 1)
+            database.log_set(w, 1, 1.0, 1, 0)
+            database.create_session("Nope routine", [1, 2])
+            assert database.get_session_by_name("Nope routine") is not None
+            raise RuntimeError("boom")
+    assert _calls(client) == {}
+    for t, df in before.items():
+        assert database._get_df(t) is df, t
+    assert database.get_session_by_name("Nope routine") is None
+    _matches_fresh_read(tables)
+
+def test_mixed_appends_updates_and_deletes(data, client):
+    database.prefetch(ALL)
+    client.counter.reset()
+    with database.transaction():
+        database.create_session("Mixed", [3, 4, 5])
+        sid = database.get_session_by_name("Mixed")
+        database.update_session_by_id(sid, "Mixed 2", [5, 3, 7, 8])
+        database.update_session_by_id(1, "Routine 1b", [9, 3])
+        database.delete_exercise(3)
+        database.delete_workout(10)
+        database.add_custom_exercise("Tx Ex", "Chest")
+    # Positions read once, everything written once
+    assert _calls(client) == {"values_batch_get": 1, "batch_update": 1}
+    assert [int(d.id) for d in database.get_session_details(sid)] == [5, 7, 8]
+    assert [int(d.id) for d in database.get_session_details(1)] == [9]
+    _matches_fresh_read(ALL)
+    assert [int(d.id) for d in database.get_session_details(sid)] == [5, 7, 8]
+    assert database.get_session_by_name("Routine 1b") == 1
+    assert not (database._get_df("log_entries")["exercise_id"] == "3").any()
+
+def test_replace_then_row_edits(data, client):
+    database.prefetch(["sessions", "session_items", "exercises"])
+    items = database._get_df("session_items")
+    client.counter.reset()
+    with database.transaction():
+        database._replace_sheet_data("session_items", items.iloc[:5])
+        database.create_session("After", [1, 2])
+        sid = database.get_session_by_name("After")
+        database.update_session_by_id(sid, "After", [2, 3])
+    assert _calls(client) == {"batch_update": 1}
+    _matches_fresh_read(["sessions", "session_items"])
+    assert [int(d.id) for d in database.get_session_details(sid)] == [2, 3]
+    assert len(database._get_df("session_items")) == 7
+
+def test_failed_commit_rolls_back(data, monkeypatch):
+    database.prefetch(["sessions", "session_items"])
+    before = database._get_df("session_items")
+    def fail(body):
+        raise OSError("network")
+    monkeypatch.setattr(data, "batch_update", fail)
+    with pytest.raises(OSError):
+        with database.transaction():
+            database.create_session("Fails", [1])
+    assert database._get_df("session_items") is before
+    assert database.get_session_by_name("Fails") is None
+
+def test_row_deleted_elsewhere_is_an_error(data):
+    sh = data
+    database.create_session("Mine", [3, 4, 5])
+    sid = database.get_session_by_name("Mine")
+    database.prefetch(["sessions", "session_items"])
+    # Another session deletes one of its items after we cached them
+    values = sh.worksheet("session_items").get_all_values()[1:]
+    victim = next(i for i, r in enumerate(values) if r[1] == str(sid))
+    sheet_id = database._worksheet_ids(sh)["session_items"]
+    sh.batch_update({"requests": database._delete_rows_requests(sheet_id, [victim])})
+    before = sh.worksheet("session_items").get_all_values()
+    with pytest.raises(ValueError, match="is gone"):
+        database.update_session_by_id(sid, "Mine", [5, 4, 3])
+    assert sh.worksheet("session_items").get_all_values() == before
+    # The stale copy is dropped, so trying again works
+    current = [int(d.id) for d in database.get_session_details(sid)]
+    assert current == [4, 5]
+    database.update_session_by_id(sid, "Mine", current[::-1])
+    assert [int(d.id) for d in database.get_session_details(sid)] == [5, 4]
+    _matches_fresh_read(["sessions", "session_items"])
+
+def test_nested_blocks_join_the_outer_one(data, client):
+    database.prefetch(["workouts", "log_entries", "exercises"])
+    client.counter.reset()
+    with database.transaction():
+        w = database.create_workout(10.0, "Outer", 5)
+        with database.transaction():
+            database.log_set(w, 1, 10.0, 1, 0)
+        assert _calls(client) == {}
+    assert _calls(client) == {"batch_update": 1}
+
+def test_default_schedule_in_one_call(data, client):
+    sh = data
+    for name in ("sessions", "session_items"):
+        ws = sh.worksheet(name)
+        ws.clear()
+        ws.append_rows([migrations.SCHEMA[name]])
+    st.session_state.clear()
+    database.get_all_sessions()
+    client.counter.reset()
+    database.create_default_schedule()
+    writes = {k: v for k, v in _calls(client).items() if k not in ("get", "batch_get", "worksheet")}
+    assert writes == {"batch_update": 1}
+    assert database.get_all_sessions()
+    _matches_fresh_read(["sessions", "session_items", "exercises"])
+
+def _held(sh, seconds):
+    # Another commit or the compactor working on sh's rows
+    import threading
+    import time
+    held = threading.Event()
+    def hold():
+        with database._rows_lock(sh):
+            held.set()
+            time.sleep(seconds)
+    t = threading.Thread(target=hold)
+    t.start()
+    held.wait()
+    return t
+
+def test_appends_skip_the_row_lock(data):
+    import time
+    database.prefetch(["workouts", "log_entries"])
+    t = _held(data, 0.5)
+    start = time.time()
+    with database.transaction():
+        w = database.create_workout(500.0, "Tx", 30)
+        database.log_set(w, 1, 40.0, 10, 0)
+    assert time.time() - start < 0.4
+    t.join()
+
+def test_row_edits_wait_for_the_lock_of_their_spreadsheet(data, client):
+    import time
+    database.prefetch(["sessions", "session_items"])
+    sid = database.get_all_sessions()[0].id
+    other = client.create("Other")
+    t = _held(other, 0.5)
+    start = time.time()
+    database.update_session_by_id(sid, "Renamed", [1, 2])
+    assert time.time() - start < 0.4
+    t.join()
+    t = _held(data, 0.3)
+    start = time.time()
+    database.update_session_by_id(sid, "Renamed again", [1, 2])
+    assert time.time() - start >= 0.25
+    t.join()